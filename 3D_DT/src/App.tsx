@@ -1,11 +1,13 @@
 import { Canvas } from "@react-three/fiber";
 import { OrbitControls, Html } from "@react-three/drei";
-import { useEffect, useState, Suspense } from "react";
+import { useEffect, useMemo, useState, Suspense } from "react";
 import axios from "axios";
 import { create } from "zustand";
 import "./App.css";
 import { DetailsModal } from "./DetailsModal";
 import { WaterMeterModel } from "./WaterMeterModel";
+import { useLiveFeed, toRecords } from "./liveFeed";
+import { decode, toRecords as binaryRecords } from "./columnar";
 
 // === Zustand Store for global state ===
 interface StoreState {
@@ -19,18 +21,39 @@ const useStore = create<StoreState>((set) => ({
 
 // === Main App Component ===
 export default function App() {
-  const [data, setData] = useState<any[]>([]);
+  const [fallback, setFallback] = useState<any[]>([]);
   const { selectedMeter, setSelectedMeter } = useStore();
 
+  // Live deltas from dashboard/live_server.py (proxied by vite.config.ts)
+  const live = useLiveFeed("/events");
+  const connected = live.lastId !== null;
+
   useEffect(() => {
-    axios
-      .get("/combined_water_data.json")
-      .then((res) => {
-        console.log("✅ JSON loaded", res.data);
-        setData(res.data);
-      })
-      .catch(console.error);
-  }, []);
+    // Without the push server, load the static export once instead (the
+    // columnar binary from export_data.py, else the JSON)
+    if (connected) return;
+    const timer = setTimeout(() => {
+      axios
+        .get("/combined_water_data.bin", { responseType: "arraybuffer" })
+        .then((res) => {
+          const rows = binaryRecords(decode(res.data));
+          console.log("✅ Binary export loaded", rows.length);
+          setFallback(rows);
+        })
+        .catch(() =>
+          axios
+            .get("/combined_water_data.json")
+            .then((res) => {
+              console.log("✅ JSON loaded", res.data);
+              setFallback(res.data);
+            })
+        )
+        .catch(console.error);
+    }, 5000);
+    return () => clearTimeout(timer);
+  }, [connected]);
+
+  const data = useMemo(() => (connected ? toRecords(live) : fallback), [connected, live, fallback]);
 
   const uniqueMeters = [...new Set(data.map((d) => d.meter_id))];
 
@@ -0,0 +1,108 @@
+// Decoder for the WMSB blob written by scripts/columnar.py (layout in its
+// docstring): a small JSON header, then one 8-byte aligned block per column,
+// viewed in place as typed arrays. Assumes a little-endian host, like every
+// browser the twin runs in.
+
+export interface Column {
+  name: string;
+  kind: "time" | "dict" | "f32";
+  dtype: string;
+  offset: number;
+  bytes: number;
+  values?: string[];
+}
+
+interface Header {
+  version: number;
+  rows: number;
+  t0?: number;
+  columns: Column[];
+}
+
+export interface Table {
+  rows: number;
+  time: Float64Array; // epoch milliseconds of the naive timestamps
+  codes: Record<string, Uint8Array | Uint16Array | Uint32Array>;
+  dictionaries: Record<string, string[]>;
+  floats: Record<string, Float32Array>;
+}
+
+const MAGIC = "WMSB";
+const VERSION = 1;
+const ALIGN = 8;
+
+// Zigzag LEB128 deltas of epoch minutes → absolute epoch milliseconds
+function decodeTimes(bytes: Uint8Array, count: number, t0: number): Float64Array {
+  const out = new Float64Array(count);
+  let pos = 0;
+  let minutes = t0;
+  for (let i = 0; i < count; i++) {
+    let z = 0;
+    let scale = 1;
+    let b = 0;
+    do {
+      b = bytes[pos++];
+      z += (b & 0x7f) * scale; // arithmetic, not bit shifts: deltas can exceed 32 bits
+      scale *= 128;
+    } while (b & 0x80);
+    minutes += z % 2 ? -(z + 1) / 2 : z / 2;
+    out[i] = minutes * 60000;
+  }
+  return out;
+}
+
+function codesView(buf: ArrayBuffer, col: Column, rows: number): Uint8Array | Uint16Array | Uint32Array {
+  const at = col.offset;
+  switch (col.dtype) {
+    case "uint8":
+      return new Uint8Array(buf, at, rows);
+    case "uint16":
+      return new Uint16Array(buf, at, rows);
+    case "uint32":
+      return new Uint32Array(buf, at, rows);
+    default:
+      throw new Error(`Unsupported dictionary dtype ${col.dtype}`);
+  }
+}
+
+export function decode(buf: ArrayBuffer): Table {
+  const magic = String.fromCharCode(...new Uint8Array(buf, 0, 4));
+  if (magic !== MAGIC) throw new Error("Not a WMSB blob");
+  const length = new DataView(buf).getUint32(4, true);
+  const header: Header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, length)));
+  if (header.version !== VERSION) throw new Error(`Unsupported WMSB version ${header.version}`);
+  const start = Math.ceil((8 + length) / ALIGN) * ALIGN;
+
+  const table: Table = { rows: header.rows, time: new Float64Array(0), codes: {}, dictionaries: {}, floats: {} };
+  for (const col of header.columns) {
+    const at = start + col.offset;
+    if (col.kind === "time") {
+      table.time = decodeTimes(new Uint8Array(buf, at, col.bytes), header.rows, header.t0 ?? 0);
+    } else if (col.kind === "dict") {
+      table.codes[col.name] = codesView(buf, { ...col, offset: at }, header.rows);
+      table.dictionaries[col.name] = col.values ?? [];
+    } else {
+      table.floats[col.name] = new Float32Array(buf, at, header.rows);
+    }
+  }
+  return table;
+}
+
+/** Rows in the shape the 3D scene and DetailsModal read (same as liveFeed.toRecords). */
+export function toRecords(table: Table): any[] {
+  const buildings = table.dictionaries.building ?? [];
+  const codes = table.codes.building;
+  const consumption = table.floats.consumption;
+  const totalizer = table.floats.totalizer;
+  const out = new Array(table.rows);
+  for (let i = 0; i < table.rows; i++) {
+    out[i] = {
+      meter_id: buildings[codes[i]],
+      timestamp: new Date(table.time[i]).toISOString().slice(0, 19),
+      consumption_liters: consumption[i],
+      totalizer_liters: totalizer[i],
+      is_leak: false,
+    };
+  }
+  return out;
+}
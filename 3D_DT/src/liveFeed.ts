@@ -0,0 +1,122 @@
+import { useEffect, useState } from "react";
+
+// Client for dashboard/live_server.py: a snapshot on first connect, then
+// per-meter deltas over Server-Sent Events. EventSource reconnects by itself
+// and sends the last event id, so the server replays only what was missed.
+
+export interface Reading {
+  meter: string;
+  t: string;
+  consumption: number;
+  totalizer: number;
+}
+
+export interface Alert {
+  meter: string;
+  kind: string; // offline / stale / flatlined / night_flow / spike
+  state: "open" | "closed";
+  since: string | null;
+  peak_lph?: number;
+}
+
+export interface LiveState {
+  connected: boolean;
+  lastId: string | null;
+  readings: Record<string, Reading[]>; // meter → recent readings, oldest first
+  alerts: Record<string, Alert>; // "meter/kind" → open alert
+  valves: Record<string, string>; // meter → open / closed
+}
+
+interface Snapshot {
+  id: string;
+  readings: Record<string, Reading[]>;
+  alerts: Alert[];
+  valves: Record<string, string>;
+}
+
+export const EMPTY_STATE: LiveState = { connected: false, lastId: null, readings: {}, alerts: {}, valves: {} };
+
+const HISTORY_PER_METER = 48; // same bound as the server's snapshot
+
+function applySnapshot(snap: Snapshot): LiveState {
+  const alerts: Record<string, Alert> = {};
+  for (const a of snap.alerts) alerts[`${a.meter}/${a.kind}`] = a;
+  return { connected: true, lastId: snap.id, readings: snap.readings, alerts, valves: snap.valves };
+}
+
+function applyReadings(state: LiveState, deltas: Reading[], id: string): LiveState {
+  const readings = { ...state.readings };
+  for (const r of deltas) {
+    const history = [...(readings[r.meter] ?? []), r];
+    readings[r.meter] = history.length > HISTORY_PER_METER ? history.slice(-HISTORY_PER_METER) : history;
+  }
+  return { ...state, lastId: id, readings };
+}
+
+function applyAlert(state: LiveState, alert: Alert, id: string): LiveState {
+  const alerts = { ...state.alerts };
+  const key = `${alert.meter}/${alert.kind}`;
+  if (alert.state === "open") alerts[key] = alert;
+  else delete alerts[key];
+  return { ...state, lastId: id, alerts };
+}
+
+/**
+ * Subscribe to the live feed. onChange gets the whole state, at most once per
+ * animation frame, so a burst of events costs one re-render. Returns a function
+ * that closes the connection.
+ */
+export function connectLiveFeed(url: string, onChange: (state: LiveState) => void): () => void {
+  let state = EMPTY_STATE;
+  let frame = 0;
+  const flush = () => {
+    frame = 0;
+    onChange(state);
+  };
+  const update = (next: LiveState) => {
+    state = next;
+    if (!frame) frame = requestAnimationFrame(flush);
+  };
+
+  const source = new EventSource(url);
+  source.addEventListener("snapshot", (e: MessageEvent) => update(applySnapshot(JSON.parse(e.data))));
+  source.addEventListener("readings", (e: MessageEvent) => update(applyReadings(state, JSON.parse(e.data), e.lastEventId)));
+  source.addEventListener("alert", (e: MessageEvent) => update(applyAlert(state, JSON.parse(e.data), e.lastEventId)));
+  source.addEventListener("valve", (e: MessageEvent) => {
+    const { meter, position } = JSON.parse(e.data);
+    update({ ...state, lastId: e.lastEventId, valves: { ...state.valves, [meter]: position } });
+  });
+  source.onopen = () => update({ ...state, connected: true });
+  source.onerror = () => update({ ...state, connected: false }); // EventSource retries on its own
+
+  return () => {
+    source.close();
+    if (frame) cancelAnimationFrame(frame);
+  };
+}
+
+/** React hook around connectLiveFeed. */
+export function useLiveFeed(url = "/events"): LiveState {
+  const [state, setState] = useState<LiveState>(EMPTY_STATE);
+  useEffect(() => connectLiveFeed(url, setState), [url]);
+  return state;
+}
+
+/** Flatten the live state into the row shape the 3D scene and DetailsModal read. */
+export function toRecords(state: LiveState): any[] {
+  const leaking = new Set(
+    Object.values(state.alerts)
+      .filter((a) => a.kind === "night_flow" || a.kind === "spike")
+      .map((a) => a.meter)
+  );
+  return Object.entries(state.readings).flatMap(([meter, history]) =>
+    history.map((r) => ({
+      meter_id: meter,
+      timestamp: r.t,
+      consumption_liters: r.consumption,
+      totalizer_liters: r.totalizer,
+      is_leak: leaking.has(meter),
+      valve: state.valves[meter] ?? "open",
+    }))
+  );
+}
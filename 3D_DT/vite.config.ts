@@ -4,4 +4,11 @@ import react from '@vitejs/plugin-react'
 // https://vite.dev/config/
 export default defineConfig({
   plugins: [react()],
+  // live feed for the twin: python dashboard/live_server.py
+  server: {
+    proxy: {
+      '/events': 'http://127.0.0.1:8800',
+      '/snapshot': 'http://127.0.0.1:8800',
+    },
+  },
 })
@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-import os
+import os, sys
 from datetime import datetime, timedelta
-from PIL import Image, ImageDraw, ImageFont
-import plotly.graph_objects as go
-import numpy as np
+# Pillow and plotly are imported inside the tab renderers that use them, so a
+# cold start only pays for what the Overview tab draws.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from meter_registry import load_registry
+from water_data import version
 
 # --- Streamlit Page Configuration ---
 st.set_page_config(
@@ -33,36 +36,27 @@ st.markdown("""
         line-height: 1.6;
     }
 
-    /* Tabs Styling */
-    .stTabs [data-baseweb="tab-list"] {
+    /* Tab Bar Styling (horizontal radio used as tabs) */
+    div[role="radiogroup"] {
         gap: 15px; /* Spacing between tabs */
     }
-    .stTabs [data-baseweb="tab"] {
+    div[role="radiogroup"] > label {
         height: 50px;
+        padding: 0 16px;
         white-space: nowrap;
         background-color: #e0e0e0; /* Light gray tab background */
         border-radius: 4px 4px 0 0;
-        border-bottom: 3px solid transparent; /* default */
         font-size: 16px;
         font-weight: bold;
         color: #606060; /* Darker text for inactive tabs */
-        margin-bottom: -3px; /* Pulls tabs slightly over the border */
-    }
-    .stTabs [data-baseweb="tab"] svg {
-        display: none; /* Hide default Streamlit tab icons */
     }
-    .stTabs [data-baseweb="tab"]:hover {
+    div[role="radiogroup"] > label:hover {
         background-color: #d0d0d0; /* Darker on hover */
         color: #333333;
     }
-    .stTabs [aria-selected="true"] {
+    div[role="radiogroup"] > label:has(input:checked) {
         background-color: #007bff; /* Primary blue for active tab */
         color: white; /* White text for active tab */
-        border-bottom: 3px solid #007bff; /* Active border */
-    }
-    .stTabs [aria-selected="true"]:hover {
-        background-color: #0056b3; /* Darker blue on hover for active tab */
-        color: white;
     }
 
     /* Metric Cards Styling */
@@ -125,6 +119,8 @@ FORECAST_PATH = os.path.join(DATA_FOLDER, "demand_forecast.csv")
 NIGHT_LEAKS_PATH = os.path.join(DATA_FOLDER, "night_leak_alerts.csv")
 SPIKE_ALERTS_PATH = os.path.join(DATA_FOLDER, "spike_alerts.csv")
 DEPLOYMENT_IMAGE_PATH = os.path.join(DATA_FOLDER, "deployment_diagram.png")
+# Daily totals of the readings retention.py moved out of the combined file (its raw window)
+DAILY_ROLLUP_PATH = os.path.join(DATA_FOLDER, "rollups", "daily.csv")
 
 # --- Consistent with leak_detection.py ---
 # This threshold defines what is considered "active flow" for visual purposes on the map.
@@ -135,11 +131,14 @@ SIGNIFICANT_CONSUMPTION_THRESHOLD = 0.05 # L/hr - Adjust based on your data and
 
 # --- UTILITY FUNCTIONS ---
 
-@st.cache_data(ttl=300) # Cache data for 5 minutes
-def load_and_process_water_data_cached():
+# The pipeline replaces its files atomically (water_data.atomic_write), so each
+# file version is complete; the loaders are cached per version and pick up a
+# new one on the next rerun instead of after a fixed TTL.
+@st.cache_data(max_entries=4)
+def load_and_process_water_data_cached(file_version):
     """
     Loads combined water data, cleans it, calculates hourly consumption,
-    and returns processed DataFrame.
+    and returns processed DataFrame. `file_version` (water_data.version) is the cache key.
     """
     try:
         df = pd.read_csv(COMBINED_DATA_PATH, parse_dates=["Date/Time"])
@@ -147,28 +146,56 @@ def load_and_process_water_data_cached():
         df.dropna(subset=['Date/Time'], inplace=True)
         df = df.sort_values(by=['Building', 'Date/Time']).reset_index(drop=True)
 
-        df['Consumption (Liters)'] = df['Consumption (Liters)'].apply(lambda x: max(0, x))
+        df['Consumption (Liters)'] = df['Consumption (Liters)'].clip(lower=0)
 
-        df['Hourly Consumption (Liters)'] = df.groupby('Building')['Consumption (Liters)'].diff().fillna(0)
-        df['Hourly Consumption (Liters)'] = df['Hourly Consumption (Liters)'].apply(lambda x: max(0, x))
+        df['Hourly Consumption (Liters)'] = df.groupby('Building')['Consumption (Liters)'].diff().fillna(0).clip(lower=0)
 
         return df
 
     except FileNotFoundError:
         return pd.DataFrame()
-    except Exception as e:
-        return pd.DataFrame()
 
-@st.cache_data(ttl=300)
-def load_csv_data_cached(path, parse_dates=None):
-    """Loads a CSV file with caching. No Streamlit elements inside."""
+@st.cache_data(max_entries=32)
+def load_csv_data_cached(path, file_version, parse_dates=None):
+    """Loads a CSV file (or its SQLite mirror, see readings_db.py), cached per file version. No Streamlit elements inside."""
     try:
+        import readings_db
+        table = readings_db.table_for(path)
+        if table is not None:
+            return readings_db.load_table(table, parse_dates=parse_dates)
         df = pd.read_csv(path, parse_dates=parse_dates)
         return df
     except FileNotFoundError:
         return pd.DataFrame()
-    except Exception as e:
-        return pd.DataFrame()
+
+@st.cache_data(max_entries=4)
+def load_archived_daily_cached(file_version):
+    """Campus-wide daily totals of the archived readings (empty before the first compaction)."""
+    try:
+        daily = pd.read_csv(DAILY_ROLLUP_PATH, parse_dates=["Date/Time"])
+    except FileNotFoundError:
+        return pd.DataFrame(columns=["Date", "Total Daily Consumption (Liters)"])
+    return (daily.groupby("Date/Time")["Consumption (Liters)"].sum().reset_index()
+            .rename(columns={"Date/Time": "Date", "Consumption (Liters)": "Total Daily Consumption (Liters)"}))
+
+@st.cache_resource
+def get_valve_service(valves):
+    """One valve command engine per server process, shared by every session (see valve_control.py)."""
+    from valve_control import ValveService
+    return ValveService(valves, state_path=os.path.join(DATA_FOLDER, "valve_state.json"),
+                        log_path=os.path.join(DATA_FOLDER, "valve_commands.jsonl"))
+
+@st.cache_resource
+def get_sensor_health():
+    """Per-meter reporting state, kept across reruns; each rerun only feeds new readings (see sensor_health.py)."""
+    from sensor_health import SensorHealth, load_params
+    return SensorHealth(params=load_params())
+
+@st.cache_resource
+def get_rolling_kpis():
+    """Rolling 24h / 7d / 30d totals and open alerts, kept across reruns; only new readings are added (see rolling_kpis.py)."""
+    from rolling_kpis import RollingKPIs, load_params
+    return RollingKPIs(params=load_params())
 
 # --- AUTHENTICATION ---
 def authenticate():
@@ -187,11 +214,10 @@ if not authenticate():
 
 st.title("Campus Water Digital Twin Dashboard 🏙️💧")
 
-# --- Load all data at once ---
-df_combined = load_and_process_water_data_cached()
-night_df = load_csv_data_cached(NIGHT_LEAKS_PATH, parse_dates=["Date/Time"])
-spike_df = load_csv_data_cached(SPIKE_ALERTS_PATH, parse_dates=["Date/Time"])
-forecast_df = load_csv_data_cached(FORECAST_PATH)
+# --- Load the data every tab needs (the forecast is loaded by the tabs that show it) ---
+df_combined = load_and_process_water_data_cached(version(COMBINED_DATA_PATH))
+night_df = load_csv_data_cached(NIGHT_LEAKS_PATH, version(NIGHT_LEAKS_PATH), parse_dates=["Date/Time"])
+spike_df = load_csv_data_cached(SPIKE_ALERTS_PATH, version(SPIKE_ALERTS_PATH), parse_dates=["Date/Time"])
 
 
 # --- Initial Data Load & Error Checks ---
@@ -218,45 +244,44 @@ if night_df.empty:
     st.sidebar.warning("Night leak alerts file is empty or not found. Please run `leak_detection.py`.")
 if spike_df.empty:
     st.sidebar.warning("Spike alerts file is empty or not found. Please run `leak_detection.py`.")
-if forecast_df.empty:
-    st.sidebar.warning("Demand forecast file is empty or not found. Please run `forecast_demand.py`.")
 
 
 # --- Dashboard Tabs ---
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["Overview", "Sensor Details", "Campus Forecast", "All Alerts", "Valve Control"])
+# st.tabs executes the code of every tab on each rerun; a horizontal radio lets
+# us run (and import for) only the tab that is actually on screen.
+TAB_NAMES = ["Overview", "Sensor Details", "Campus Forecast", "All Alerts", "Valve Control"]
+active_tab = st.radio("Section", TAB_NAMES, horizontal=True, key="active_tab", label_visibility="collapsed")
 
 # --- TAB: Overview ---
-with tab1:
+def render_overview():
+    from PIL import Image, ImageDraw, ImageFont
+
     st.header("Campus Water Usage Overview")
 
     # --- KPIs ---
-    col_kpi1, col_kpi2, col_kpi3, col_kpi4 = st.columns(4)
-
-    total_liters_24h = df_combined[df_combined["Date/Time"] >= (datetime.now() - timedelta(hours=24))]["Hourly Consumption (Liters)"].sum()
-    total_liters_7d = df_combined[df_combined["Date/Time"] >= (datetime.now() - timedelta(days=7))]["Hourly Consumption (Liters)"].sum()
-    num_night_leaks = len(night_df)
-    num_spike_alerts = len(spike_df)
-
-    col_kpi1.metric("Last 24h Consumption", f"{total_liters_24h:,.1f} L", help="Total water consumed across campus in the last 24 hours.")
-    col_kpi2.metric("Last 7 Days Consumption", f"{total_liters_7d:,.1f} L", help="Total water consumed across campus in the last 7 days.")
-    col_kpi3.metric("Total Night Leaks", f"{num_night_leaks}", help="Total number of night leak alerts detected.")
-    col_kpi4.metric("Total Spike Alerts", f"{num_spike_alerts}", help="Total number of spike alerts detected.")
+    # Maintained incrementally: a rerun only adds readings/alerts from files that changed
+    kpis = get_rolling_kpis()
+    kpis.sync(df_combined, version(COMBINED_DATA_PATH))
+    kpis.sync(night_df, version(NIGHT_LEAKS_PATH), kind="night")
+    kpis.sync(spike_df, version(SPIKE_ALERTS_PATH), kind="spike")
+    open_hours = kpis.params["open_alert_hours"]
+
+    col_kpi1, col_kpi2, col_kpi3, col_kpi4, col_kpi5 = st.columns(5)
+    col_kpi1.metric("Last 24h Consumption", f"{kpis.total('24h'):,.1f} L", help="Total water consumed across campus in the 24 hours up to the latest reading.")
+    col_kpi2.metric("Last 7 Days Consumption", f"{kpis.total('7d'):,.1f} L", help="Total water consumed across campus in the 7 days up to the latest reading.")
+    col_kpi3.metric("Last 30 Days Consumption", f"{kpis.total('30d'):,.1f} L", help="Total water consumed across campus in the 30 days up to the latest reading.")
+    col_kpi4.metric("Open Night Leaks", f"{kpis.open_alerts('night')}", help=f"Night leak alerts in the last {open_hours} h ({kpis.alert_total('night')} in total).")
+    col_kpi5.metric("Open Spike Alerts", f"{kpis.open_alerts('spike')}", help=f"Spike alerts in the last {open_hours} h ({kpis.alert_total('spike')} in total).")
+    with st.expander("📊 Rolling consumption per sensor"):
+        st.dataframe(pd.DataFrame(kpis.snapshot()), use_container_width=True, hide_index=True)
 
     st.markdown("---")
 
     # --- Floorplan Overlay ---
     st.subheader("🗺️ Live Building Status")
 
-    SENSOR_COORDS = {
-        "A1MD": (349, 421), "A1MF": (397, 421), "A1FD": (446, 421), "A1FF": (495, 421),
-        "A2MFD": (802, 190), "A2MFF": (903, 190),
-        "AGMD": (309, 831), "AGMF": (361, 831), "AGFD": (414, 831), "AGFF": (463, 831),
-        "B1MD": (675, 421), "B1MF": (726, 421), "B1FD": (779, 421), "B1FF": (827, 421),
-        "B2MFD": (1083, 190), "B2MFF": (1184, 190),
-        "BGMD": (638, 831), "BGMF": (692, 831), "BGFD": (743, 831), "BGFF": (792, 831),
-        "BTTD": (1271, 0), "BTTF": (1372, 0),
-        "ATTD": (987, 0), "ATTF": (1090, 0)
-    }
+    # Meters and their floor-plan positions, from the meter registry (scripts/meter_registry.py)
+    SENSOR_COORDS = load_registry().coords()
 
     try:
         img = Image.open(DEPLOYMENT_IMAGE_PATH).convert("RGBA")
@@ -278,6 +303,12 @@ with tab1:
     if not df_combined.empty:
         latest_hourly_consumption = df_combined.groupby('Building')['Hourly Consumption (Liters)'].last().to_dict()
 
+    # Stale / offline / flatlined meters are shown as such instead of their last value
+    from sensor_health import STATUS_COLORS, label
+    health_monitor = get_sensor_health()
+    health_monitor.feed(df_combined)
+    health = {row["meter"]: row for row in health_monitor.snapshot()}
+
     alert_buildings = set()
     if not night_df.empty:
         alert_buildings.update(night_df["Building"].unique())
@@ -286,9 +317,12 @@ with tab1:
 
     for alias, (x, y) in SENSOR_COORDS.items():
         current_hourly_val = latest_hourly_consumption.get(alias, 0)
+        sensor = health.get(alias, {"status": "offline", "silent_minutes": None})
 
-        # Coloring logic: Red for ML-detected leak, Orange for significant flow, Blue for normal/low flow
-        if alias in alert_buildings:
+        # Coloring logic: Grey/Purple for unhealthy sensors, Red for ML-detected leak, Orange for significant flow, Blue for normal/low flow
+        if sensor["status"] != "ok":
+            color = STATUS_COLORS[sensor["status"]]  # Grey: stale/offline, Purple: flatlined ⚫
+        elif alias in alert_buildings:
             color = (255, 0, 0, 230)  # Red: Leak / Active Alert (detected by ML in leak_detection.py) 🔴
         elif current_hourly_val > SIGNIFICANT_CONSUMPTION_THRESHOLD:
             color = (255, 140, 0, 230) # Dark Orange: High Hourly Consumption (active flow, but not an ML-detected leak) 🟠
@@ -302,15 +336,32 @@ with tab1:
         
         # Display only the hourly reading, not the building name
         draw.rectangle([x - 5, y - 5, x - 5 + rect_width, y - 5 + rect_height], fill=color)
-        draw.text((x, y + text_offset_y), f"{current_hourly_val:.1f}L/hr", fill="white", font=font)
+        draw.text((x, y + text_offset_y), label(sensor, f"{current_hourly_val:.1f}L/hr"), fill="white", font=font)
 
     st.image(img, caption=f"Live Hourly Meter Readings | As of: {last_updated_data}", use_container_width=True)
 
+    # --- Sensor Health ---
+    unhealthy = [row for alias, row in sorted(health.items()) if row["status"] != "ok"]
+    missing = sorted(set(SENSOR_COORDS) - set(health))
+    if unhealthy or missing:
+        st.warning(f"🩺 {len(unhealthy) + len(missing)} of {len(SENSOR_COORDS)} sensors need attention: "
+                   + ", ".join([f"{row['meter']} ({row['status']})" for row in unhealthy]
+                               + [f"{alias} (no data)" for alias in missing]))
+    with st.expander("🩺 Sensor Health"):
+        health_df = pd.DataFrame(health_monitor.snapshot()).sort_values("meter")
+        st.dataframe(health_df.rename(columns={
+            "meter": "Sensor", "status": "Status", "last_seen": "Last Seen", "silent_minutes": "Silent (min)",
+            "flat_hours": "Unchanged (h)", "cadence_minutes": "Cadence (min)", "readings": "Readings",
+            "gaps": "Gaps", "gap_hours": "Gap Time (h)", "longest_gap_hours": "Longest Gap (h)"}),
+            use_container_width=True, hide_index=True)
+
     st.markdown("---")
 
     # --- Overall Campus Consumption Trend ---
     st.subheader("📈 Campus-Wide Daily Consumption Trend")
     if not df_combined.empty:
+        import plotly.graph_objects as go
+
         df_daily_total = df_combined.set_index("Date/Time").resample("D")["Hourly Consumption (Liters)"].sum().reset_index()
         df_daily_total.rename(columns={"Date/Time": "Date", "Hourly Consumption (Liters)": "Total Daily Consumption (Liters)"}, inplace=True)
 
@@ -323,6 +374,17 @@ with tab1:
             line=dict(color='steelblue', width=2),
             marker=dict(size=6, color='steelblue')
         ))
+        # the combined file only holds the raw window; older days come from the archive's daily rollups
+        archived_daily = load_archived_daily_cached(version(DAILY_ROLLUP_PATH))
+        archived_daily = archived_daily[archived_daily["Date"] < df_daily_total["Date"].min()]
+        if not archived_daily.empty:
+            fig_overall_trend.add_trace(go.Scatter(
+                x=archived_daily["Date"],
+                y=archived_daily["Total Daily Consumption (Liters)"],
+                mode='lines',
+                name='Archived (daily rollups)',
+                line=dict(color='gray', width=2)
+            ))
         fig_overall_trend.update_layout(
             title="Total Daily Water Consumption Across Campus",
             xaxis_title="Date",
@@ -332,13 +394,19 @@ with tab1:
             template="plotly_white"
         )
         st.plotly_chart(fig_overall_trend, use_container_width=True)
+        if not archived_daily.empty:
+            st.caption(f"Readings from {df_daily_total['Date'].min():%Y-%m-%d} on come from the combined file; "
+                       "earlier days are daily totals of the archived readings (scripts/retention.py).")
     else:
         st.info("No data available to show campus-wide consumption trend.")
 
 
 # --- TAB: Sensor Details ---
-with tab2:
+def render_sensor_details():
+    import plotly.graph_objects as go
+
     st.header("Individual Sensor Insights")
+    forecast_df = load_csv_data_cached(FORECAST_PATH, version(FORECAST_PATH))
     sensor_ids = sorted(df_combined["Building"].unique())
     selected_sensor = st.selectbox("Select a sensor to analyze:", sensor_ids, key="selected_sensor_detail_tab")
 
@@ -350,6 +418,8 @@ with tab2:
 
             min_date = sensor_data["Date/Time"].min().date()
             max_date = sensor_data["Date/Time"].max().date()
+            st.caption(f"Readings since {min_date:%Y-%m-%d}: the raw window kept in the combined file. Older readings "
+                       "are archived by scripts/retention.py (see `python scripts/retention.py --status`).")
             date_range = st.slider(
                 "Select Date Range for Historical Data:",
                 min_value=min_date,
@@ -462,9 +532,12 @@ with tab2:
 
 
 # --- TAB: Campus Forecast ---
-with tab3:
+def render_campus_forecast():
     st.header("Campus-Wide Demand Forecast")
+    forecast_df = load_csv_data_cached(FORECAST_PATH, version(FORECAST_PATH))
     if not forecast_df.empty:
+        import plotly.graph_objects as go
+
         # Aggregate forecast if needed, or just display raw
         st.dataframe(forecast_df[["Building", "Date", "Forecast (Liters)"]].sort_values(["Date", "Building"]), use_container_width=True)
 
@@ -494,7 +567,7 @@ with tab3:
         st.warning("Overall demand forecast data not available. Ensure 'demand_forecast.csv' exists and contains data.")
 
 # --- TAB: All Alerts ---
-with tab4:
+def render_all_alerts():
     st.header("All Detected Leak Alerts")
     col_all_alerts1, col_all_alerts2 = st.columns(2)
     with col_all_alerts1:
@@ -511,37 +584,84 @@ with tab4:
             st.info("No spike alerts recorded so far. Keep up the good work! 💪")
 
 # --- TAB: Valve Control ---
-with tab5:
-    st.header("Valve Control Simulation")
-    st.info("This section simulates sending commands to physical valves. In a real system, this would trigger IoT commands to close or open water supply.")
+def render_valve_control():
+    st.header("Valve Control")
+    st.info("Commands go through the valve command engine to the simulated Pico valve fleet: "
+            "each one is requested, acknowledged by the gateway and confirmed once the valve has moved.")
 
     if not df_combined.empty:
+        valves = tuple(sorted(df_combined["Building"].unique()))
+        service = get_valve_service(valves)
+
         with st.form("valve_control_form"):
             col_valve1, col_valve2 = st.columns(2)
             with col_valve1:
                 valve_building = st.selectbox(
                     "Select Building for Valve Control:",
-                    sorted(df_combined["Building"].unique()),
+                    valves,
                     key="valve_building_select_tab"
                 )
             with col_valve2:
                 action = st.radio("Select Action:", ["Open Valve", "Close Valve"], key="valve_action_radio_tab")
-            submitted = st.form_submit_button("Send Simulated Command")
+            submitted = st.form_submit_button("Send Command")
             if submitted:
-                st.success(f"✅ Simulated command sent: **{action}** valve for **{valve_building}**. "
-                           "In a real system, this would trigger an actuator command.")
-                # Removed st.balloons() for a more professional presentation
+                cmd = service.submit(valve_building, "open" if action == "Open Valve" else "close")
+                st.success(f"✅ Command {cmd['id']} queued: **{action}** for **{valve_building}**.")
+
+        if st.button("🚨 Emergency Shutoff (close all valves)", type="primary", key="emergency_shutoff_btn"):
+            elapsed, cmds = service.emergency_shutoff()
+            failed = [c for c in cmds if c["state"] != "confirmed"]
+            if failed:
+                st.error(f"❌ {len(failed)} of {len(cmds)} valves did not confirm: "
+                         + ", ".join(f"{c['valve']} ({c['error']})" for c in failed))
+            else:
+                st.success(f"✅ All {len(cmds)} valves confirmed closed in {elapsed:.2f}s.")
+
+        stats = service.stats()
+        col_s1, col_s2, col_s3, col_s4 = st.columns(4)
+        col_s1.metric("Commands Confirmed", f"{stats['confirmed']}", help=f"{stats['failed']} failed")
+        col_s2.metric("Latency p95", f"{stats['latency_p95_ms'] or 0:.0f} ms", help="Requested → confirmed round trip.")
+        col_s3.metric("Queue Depth", f"{stats['queue_depth']}", help=f"Max seen: {stats['max_queue_depth']}")
+        col_s4.metric("Throughput", f"{stats['throughput_per_s'] or 0:.1f}/s")
+
+        col_valve_state, col_valve_log = st.columns([1, 2])
+        with col_valve_state:
+            st.markdown("#### Valve Positions")
+            positions = service.positions()
+            st.dataframe(pd.DataFrame({"Valve": valves, "Position": [positions.get(v, "open") for v in valves]}),
+                         use_container_width=True, hide_index=True)
+        with col_valve_log:
+            st.markdown("#### Recent Commands")
+            recent = service.recent(20)
+            if recent:
+                st.dataframe(pd.DataFrame(recent)[["requested_at", "valve", "action", "state", "attempts", "ack_ms", "latency_ms", "error"]],
+                             use_container_width=True, hide_index=True)
+            else:
+                st.info("No commands sent yet.")
     else:
-        st.warning("No building data available for valve control simulation.")
+        st.warning("No building data available for valve control.")
+
+
+TAB_RENDERERS = {
+    "Overview": render_overview,
+    "Sensor Details": render_sensor_details,
+    "Campus Forecast": render_campus_forecast,
+    "All Alerts": render_all_alerts,
+    "Valve Control": render_valve_control,
+}
+TAB_RENDERERS[active_tab]()
+
 # --- SIDEBAR INFORMATION AND LEGEND ---
 st.sidebar.markdown("---")
 st.sidebar.markdown("### ℹ️ Legend")
 st.sidebar.markdown("- 🔴 **Leak / Active Alert**: Detected Night Leak or Spike Alert (from `leak_detection.py`).")
 st.sidebar.markdown(f"- 🟠 **Active Flow**: Sensor is actively registering significant water flow (above {SIGNIFICANT_CONSUMPTION_THRESHOLD} L/hr).")
 st.sidebar.markdown(f"- 🔵 **Low/No Flow**: Little to no active water flow (at or below {SIGNIFICANT_CONSUMPTION_THRESHOLD} L/hr).")
+st.sidebar.markdown("- ⚫ **Stale / Offline**: The sensor has stopped reporting (from `sensor_health.py`).")
+st.sidebar.markdown("- 🟣 **Flatlined**: The sensor reports, but its totalizer has not moved for a day.")
 st.sidebar.markdown("---")
 st.sidebar.markdown("🛠️ **Data Update Instructions:**")
-st.sidebar.markdown("- Raw water data (`combined_water_data.csv`) is cached for 5 minutes.")
+st.sidebar.markdown("- Data files are cached until the pipeline rewrites them.")
 st.sidebar.markdown("- Leak alerts & forecasts are generated by external Python scripts.")
 st.sidebar.markdown("- **To update alerts/forecasts:**")
 st.sidebar.markdown("  1. Run `python /home/iiitb/campus_digital_twin/scripts/leak_detection.py`")
@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
-import os
+import os, sys
 from datetime import datetime, timedelta
 from PIL import Image, ImageDraw, ImageFont
 import plotly.graph_objects as go
-from sklearn.ensemble import IsolationForest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import baseline_profile
+from leak_detection import ALERT_COLUMNS
+from meter_registry import load_registry
+from water_data import load_combined, version, write_csv
 st.set_page_config(layout="wide")
 # === CONFIGURATION ===
 base_path = r"/home/iiitb/campus_digital_twin/data"
@@ -13,6 +18,7 @@ forecast_path = os.path.join(base_path, "demand_forecast.csv")
 night_leaks_path = os.path.join(base_path, "night_leak_alerts.csv")
 spike_alerts_path = os.path.join(base_path, "spike_alerts.csv")
 deployment_image_path = os.path.join(base_path, "deployment_diagram.png")
+baseline_path = os.path.join(base_path, ".baseline_profile.npz")
 st.write("✅ Script started")
 try:
     df = pd.read_csv(combined_data_path)
@@ -33,27 +39,36 @@ def authenticate():
 if not authenticate():
     st.stop()
 
-# === ML LEAK DETECTION ===
+# === LEAK DETECTION ===
+# Readings are scored against each meter's hour-of-week baseline (scripts/baseline_profile.py)
+# instead of refitting an IsolationForest on the whole history.
 def run_ml_leak_detection():
     try:
-        df = pd.read_csv(combined_data_path)
-        df["Date/Time"] = pd.to_datetime(df["Date/Time"])
-        df["Hour"] = df["Date/Time"].dt.hour
-        df["DayOfWeek"] = df["Date/Time"].dt.dayofweek
-        features = df[["Consumption (Liters)", "Hour", "DayOfWeek"]].copy()
-        model = IsolationForest(n_estimators=100, contamination=0.02, random_state=42)
-        df["anomaly"] = model.fit_predict(features)
-
-        spike_alerts = df[df["anomaly"] == -1]
-        night_alerts = spike_alerts[(spike_alerts["Hour"] >= 0) & (spike_alerts["Hour"] <= 5)]
-        spike_alerts = spike_alerts[~spike_alerts.index.isin(night_alerts.index)]
-
-        spike_alerts.to_csv(spike_alerts_path, index=False)
-        night_alerts.to_csv(night_leaks_path, index=False)
+        spike_alerts, night_alerts, model = baseline_profile.detect(load_combined(combined_data_path),
+                                                                   baseline_profile.load_params())
+        # same columns and units as the pipeline's leak_detection.py alert files
+        write_csv(spike_alerts[ALERT_COLUMNS], spike_alerts_path, index=False)
+        write_csv(night_alerts[ALERT_COLUMNS], night_leaks_path, index=False)
+        model.save(baseline_path)
+        get_baseline.clear()
     except Exception as e:
         st.error(f"ML Leak Detection Failed: {e}")
 
-run_ml_leak_detection()
+@st.cache_resource
+def get_baseline():
+    return baseline_profile.BaselineProfile.load(baseline_path, baseline_profile.load_params())
+
+@st.cache_data(max_entries=2)
+def baseline_status(file_version):
+    # new readings are scored by lookup and folded into the shared baseline
+    model = get_baseline()
+    model.update(load_combined(combined_data_path))
+    return model.status()
+
+# Detection used to refit on every rerun; now it only runs when there are no
+# alert files yet or when the sidebar button asks for it.
+if not (os.path.exists(spike_alerts_path) and os.path.exists(night_leaks_path)):
+    run_ml_leak_detection()
 
 # === LOAD DATA ===
 df = pd.read_csv(combined_data_path, parse_dates=["Date/Time"])
@@ -67,41 +82,26 @@ st.title("🚰 Campus Water Digital Twin Dashboard")
 
 # === FLOORPLAN OVERLAY ===
 st.subheader("🗺️ Deployment Floorplan")
-sensor_coords = {
-    "A1MD": (349, 421), "A1MF": (397, 421), "A1FD": (446, 421), "A1FF": (495, 421),
-    "A2MFD": (802, 190), "A2MFF": (903, 190),
-    "AGMD": (309, 831), "AGMF": (361, 831), "AGFD": (414, 831), "AGFF": (463, 831),
-    "B1MD": (675, 421), "B1MF": (726, 421), "B1FD": (779, 421), "B1FF": (827, 421),
-    "B2MFD": (1083, 190), "B2MFF": (1184, 190),
-    "BGMD": (638, 831), "BGMF": (692, 831), "BGFD": (743, 831), "BGFF": (792, 831),
-    "BTTD": (1271, 0), "BTTF": (1372, 0),
-    "ATTD": (987, 0), "ATTF": (1090, 0)
-}
+# Meters and their floor-plan positions, from the meter registry (scripts/meter_registry.py)
+sensor_coords = load_registry().coords()
 
 img = Image.open(deployment_image_path).convert("RGBA")
 draw = ImageDraw.Draw(img)
 font = ImageFont.load_default()
-latest = df["Date/Time"].max()
-df_hourly = df.copy()
-df_hourly["Hour"] = df_hourly["Date/Time"].dt.floor("H")
-df_hourly = df_hourly.groupby(["Building", "Hour"])["Consumption (Liters)"].max().diff().fillna(0)
-
-spike_buildings = set(spike_df["Building"].unique())
-night_buildings = set(night_df["Building"].unique())
-leak_buildings = spike_buildings.union(night_buildings)
+# Each meter's newest flow against its usual flow for that hour of the week
+status = baseline_status(version(combined_data_path))
+warn = get_baseline().params["warn"]
 
 for alias, (x, y) in sensor_coords.items():
-    val = round(df_hourly.get((alias, latest.floor("H")), 0), 2)
-    if alias in leak_buildings:
+    flow, score, anomalous = status.get(alias, (0.0, float("nan"), False))
+    if anomalous:
         color = (255, 0, 0, 230)  # Red
-    elif val > 300:
-        color = (255, 0, 0, 230)
-    elif val > 150:
+    elif score >= warn:
         color = (255, 165, 0, 230)  # Orange
     else:
         color = (0, 102, 204, 230)  # Blue
     draw.rectangle([x - 5, y - 5, x + 85, y + 15], fill=color)
-    draw.text((x, y), f"{alias}: {val}L", fill="white", font=font)
+    draw.text((x, y), f"{alias}: {round(flow, 1)}L/h", fill="white", font=font)
 
 st.image(img, caption=f"Overlayed Meter Readings | Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", use_column_width=True)
 
@@ -113,6 +113,8 @@ sensor_data = df[df["Building"] == selected_sensor]
 
 if not sensor_data.empty:
     st.markdown(f"### 📊 Historical Usage for {selected_sensor}")
+    st.caption(f"Readings since {sensor_data['Date/Time'].min():%Y-%m-%d}: the raw window kept in the combined file. "
+               "Older readings are archived by scripts/retention.py.")
     fig2 = go.Figure()
     fig2.add_trace(go.Scatter(x=sensor_data["Date/Time"], y=sensor_data["Consumption (Liters)"], mode='lines+markers'))
     fig2.update_layout(xaxis_title="Time", yaxis_title="Liters", height=400)
@@ -123,8 +125,8 @@ if not sensor_data.empty:
     st.dataframe(forecast_data[["Date", "Forecast (Liters)"]])
 
     st.markdown("### 🚨 Recent Alerts for This Sensor")
-    st.dataframe(spike_df[spike_df["Building"] == selected_sensor][["Date/Time", "Consumption (Liters)"]])
-    st.dataframe(night_df[night_df["Building"] == selected_sensor][["Date/Time", "Consumption (Liters)"]])
+    st.dataframe(spike_df[spike_df["Building"] == selected_sensor][["Date/Time", "Hourly Consumption (Liters)"]])
+    st.dataframe(night_df[night_df["Building"] == selected_sensor][["Date/Time", "Hourly Consumption (Liters)"]])
 
 # === Forecast Table ===
 st.subheader("🔮 Overall Demand Forecast")
@@ -135,10 +137,10 @@ st.subheader("🚨 Full Leak Alerts")
 col1, col2 = st.columns(2)
 with col1:
     st.markdown("### 🌙 Night Leaks")
-    st.dataframe(night_df[["Date/Time", "Building", "Consumption (Liters)"]])
+    st.dataframe(night_df[["Date/Time", "Building", "Hourly Consumption (Liters)"]])
 with col2:
     st.markdown("### 📈 Spike Alerts")
-    st.dataframe(spike_df[["Date/Time", "Building", "Consumption (Liters)"]])
+    st.dataframe(spike_df[["Date/Time", "Building", "Hourly Consumption (Liters)"]])
 
 # === Simulated Valve Control ===
 st.subheader("🛠️ Valve Control Simulation")
@@ -155,8 +157,8 @@ with st.form("valve_control"):
 # === Sidebar Info ===
 st.sidebar.markdown("---")
 st.sidebar.markdown("ℹ️ **Legend**")
-st.sidebar.markdown("- 🔴 Leak / High Use")
-st.sidebar.markdown("- 🟠 Medium Use")
+st.sidebar.markdown("- 🔴 Anomalous for this hour of the week")
+st.sidebar.markdown("- 🟠 Above usual")
 st.sidebar.markdown("- 🔵 Normal")
 st.sidebar.markdown("🛠️ Redrawn every time you refresh.")
 if st.sidebar.button("🔄 Re-run ML Leak Detection"):
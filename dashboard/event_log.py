@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# event_log.py
+"""
+Non-blocking event log for the dashboards.
+
+log() appends the event to a local SQLite journal (WAL mode, one small local
+insert) and returns; a background thread flushes batches from the journal to
+each sink and keeps a per-sink cursor, so a sink that is down (no network,
+Sheets quota) just falls behind and catches up with backoff. Every event has
+an idempotency key: the journal ignores a key it has already seen, so the same
+alert logged on every Streamlit rerun becomes one row, and sinks skip keys
+they already hold when a batch is retried after a partial failure.
+"""
+import os, sys, json, time, uuid, sqlite3, argparse, threading, atexit
+from datetime import datetime
+
+# ——— CONFIGURATION ——————————————————————————————————————
+JOURNAL_PATH = "event_log.sqlite"
+FILE_SINK_PATH = "event_log.jsonl"
+BATCH_SIZE = 200            # events per sink write (one Sheets append_rows call)
+FLUSH_INTERVAL = 2.0        # seconds between flushes when nothing new is logged
+RETRY_BASE = 2.0            # first retry delay after a sink failure, doubled each time
+RETRY_MAX = 300.0
+# ————————————————————————————————————————————————————————
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    ts TEXT NOT NULL,
+    sensor TEXT,
+    event TEXT,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sink_cursors (
+    sink TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+
+class FileSink:
+    """Line-delimited JSON file; the local stand-in for Sheets in tests and offline runs."""
+
+    def __init__(self, path=FILE_SINK_PATH):
+        self.name = f"file:{os.path.basename(path)}"
+        self.path = path
+        self._keys = None
+
+    def write(self, events):
+        if self._keys is None:
+            self._keys = set()
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._keys = {json.loads(line)["key"] for line in f if line.strip()}
+        new = [e for e in events if e["key"] not in self._keys]
+        if new:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(e) + "\n" for e in new)
+                f.flush()
+                os.fsync(f.fileno())
+            self._keys.update(e["key"] for e in new)
+        return len(new)
+
+
+class SheetsSink:
+    """
+    Google Sheets worksheet, written with one append_rows call per batch.
+    Rows are [timestamp, sensor, event, value, key]; keys already in the
+    sheet are skipped so a retried batch does not duplicate rows.
+    """
+
+    def __init__(self, sheet_name, json_keyfile, worksheet="Logs"):
+        self.name = f"sheets:{sheet_name}/{worksheet}"
+        self.sheet_name = sheet_name
+        self.json_keyfile = json_keyfile
+        self.worksheet = worksheet
+        self._ws = None
+        self._keys = None
+
+    def _connect(self):
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        credentials = ServiceAccountCredentials.from_json_keyfile_name(self.json_keyfile, scope)
+        ws = gspread.authorize(credentials).open(self.sheet_name).worksheet(self.worksheet)
+        self._keys = set(ws.col_values(5))
+        return ws
+
+    def write(self, events):
+        if self._ws is None:
+            self._ws = self._connect()
+        new = [e for e in events if e["key"] not in self._keys]
+        if new:
+            self._ws.append_rows([[e["ts"], e["sensor"], e["event"], e["value"], e["key"]] for e in new],
+                                 value_input_option="USER_ENTERED")
+            self._keys.update(e["key"] for e in new)
+        return len(new)
+
+
+class EventLogger:
+    def __init__(self, sinks, journal_path=JOURNAL_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.sinks = list(sinks)
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {s.name: {"delivered": 0, "failures": 0, "last_error": None} for s in self.sinks}
+        self._retry_at = {s.name: 0.0 for s in self.sinks}
+        self._backoff = {s.name: RETRY_BASE for s in self.sinks}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._db = self._open()
+        self._worker = threading.Thread(target=self._run, name="event-log-flusher", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def _open(self):
+        db = sqlite3.connect(self.journal_path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")   # WAL + NORMAL: durable across app crashes, no fsync per insert
+        db.executescript(SCHEMA)
+        return db
+
+    def log(self, sensor, event, value, key=None, ts=None):
+        """
+        Journal one event and return immediately. Returns False when the key
+        was already logged (e.g. the same alert on a later rerun).
+        """
+        ts = ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        key = key or uuid.uuid4().hex
+        with self._lock:
+            cur = self._db.execute("INSERT OR IGNORE INTO events (key, ts, sensor, event, value) VALUES (?, ?, ?, ?, ?)",
+                                   (key, ts, str(sensor), str(event), str(value)))
+        if cur.rowcount:
+            self._wake.set()
+        return bool(cur.rowcount)
+
+    def pending(self):
+        """Events in the journal not yet delivered, per sink."""
+        with self._lock:
+            last = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            return {s.name: last - self._cursor(s) for s in self.sinks}
+
+    def _cursor(self, sink):
+        row = self._db.execute("SELECT last_id FROM sink_cursors WHERE sink = ?", (sink.name,)).fetchone()
+        return row[0] if row else 0
+
+    def _batch(self, sink):
+        with self._lock:
+            rows = self._db.execute("SELECT id, key, ts, sensor, event, value FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                                    (self._cursor(sink), self.batch_size)).fetchall()
+        return [dict(zip(("id", "key", "ts", "sensor", "event", "value"), r)) for r in rows]
+
+    def flush(self, force=False):
+        """Deliver everything pending to every sink whose retry delay has passed."""
+        delivered = 0
+        for sink in self.sinks:
+            if not force and time.monotonic() < self._retry_at[sink.name]:
+                continue
+            while True:
+                batch = self._batch(sink)
+                if not batch:
+                    break
+                try:
+                    sink.write([{k: v for k, v in e.items() if k != "id"} for e in batch])
+                except Exception as e:
+                    stat = self.stats[sink.name]
+                    stat["failures"] += 1
+                    stat["last_error"] = f"{type(e).__name__}: {e}"
+                    self._retry_at[sink.name] = time.monotonic() + self._backoff[sink.name]
+                    self._backoff[sink.name] = min(self._backoff[sink.name] * 2, RETRY_MAX)
+                    print(f"⚠️ Event sink {sink.name} failed ({stat['last_error']}), retrying later", file=sys.stderr)
+                    break
+                with self._lock:
+                    self._db.execute("INSERT INTO sink_cursors (sink, last_id) VALUES (?, ?) "
+                                     "ON CONFLICT(sink) DO UPDATE SET last_id = excluded.last_id",
+                                     (sink.name, batch[-1]["id"]))
+                self.stats[sink.name]["delivered"] += len(batch)
+                self._backoff[sink.name] = RETRY_BASE
+                delivered += len(batch)
+        return delivered
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self, timeout=5.0):
+        """Stop the worker after a last flush attempt; undelivered events stay in the journal."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._worker.join(timeout)
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or flush the dashboard event journal.")
+    parser.add_argument("--journal", default=JOURNAL_PATH)
+    parser.add_argument("--file-sink", default=FILE_SINK_PATH)
+    parser.add_argument("--sheet", help="also flush to this Google Sheet (needs --keyfile)")
+    parser.add_argument("--keyfile", help="service-account JSON for the Sheets sink")
+    parser.add_argument("--flush", action="store_true", help="deliver pending events now")
+    args = parser.parse_args()
+
+    sinks = [FileSink(args.file_sink)]
+    if args.sheet and args.keyfile:
+        sinks.append(SheetsSink(args.sheet, args.keyfile))
+    logger = EventLogger(sinks, journal_path=args.journal)
+    if args.flush:
+        print(f"✅ Delivered {logger.flush(force=True)} event(s)")
+    for name, n in logger.pending().items():
+        stat = logger.stats[name]
+        print(f"   {name:<32} pending {n:>6}" + (f" | last error: {stat['last_error']}" if stat["last_error"] else ""))
+    logger.close()
+
+
+if __name__ == "__main__":
+    main()
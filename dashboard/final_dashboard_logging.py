@@ -3,10 +3,14 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from PIL import Image
-from datetime import datetime, timedelta
+from datetime import timedelta
 from streamlit_plotly_events import plotly_events
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import os, sys
+
+from event_log import EventLogger, FileSink, SheetsSink
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from meter_registry import load_registry
 
 # CONFIG
 image_path = "deployment_diagram.png"
@@ -14,40 +18,39 @@ data_path = "combined_water_data.csv"
 sheet_name = "Campus water logs"
 json_keyfile = "dt-iiitb-18cb05f32800.json"
 
-# Set up Google Sheets API
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-credentials = ServiceAccountCredentials.from_json_keyfile_name(json_keyfile, scope)
-client = gspread.authorize(credentials)
-sheet = client.open(sheet_name).worksheet("Logs")
-
-def log_event(sensor, event, value):
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    sheet.append_row([now, sensor, event, value])
+# Events go to a local journal and are flushed to the sinks by a background
+# thread (see event_log.py), so logging never waits on Google Sheets. One
+# logger per server process; Sheets is only used when the key file exists.
+@st.cache_resource
+def get_event_logger():
+    sinks = [FileSink("event_log.jsonl")]
+    if os.path.exists(json_keyfile):
+        sinks.append(SheetsSink(sheet_name, json_keyfile, worksheet="Logs"))
+    return EventLogger(sinks, journal_path="event_log.sqlite")
+
+def log_event(sensor, event, value, key=None):
+    """Journal an event; events with a key already logged are ignored."""
+    get_event_logger().log(sensor, event, value, key=key)
+
+# Valve commands go through the command engine to the simulated valve fleet (valve_control.py)
+@st.cache_resource
+def get_valve_service():
+    from valve_control import ValveService
+    return ValveService(sorted(sensor_coords))
 
 # Load floorplan
 bg_image = Image.open(image_path)
 width, height = bg_image.size
 
-# Sensor positions
-sensor_coords = {
-    "A1MD": (349, 421), "A1MF": (397, 421), "A1FD": (446, 421), "A1FF": (495, 421),
-    "A2MFD": (802, 190), "A2MFF": (903, 190),
-    "AGMD": (309, 831), "AGMF": (361, 831), "AGFD": (414, 831), "AGFF": (463, 831),
-    "B1MD": (675, 421), "B1MF": (726, 421), "B1FD": (779, 421), "B1FF": (827, 421),
-    "B2MFD": (1083, 190), "B2MFF": (1184, 190),
-    "BGMD": (638, 831), "BGMF": (692, 831), "BGFD": (743, 831), "BGFF": (792, 831),
-    "BTTD": (1271, 0), "BTTF": (1372, 0),
-    "ATTD": (987, 0), "ATTF": (1090, 0)
-}
+# Sensor positions, from the meter registry (scripts/meter_registry.py)
+registry = load_registry()
+sensor_coords = registry.coords()
 
 # Load data
 df = pd.read_csv(data_path)
 df["Date/Time"] = pd.to_datetime(df["Date/Time"])
 df["Hour"] = df["Date/Time"].dt.floor("H")
-df["Alias"] = df["Building"].str.extract(
-    r'(A1MD|A1MF|A1FD|A1FF|A2MFD|A2MFF|AGMD|AGMF|AGFD|AGFF|B1MD|B1MF|B1FD|B1FF|B2MFD|B2MFF|BGMD|BGMF|BGFD|BGFF|BTTD|BTTF|ATTD|ATTF)'
-)
-df = df.dropna(subset=["Alias"])
+df = registry.with_alias(df)  # integer-code lookup; rows of unknown meters are dropped
 
 # Compute hourly usage
 hourly_df = df.groupby(["Alias", "Hour"])["Consumption (Liters)"].max().diff().fillna(0)
@@ -63,7 +66,8 @@ for alias in sensor_coords:
     if avg_last_3 > 0 and current > 3 * avg_last_3:
         msg = f"🚨 Leak at {alias}: {round(current,1)} L (>{round(3*avg_last_3,1)} L)"
         alerts.append(msg)
-        log_event(alias, "leak_alert", f"{current} L")
+        # Keyed by meter and hour: every rerun sees the same alert, it is logged once
+        log_event(alias, "leak_alert", f"{current} L", key=f"leak_alert:{alias}:{latest_hour}")
 
 # Create overlay
 x_vals = [x for x, y in sensor_coords.values()]
@@ -117,15 +121,17 @@ if clicked:
     )
     st.line_chart(hourly_series.rename("Hourly Consumption (L)"))
 
+    valves = get_valve_service()
     if f"{clicked}_valve" not in st.session_state:
-        st.session_state[f"{clicked}_valve"] = "Open"
+        st.session_state[f"{clicked}_valve"] = "Closed" if valves.positions().get(clicked) == "closed" else "Open"
 
     valve_state = st.radio(f"Valve at {clicked}", ["Open", "Closed"],
                            index=0 if st.session_state[f"{clicked}_valve"] == "Open" else 1)
     if valve_state != st.session_state[f"{clicked}_valve"]:
+        valves.submit(clicked, "open" if valve_state == "Open" else "close", source="final_dashboard")
         log_event(clicked, "valve_toggle", valve_state)
     st.session_state[f"{clicked}_valve"] = valve_state
-    st.success(f"Valve is: **{valve_state}**")
+    st.success(f"Valve requested: **{valve_state}** | confirmed position: **{valves.positions().get(clicked, 'open')}**")
 else:
     st.info("Click on a meter dot to view usage and toggle valve.")
 
@@ -136,3 +142,8 @@ if alerts:
         st.write(a)
 else:
     st.success("✅ No leaks detected in the latest hour.")
+
+# Event log status (delivery happens in the background)
+for sink, n in get_event_logger().pending().items():
+    if n:
+        st.sidebar.caption(f"📝 {n} event(s) waiting for {sink}")
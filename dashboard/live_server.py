@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# live_server.py
+"""
+Push server for the 3D twin: per-meter deltas over Server-Sent Events.
+
+The twin used to download the whole combined_water_data.json to refresh. Here
+the server follows the data instead, and connected clients only receive what
+changed:
+
+- readings: new rows appended to combined_water_data.csv, read from the last
+  byte offset (a rewritten file is re-read, and only rows newer than each
+  meter's last reading go out);
+- alerts: open / closed transitions of the sensor health statuses
+  (sensor_health.py) and of the night-flow and spike episodes
+  (leak_controller.py, observing only; real_time.py owns the valves);
+- valves: position changes in valve_state.json (valve_control.py).
+
+Every event has an id "<epoch>-<seq>". A client that reconnects with
+Last-Event-ID (EventSource does this by itself) or ?since=<id> gets the events
+it missed from a bounded backlog. A client that is new, comes from an older
+server run or is too far behind gets a snapshot first: the latest readings,
+the open alerts and the valve positions. Nothing a client receives depends on
+how much history there is. Each event is encoded once and written to every
+client; a client whose socket buffer exceeds max_client_buffer_kb is dropped
+and resumes when it reconnects.
+
+Endpoints: GET /events (text/event-stream), GET /snapshot, GET /stats.
+Settings: the `live_server` section of config.yaml.
+
+`python live_server.py` serves the campus data; `python live_server.py --bench`
+connects many simulated clients to a synthetic feed and reports latency,
+bandwidth per client and whether reconnecting clients resumed without gaps.
+"""
+import os, sys, io, json, time, asyncio, argparse, statistics
+from collections import deque
+from itertools import islice
+from urllib.parse import urlsplit, parse_qs
+
+import yaml
+
+# ——— CONFIGURATION ——————————————————————————————————————
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.yaml")
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "combined_water_data.csv")
+VALVE_STATE_PATH = "valve_state.json"   # written by valve_control.py next to the dashboards
+DEFAULT_LIVE = {
+    "host": "127.0.0.1",
+    "port": 8800,
+    "poll_seconds": 5,              # how often the combined CSV and the valve state are checked
+    "backlog_events": 5000,         # events kept for clients that reconnect
+    "history_per_meter": 48,        # recent readings per meter in the snapshot (~1 day at 30 min)
+    "prime_hours": 24,              # history fed to the alert rules at startup
+    "max_client_buffer_kb": 512,    # a client this far behind is dropped (it resumes on reconnect)
+    "heartbeat_seconds": 15,
+}
+SSE_HEADERS = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+               b"Connection: keep-alive\r\nAccess-Control-Allow-Origin: *\r\n\r\n")
+# ————————————————————————————————————————————————————————
+
+
+def load_params(path=CONFIG_PATH):
+    try:
+        with open(path, "r") as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    return {**DEFAULT_LIVE, **(config.get("live_server") or {})}
+
+
+def frame(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class EventHub:
+    """Numbered events, a bounded backlog for resuming clients and the current state for new ones."""
+
+    def __init__(self, params=None):
+        self.params = {**DEFAULT_LIVE, **(params or {})}
+        self.epoch = format(int(time.time()), "x")      # ids from an earlier server run never resume
+        self.seq = 0
+        self.backlog = deque(maxlen=int(self.params["backlog_events"]))   # (seq, encoded frame)
+        self.readings = {}              # meter → recent readings
+        self.alerts = {}                # "meter/kind" → open alert
+        self.valves = {}                # meter → position
+        self.clients = set()
+        self.max_buffer = int(self.params["max_client_buffer_kb"]) * 1024
+        self.dropped = 0
+
+    def apply(self, kind, data):
+        """Update the state a snapshot is built from, without sending anything."""
+        if kind == "readings":
+            for r in data:
+                history = self.readings.get(r["meter"])
+                if history is None:
+                    history = self.readings[r["meter"]] = deque(maxlen=int(self.params["history_per_meter"]))
+                history.append(r)
+        elif kind == "alert":
+            key = f"{data['meter']}/{data['kind']}"
+            if data["state"] == "open":
+                self.alerts[key] = data
+            else:
+                self.alerts.pop(key, None)
+        elif kind == "valve":
+            self.valves[data["meter"]] = data["position"]
+
+    def publish(self, kind, data):
+        """Number the event, keep it in the backlog and write it to every client; returns its seq."""
+        self.apply(kind, data)
+        self.seq += 1
+        encoded = frame(f"{self.epoch}-{self.seq}", kind, data)
+        self.backlog.append((self.seq, encoded))
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.detach(writer)
+                self.dropped += 1
+                writer.close()
+            else:
+                writer.write(encoded)
+        return self.seq
+
+    def since(self, last_id):
+        """Encoded events after last_id, or None when they are no longer (or never were) in the backlog."""
+        epoch, _, seq = (last_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        first = self.backlog[0][0] if self.backlog else self.seq + 1
+        if seq > self.seq or seq < first - 1:
+            return None
+        return [encoded for _, encoded in islice(self.backlog, seq - first + 1, None)]
+
+    def snapshot(self):
+        return {"id": f"{self.epoch}-{self.seq}",
+                "readings": {m: list(h) for m, h in self.readings.items()},
+                "alerts": list(self.alerts.values()),
+                "valves": dict(self.valves)}
+
+    def attach(self, writer, last_id=None):
+        """Catch a client up (missed events, else a snapshot) and subscribe it; no event can slip in between."""
+        missed = self.since(last_id)
+        if missed is None:
+            writer.write(frame(f"{self.epoch}-{self.seq}", "snapshot", self.snapshot()))
+        else:
+            writer.write(b"".join(missed))
+        self.clients.add(writer)
+        return "snapshot" if missed is None else f"resumed ({len(missed)} missed)"
+
+    def detach(self, writer):
+        self.clients.discard(writer)
+
+    def stats(self):
+        return {"id": f"{self.epoch}-{self.seq}", "clients": len(self.clients), "backlog": len(self.backlog),
+                "meters": len(self.readings), "open_alerts": len(self.alerts), "dropped": self.dropped}
+
+
+# --- SOURCES ---
+
+class CombinedTail:
+    """Rows appended to the combined CSV since the last read, from the last byte offset."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.header = None
+
+    def read(self):
+        import pandas as pd
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self.offset, self.inode = 0, st.st_ino      # replaced (ingest / retention rewrite): read it again
+        if st.st_size == self.offset:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        end = chunk.rfind(b"\n") + 1                    # a half-written last line waits for the next poll
+        if end == 0:
+            return None
+        chunk = chunk[:end]
+        self.offset += end
+        if self.offset == end:
+            first = chunk.find(b"\n") + 1
+            self.header = list(pd.read_csv(io.BytesIO(chunk[:first]), nrows=0).columns)
+            chunk = chunk[first:]
+        if not chunk.strip():
+            return None
+        return pd.read_csv(io.BytesIO(chunk), names=self.header, header=None)
+
+
+class _Observer:
+    """Valve sink for the leak controller: the push server reports episodes, it does not close valves."""
+
+    def submit(self, valve, action, source):
+        return None
+
+
+class LiveFeed:
+    """Turns the combined CSV and the valve state into hub events."""
+
+    def __init__(self, hub, data_path=DATA_PATH, valve_path=VALVE_STATE_PATH):
+        from sensor_health import SensorHealth, load_params as health_params
+        from leak_controller import LeakController, load_policy
+
+        self.hub = hub
+        self.tail = CombinedTail(data_path)
+        self.valve_path = valve_path
+        self.health = SensorHealth(params=health_params())
+        self.leaks = LeakController(_Observer(), load_policy(), source="live_server")
+        self.last_seen = {}             # meter → newest reading sent
+        self.spikes = {}                # meter → spike episode, until the meter's next reading
+        self.valve_mtime = None
+
+    def new_rows(self, df):
+        """Rows newer than their meter's last reading, one per (meter, time), oldest first."""
+        import pandas as pd
+
+        df = df.dropna(subset=["Building"])
+        df = df.assign(**{"Date/Time": pd.to_datetime(df["Date/Time"], errors="coerce")}).dropna(subset=["Date/Time"])
+        if self.last_seen:
+            since = pd.to_datetime(df["Building"].map(self.last_seen))
+            df = df[since.isna() | (df["Date/Time"] > since)]
+        df = df.drop_duplicates(subset=["Building", "Date/Time"], keep="last").sort_values("Date/Time", kind="stable")
+        if not df.empty:
+            self.last_seen.update(df.groupby("Building")["Date/Time"].max().to_dict())
+        return df
+
+    def _observe(self, rows):
+        """Feed rows to the health monitor and the leak controller."""
+        self.health.feed(rows)
+        cols = rows[["Building", "Date/Time", "Totalizer (Liters)"]]
+        for meter, ts, total in cols.itertuples(index=False):
+            episodes = self.leaks.on_reading(meter, ts.to_pydatetime(), total)
+            spike = next((ep for ep in episodes if ep["kind"] == "spike"), None)
+            if spike is not None:
+                self.spikes[meter] = spike
+            else:
+                self.spikes.pop(meter, None)
+
+    def _deltas(self, rows):
+        return [{"meter": m, "t": ts.isoformat(), "consumption": round(float(c), 3), "totalizer": round(float(t), 3)}
+                for m, ts, c, t in rows[["Building", "Date/Time", "Consumption (Liters)", "Totalizer (Liters)"]]
+                .itertuples(index=False)]
+
+    def _alerts(self):
+        """{"meter/kind": alert} for everything that is wrong right now."""
+        now = {}
+        for row in self.health.snapshot():
+            if row["status"] != "ok":
+                since = row["last_seen"] if row["status"] != "flatlined" else None
+                now[f"{row['meter']}/{row['status']}"] = {"meter": row["meter"], "kind": row["status"], "state": "open",
+                                                          "since": since.isoformat() if since else None}
+        for meter, ep in [*self.leaks.active().items(), *self.spikes.items()]:
+            now[f"{meter}/{ep['kind']}"] = {"meter": meter, "kind": ep["kind"], "state": "open",
+                                            "since": ep["started"].isoformat(), "peak_lph": ep["peak_lph"]}
+        return now
+
+    def _valves(self):
+        try:
+            mtime = os.path.getmtime(self.valve_path)
+            if mtime == self.valve_mtime:
+                return {}
+            with open(self.valve_path, "r") as f:
+                positions = json.load(f).get("positions", {})
+            self.valve_mtime = mtime
+        except (OSError, json.JSONDecodeError):
+            return {}
+        return {m: p for m, p in positions.items() if self.hub.valves.get(m) != p}
+
+    def prime(self):
+        """Load the current state without sending events (no client is connected yet)."""
+        import pandas as pd
+
+        df = self.tail.read()
+        if df is not None:
+            rows = self.new_rows(df)
+            recent = rows.groupby("Building").tail(int(self.hub.params["history_per_meter"]))
+            self.hub.apply("readings", self._deltas(recent))
+            cutoff = rows["Date/Time"].max() - pd.Timedelta(hours=self.hub.params["prime_hours"])
+            self._observe(rows[rows["Date/Time"] >= cutoff])
+        for alert in self._alerts().values():
+            self.hub.apply("alert", alert)
+        for meter, position in self._valves().items():
+            self.hub.apply("valve", {"meter": meter, "position": position})
+
+    def publish(self, df):
+        """Send what changed since the last poll; df is the tail read (or None). Returns the events sent."""
+        sent = 0
+        if df is not None:
+            rows = self.new_rows(df)
+            if not rows.empty:
+                self._observe(rows)
+                self.hub.publish("readings", self._deltas(rows))
+                sent += 1
+        now = self._alerts()
+        for key, alert in now.items():
+            if key not in self.hub.alerts:
+                self.hub.publish("alert", alert)
+                sent += 1
+        for key, alert in list(self.hub.alerts.items()):
+            if key not in now:
+                self.hub.publish("alert", {**alert, "state": "closed"})
+                sent += 1
+        for meter, position in self._valves().items():
+            self.hub.publish("valve", {"meter": meter, "position": position})
+            sent += 1
+        return sent
+
+
+# --- HTTP ---
+
+async def handle(hub, reader, writer):
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        writer.close()
+        return
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split()
+    target = urlsplit(parts[1] if len(parts) > 1 else "/")
+    headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:] if l)}
+
+    if target.path == "/events":
+        last_id = headers.get("last-event-id") or parse_qs(target.query).get("since", [None])[0]
+        writer.write(SSE_HEADERS)
+        hub.attach(writer, last_id)
+        try:
+            while writer in hub.clients:
+                try:
+                    if not await asyncio.wait_for(reader.read(1024), hub.params["heartbeat_seconds"]):
+                        break                               # client went away
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            hub.detach(writer)
+            writer.close()
+        return
+
+    routes = {"/snapshot": hub.snapshot, "/stats": hub.stats}
+    if target.path in routes:
+        body, status = json.dumps(routes[target.path](), separators=(",", ":")).encode(), "200 OK"
+    else:
+        body, status = b'{"error":"not found"}', "404 Not Found"
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                 f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n".encode() + body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+async def serve(params, data_path, valve_path):
+    hub = EventHub(params)
+    feed = LiveFeed(hub, data_path, valve_path)
+    t0 = time.perf_counter()
+    await asyncio.to_thread(feed.prime)
+    print(f"📡 Primed {len(hub.readings)} meters, {len(hub.alerts)} open alert(s) in {time.perf_counter() - t0:.1f}s")
+    server = await asyncio.start_server(lambda r, w: handle(hub, r, w), params["host"], params["port"])
+    print(f"✅ Live feed on http://{params['host']}:{params['port']}/events (snapshot: /snapshot, stats: /stats)")
+    async with server:
+        while True:
+            await asyncio.sleep(params["poll_seconds"])
+            df = await asyncio.to_thread(feed.tail.read)
+            if feed.publish(df):
+                print(f"   {time.strftime('%H:%M:%S')} {hub.stats()}")
+
+
+# --- BENCHMARK ---
+
+class BenchClient:
+    """Minimal EventSource: reads frames, remembers the last id and when each event arrived."""
+
+    def __init__(self, port):
+        self.port = port
+        self.last_id = None
+        self.seqs, self.arrivals, self.bytes = [], {}, 0
+        self.snapshots = 0
+        self.task = None
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        resume = f"Last-Event-ID: {self.last_id}\r\n" if self.last_id else ""
+        writer.write(f"GET /events HTTP/1.1\r\nHost: localhost\r\n{resume}\r\n".encode())
+        await reader.readuntil(b"\r\n\r\n")
+        self.writer = writer
+        self.task = asyncio.create_task(self._read(reader))
+
+    async def _read(self, reader):
+        buf = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                now = time.perf_counter()
+                self.bytes += len(data)
+                buf += data
+                *frames, buf = buf.split(b"\n\n")
+                for f in frames:
+                    fields = dict(line.split(": ", 1) for line in f.decode().split("\n") if ": " in line)
+                    if "id" not in fields:
+                        continue
+                    self.last_id = fields["id"]
+                    if fields.get("event") == "snapshot":
+                        self.snapshots += 1
+                        continue
+                    seq = int(self.last_id.rsplit("-", 1)[1])
+                    self.seqs.append(seq)
+                    self.arrivals[seq] = now
+        except (ConnectionError, asyncio.CancelledError):
+            return
+
+    def disconnect(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+async def bench(n_clients, n_meters, ticks, interval, resume_share, params):
+    """Publish synthetic reading batches to many clients; drop and reconnect some of them half-way."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+    import synthetic_data
+
+    meters = synthetic_data.make_meters(n_meters)
+    readings, _ = synthetic_data.simulate(meters, days=max(1, ticks // 48 + 1), seed=42)
+    batches = [g for _, g in readings.groupby("Date/Time")][:ticks]
+
+    hub = EventHub(params)
+    server = await asyncio.start_server(lambda r, w: handle(hub, r, w), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    clients = [BenchClient(port) for _ in range(n_clients)]
+    await asyncio.gather(*(c.connect() for c in clients))
+
+    published, sizes = {}, {}
+    leaving = clients[:int(resume_share * n_clients)]
+    t0 = time.perf_counter()
+    for k, batch in enumerate(batches):
+        deltas = [{"meter": m, "t": ts.isoformat(), "consumption": round(float(c), 3), "totalizer": round(float(t), 3)}
+                  for m, ts, c, t in batch[["Building", "Date/Time", "Consumption (Liters)", "Totalizer (Liters)"]]
+                  .itertuples(index=False)]
+        seq = hub.publish("readings", deltas)
+        published[seq], sizes[seq] = time.perf_counter(), len(hub.backlog[-1][1])
+        if k == len(batches) // 3:
+            for c in leaving:
+                c.disconnect()
+        if k == len(batches) // 3 + 5:
+            await asyncio.gather(*(c.connect() for c in leaving))
+        await asyncio.sleep(interval)
+    elapsed = time.perf_counter() - t0
+
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline and any(not c.seqs or c.seqs[-1] < hub.seq for c in clients):
+        await asyncio.sleep(0.05)
+    snapshot_bytes = len(frame("x", "snapshot", hub.snapshot()))
+    for c in clients:
+        c.disconnect()
+    while hub.clients and time.perf_counter() < deadline + 5:     # let the handlers see the clients leave
+        await asyncio.sleep(0.05)
+    server.close()
+    return hub, clients, leaving, published, sizes, elapsed, snapshot_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push per-meter deltas to the 3D twin over Server-Sent Events.")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--data", default=DATA_PATH, help="combined CSV to follow")
+    parser.add_argument("--valves", default=VALVE_STATE_PATH, help="valve_state.json to follow")
+    parser.add_argument("--bench", action="store_true", help="simulated clients against a synthetic feed")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--meters", type=int, default=240)
+    parser.add_argument("--ticks", type=int, default=60, help="reading batches published in the benchmark")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between batches in the benchmark")
+    parser.add_argument("--resume-share", type=float, default=0.1, help="clients that drop and reconnect half-way")
+    args = parser.parse_args()
+    params = load_params()
+    if args.port is not None:
+        params["port"] = args.port
+
+    if not args.bench:
+        try:
+            asyncio.run(serve(params, args.data, args.valves))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    print(f"⏳ {args.clients} clients, {args.meters} meters, {args.ticks} batches every {args.interval * 1000:.0f} ms")
+    hub, clients, leaving, published, sizes, elapsed, snapshot_bytes = asyncio.run(
+        bench(args.clients, args.meters, args.ticks, args.interval, args.resume_share, params))
+    print(f"✅ Published {hub.seq} batches in {elapsed:.1f}s, {hub.dropped} client(s) dropped for falling behind")
+
+    # delivery latency per event over all clients, early batches vs late ones (history grows in between)
+    third = max(1, hub.seq // 3)
+    for name, seqs in (("first third", range(1, third + 1)), ("last third", range(hub.seq - third + 1, hub.seq + 1))):
+        lat = sorted((c.arrivals[s] - published[s]) * 1000 for c in clients for s in seqs if s in c.arrivals)
+        size = statistics.mean(sizes[s] for s in seqs)
+        print(f"   {name:<11} latency p50 {lat[len(lat) // 2]:.1f} ms, p99 {lat[int(len(lat) * 0.99)]:.1f} ms | "
+              f"{size / 1024:.1f} KB per batch per client")
+
+    complete = [c for c in clients if c.seqs == list(range(1, hub.seq + 1))]
+    resumed = [c for c in leaving if c.seqs == list(range(1, hub.seq + 1)) and c.snapshots == 1]
+    print(f"   🔁 {len(resumed)}/{len(leaving)} reconnecting clients resumed without gaps or snapshot; "
+          f"{len(complete)}/{len(clients)} clients saw every batch exactly once")
+    print(f"   📦 snapshot for a new client: {snapshot_bytes / 1024:.1f} KB "
+          f"({len(hub.readings)} meters × ≤{params['history_per_meter']} readings, independent of history)")
+    print(f"   📶 {sum(c.bytes for c in clients) / len(clients) / 1024:.0f} KB received per client")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,27 @@
+import os, sys
 import streamlit as st
 import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from meter_registry import load_registry
+
 # --- CONFIG ---
 image_path = r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\dashboard\deployment_diagram.png"
 data_path = r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\data\combined_water_data.csv"
 
-# Updated coordinates (measured on deployment_diagram.png)
-sensor_coords = {
-    "A1MD": (349, 416), "A1MF": (397, 416), "A1FD": (446, 416), "A1FF": (495, 416),
-    "A2MFD": (802, 186), "A2MFF": (903, 186),
-    "AGMD": (309, 826), "AGMF": (361, 826), "AGFD": (414, 826), "AGFF": (463, 826),
-    "B1MD": (675, 416), "B1MF": (726, 416), "B1FD": (779, 416), "B1FF": (827, 416),
-    "B2MFD": (1083, 186), "B2MFF": (1184, 186),
-    "BGMD": (638, 826), "BGMF": (692, 826), "BGFD": (743, 826), "BGFF": (792, 826),
-    "BTTD": (1271, 0), "BTTF": (1372, 0),
-    "ATTD": (987, 0), "ATTF": (1090, 0)
-}
+# Meters and their positions on deployment_diagram.png (meter_registry.coords in config.yaml)
+registry = load_registry()
+sensor_coords = registry.coords()
 
 # --- LOAD & CLEAN DATA ---
 df = pd.read_csv(data_path)
 df["Date/Time"] = pd.to_datetime(df["Date/Time"])
 
-# Extract standard alias name
-df["Alias"] = df["Building"].str.extract(
-    r'(A1MD|A1MF|A1FD|A1FF|A2MFD|A2MFF|AGMD|AGMF|AGFD|AGFF|B1MD|B1MF|B1FD|B1FF|B2MFD|B2MFF|BGMD|BGMF|BGFD|BGFF|BTTD|BTTF|ATTD|ATTF)'
-)
+# Map each reading to its meter (integer-code lookup; rows of unknown meters are dropped)
+df = registry.with_alias(df)
 
-# Clean and compute hourly consumption
-df = df.dropna(subset=["Alias"])
+# Compute hourly consumption
 df["Hour"] = df["Date/Time"].dt.floor("H")
 hourly = (
     df.sort_values("Date/Time")
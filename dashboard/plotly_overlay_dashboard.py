@@ -1,9 +1,12 @@
+import os, sys
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from PIL import Image
 from datetime import datetime, timedelta
-from streamlit_plotly_events import plotly_events
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from meter_registry import load_registry
 
 # --- CONFIG ---
 image_path = "deployment_diagram.png"
@@ -13,29 +16,24 @@ data_path = "combined_water_data.csv"
 bg_image = Image.open(image_path)
 width, height = bg_image.size
 
-# --- Sensor Coordinates ---
-sensor_coords = {
-    "A1MD": (349, 421), "A1MF": (397, 421), "A1FD": (446, 421), "A1FF": (495, 421),
-    "A2MFD": (802, 190), "A2MFF": (903, 190),
-    "AGMD": (309, 831), "AGMF": (361, 831), "AGFD": (414, 831), "AGFF": (463, 831),
-    "B1MD": (675, 421), "B1MF": (726, 421), "B1FD": (779, 421), "B1FF": (827, 421),
-    "B2MFD": (1083, 190), "B2MFF": (1184, 190),
-    "BGMD": (638, 831), "BGMF": (692, 831), "BGFD": (743, 831), "BGFF": (792, 831),
-    "BTTD": (1271, 0), "BTTF": (1372, 0),
-    "ATTD": (987, 0), "ATTF": (1090, 0)
-}
+# --- Sensor Coordinates (from the meter registry, scripts/meter_registry.py) ---
+registry = load_registry()
+sensor_coords = registry.coords()
 
 # --- Load data ---
-df = pd.read_csv(data_path)
-df["Date/Time"] = pd.to_datetime(df["Date/Time"])
-df["Hour"] = df["Date/Time"].dt.floor("H")
-df["Alias"] = df["Building"].str.extract(
-    r'(A1MD|A1MF|A1FD|A1FF|A2MFD|A2MFF|AGMD|AGMF|AGFD|AGFF|B1MD|B1MF|B1FD|B1FF|B2MFD|B2MFF|BGMD|BGMF|BGFD|BGFF|BTTD|BTTF|ATTD|ATTF)'
-)
-df = df.dropna(subset=["Alias"])
+# Every click reruns this script, so parsing and the hourly rollup are cached
+@st.cache_data(ttl=300)
+def load_data(path):
+    df = pd.read_csv(path)
+    df["Date/Time"] = pd.to_datetime(df["Date/Time"])
+    df["Hour"] = df["Date/Time"].dt.floor("H")
+    df = registry.with_alias(df)  # integer-code lookup; rows of unknown meters are dropped
+    hourly_df = df.groupby(["Alias", "Hour"])["Consumption (Liters)"].max().diff().fillna(0)
+    return df, hourly_df
+
+df, hourly_df = load_data(data_path)
 
 # --- Hourly consumption ---
-hourly_df = df.groupby(["Alias", "Hour"])["Consumption (Liters)"].max().diff().fillna(0)
 latest_hour = df["Hour"].max()
 sensor_values = {alias: round(hourly_df.get((alias, latest_hour), 0), 2) for alias in sensor_coords}
 
@@ -74,6 +72,7 @@ fig.update_layout(
 # --- Streamlit Display ---
 st.set_page_config(layout="wide")
 st.title("💧 Interactive Campus Water Dashboard")
+from streamlit_plotly_events import plotly_events  # imported after the title is already on screen
 click = plotly_events(fig, click_event=True, hover_event=True)
 st.write("Click result:", click)
 
@@ -1,35 +1,46 @@
+import os, sys
 import streamlit as st
 import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from meter_registry import load_registry
+
 # --- CONFIG ---
 image_path = "deployment_diagram.png"
 data_path = "combined_water_data.csv"
 refresh_interval = 300  # 5 minutes in seconds
 
-# Sensor coordinates
-sensor_coords = {
-    "A1MD": (349, 421), "A1MF": (397, 421), "A1FD": (446, 421), "A1FF": (495, 421),
-    "A2MFD": (802, 190), "A2MFF": (903, 190),
-    "AGMD": (309, 831), "AGMF": (361, 831), "AGFD": (414, 831), "AGFF": (463, 831),
-    "B1MD": (675, 421), "B1MF": (726, 421), "B1FD": (779, 421), "B1FF": (827, 421),
-    "B2MFD": (1083, 190), "B2MFF": (1184, 190),
-    "BGMD": (638, 831), "BGMF": (692, 831), "BGFD": (743, 831), "BGFF": (792, 831),
-    "BTTD": (1271, 0), "BTTF": (1372, 0),
-    "ATTD": (987, 0), "ATTF": (1090, 0)
-}
+# Sensor coordinates, from the meter registry (scripts/meter_registry.py)
+registry = load_registry()
+sensor_coords = registry.coords()
 
 st.set_page_config(layout="wide")
 st.title("💧Campus Water Dashboard")
 
+# Valve commands go through the command engine to the simulated valve fleet (valve_control.py)
+@st.cache_resource
+def get_valve_service():
+    from valve_control import ValveService
+    return ValveService(sorted(sensor_coords))
+
+# Closes valves on sustained night flow (policy: leak_control in config.yaml), see leak_controller.py
+@st.cache_resource
+def get_leak_controller():
+    from leak_controller import LeakController, load_policy
+    return LeakController(get_valve_service(), load_policy())
+
+# Stale / offline / flatlined meters, updated with each rerun's new readings (see sensor_health.py)
+@st.cache_resource
+def get_sensor_health():
+    from sensor_health import SensorHealth, load_params
+    return SensorHealth(sorted(sensor_coords), load_params())
+
 # --- LOAD DATA ---
 df = pd.read_csv(data_path)
 df["Date/Time"] = pd.to_datetime(df["Date/Time"])
-df["Alias"] = df["Building"].str.extract(
-    r'(A1MD|A1MF|A1FD|A1FF|A2MFD|A2MFF|AGMD|AGMF|AGFD|AGFF|B1MD|B1MF|B1FD|B1FF|B2MFD|B2MFF|BGMD|BGMF|BGFD|BGFF|BTTD|BTTF|ATTD|ATTF)'
-)
-df = df.dropna(subset=["Alias"])
+df = registry.with_alias(df)  # integer-code lookup; rows of unknown meters are dropped
 df["Hour"] = df["Date/Time"].dt.floor("H")
 
 # --- HOURLY USAGE ---
@@ -47,6 +58,39 @@ for alias in sensor_coords:
     if avg_last_3 > 0 and current > 3 * avg_last_3:
         alerts.append(f"🚨 Leak at {alias}: {round(current, 1)}L (>{round(3*avg_last_3, 1)}L)")
 
+# --- AUTOMATIC LEAK CONTROL ---
+controller = get_leak_controller()
+readings = df.sort_values("Date/Time")[["Alias", "Date/Time", "Totalizer (Liters)"]]
+if controller.fed_until() is None:
+    # first run: start from the latest reading per meter, history has already been dealt with
+    for alias, ts, total in readings.groupby("Alias").tail(1).itertuples(index=False):
+        controller.prime(alias, ts.to_pydatetime(), total)
+else:
+    for alias, ts, total in readings[readings["Date/Time"] > controller.fed_until()].itertuples(index=False):
+        controller.on_reading(alias, ts.to_pydatetime(), total)
+    controller.tick(df["Date/Time"].max().to_pydatetime())
+
+for ep in controller.pending():
+    col_msg, col_btn = st.columns([4, 1])
+    col_msg.warning(f"🤖 Sustained night flow at {ep['meter']} ({ep['peak_lph']} L/h): "
+                    f"valve closes at {ep['deadline']:%H:%M} unless overridden.")
+    if col_btn.button("Override", key=f"override_{ep['meter']}"):
+        controller.override(ep["meter"], df["Date/Time"].max().to_pydatetime())
+        st.rerun()
+for ep in [e for e in controller.episodes if e["state"] == "closed"][-5:]:
+    st.error(f"🤖 Closed {ep['meter']} at {ep['command_at']:%Y-%m-%d %H:%M} after night flow since "
+             f"{ep['started']:%H:%M} ({ep['decision_ms']} ms from reading to valve command).")
+
+# --- SENSOR HEALTH ---
+from sensor_health import STATUS_COLORS, label
+health_monitor = get_sensor_health()
+health_monitor.feed(df.assign(Building=df["Alias"]))
+health = {row["meter"]: row for row in health_monitor.snapshot()}
+unhealthy = [row for row in health.values() if row["status"] != "ok"]
+if unhealthy:
+    st.warning("🩺 Sensors not reporting normally: " + ", ".join(
+        f"{row['meter']} ({row['status']}, last reading {row['last_seen'] or 'never'})" for row in unhealthy))
+
 # --- DRAW OVERLAY ---
 img = Image.open(image_path).convert("RGBA")
 draw = ImageDraw.Draw(img)
@@ -54,8 +98,10 @@ font = ImageFont.load_default()
 
 for alias, (x, y) in sensor_coords.items():
     value = round(hourly_df.get((alias, latest_hour), 0), 2)
-    draw.rectangle([x - 5, y - 5, x + 85, y + 15], fill=(255, 255, 255, 230))
-    draw.text((x, y), f"{alias}: {value}L", fill="black", font=font)
+    sensor = health[alias]
+    fill, ink = (STATUS_COLORS[sensor["status"]], "white") if sensor["status"] != "ok" else ((255, 255, 255, 230), "black")
+    draw.rectangle([x - 5, y - 5, x + 85, y + 15], fill=fill)
+    draw.text((x, y), f"{alias}: {label(sensor, f'{value}L')}", fill=ink, font=font)
 
 st.image(img, caption=f"Updated {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", use_column_width=True)
 
@@ -68,12 +114,19 @@ else:
     st.success("✅ No leaks detected in the latest hour.")
 
 # --- CONTROLS ---
-st.sidebar.header("Valve Control Simulation")
+st.sidebar.header("Valve Control")
+valves = get_valve_service()
+positions = valves.positions()
 for alias in sorted(sensor_coords):
     if f"{alias}_valve" not in st.session_state:
-        st.session_state[f"{alias}_valve"] = "Open"
-    status = st.radio(f"{alias} valve", ["Open", "Closed"], index=0 if st.session_state[f"{alias}_valve"] == "Open" else 1, key=alias)
+        st.session_state[f"{alias}_valve"] = "Closed" if positions.get(alias) == "closed" else "Open"
+    status = st.radio(f"{alias} valve ({positions.get(alias, 'open')})", ["Open", "Closed"], index=0 if st.session_state[f"{alias}_valve"] == "Open" else 1, key=alias)
+    if status != st.session_state[f"{alias}_valve"]:
+        valves.submit(alias, "open" if status == "Open" else "close", source="real_time")
     st.session_state[f"{alias}_valve"] = status
+stats = valves.stats()
+st.sidebar.caption(f"Commands confirmed: {stats['confirmed']} | failed: {stats['failed']} | "
+                   f"p95 latency: {stats['latency_p95_ms'] or 0:.0f} ms | queue: {stats['queue_depth']}")
 
 # --- SENSOR CHART ---
 st.sidebar.header("📊 Sensor Usage History")
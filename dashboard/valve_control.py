@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# valve_control.py
+"""
+Valve command engine for the dashboards.
+
+Commands go through a queue to a pool of asyncio workers that talk to the
+valve fleet over a line-delimited JSON connection (the same shape a Pico
+gateway would speak). Each command moves requested → acked → confirmed, or
+to failed when the ack or the confirmation does not arrive in time after
+MAX_ATTEMPTS tries. Actions are absolute ("open"/"close"), so resending one
+is safe. Commands for one valve run in order; different valves run in
+parallel, which is what bounds an emergency shutoff of the whole campus.
+
+SimulatedFleet stands in for the Picos: it acks after a short network delay
+and confirms after the valve's travel time, with optional dropped messages
+and faults. `python valve_control.py` measures an emergency shutoff of all
+24 valves against it.
+"""
+import os, sys, json, time, random, asyncio, argparse, threading, statistics
+from collections import deque
+from datetime import datetime
+
+# ——— CONFIGURATION ——————————————————————————————————————
+VALVES = [
+    "A1MD", "A1MF", "A1FD", "A1FF", "A2MFD", "A2MFF", "AGMD", "AGMF", "AGFD", "AGFF", "ATTD", "ATTF",
+    "B1MD", "B1MF", "B1FD", "B1FF", "B2MFD", "B2MFF", "BGMD", "BGMF", "BGFD", "BGFF", "BTTD", "BTTF",
+]
+ACK_TIMEOUT = 1.0           # seconds for the gateway to acknowledge a command
+CONFIRM_TIMEOUT = 5.0       # seconds for the valve to report its new position
+MAX_ATTEMPTS = 3
+MAX_INFLIGHT = 32           # commands on the wire at once
+COMMAND_HISTORY = 1000      # finished commands kept in memory for recent() / stats() (all go to the log)
+STATE_PATH = "valve_state.json"
+COMMAND_LOG_PATH = "valve_commands.jsonl"
+
+# Simulated fleet timings (seconds)
+ACK_DELAY = (0.005, 0.03)
+TRAVEL_TIME = (0.3, 0.8)    # motorised ball valve, compressed so the simulation stays quick
+# ————————————————————————————————————————————————————————
+
+ACTIONS = ("open", "close")
+POSITIONS = {"open": "open", "close": "closed"}
+TERMINAL = ("confirmed", "failed")
+
+
+class Command:
+    def __init__(self, cmd_id, valve, action, source):
+        self.id = cmd_id
+        self.valve = valve
+        self.action = action
+        self.source = source
+        self.state = "requested"
+        self.attempts = 0
+        self.error = None
+        self.requested_at = time.time()
+        self.acked_at = None
+        self.finished_at = None
+        self.finished = asyncio.Event()
+
+    @property
+    def latency(self):
+        return self.finished_at - self.requested_at if self.finished_at else None
+
+    def to_dict(self):
+        return {"id": self.id, "valve": self.valve, "action": self.action, "source": self.source,
+                "state": self.state, "attempts": self.attempts, "error": self.error,
+                "requested_at": datetime.fromtimestamp(self.requested_at).isoformat(timespec="milliseconds"),
+                "ack_ms": round((self.acked_at - self.requested_at) * 1000, 1) if self.acked_at else None,
+                "latency_ms": round(self.latency * 1000, 1) if self.latency else None}
+
+
+# --- SIMULATED PICO FLEET ---
+
+class SimulatedFleet:
+    """asyncio TCP server playing every valve controller behind one gateway."""
+
+    def __init__(self, valves=VALVES, drop_rate=0.0, fault_rate=0.0, seed=None):
+        self.positions = {v: "open" for v in valves}
+        self.drop_rate = drop_rate
+        self.fault_rate = fault_rate
+        self.rng = random.Random(seed)
+        self._locks = {v: asyncio.Lock() for v in valves}
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _client(self, reader, writer):
+        tasks = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(self._actuate(json.loads(line), writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        writer.close()
+
+    async def _actuate(self, msg, writer):
+        def reply(**fields):
+            writer.write((json.dumps({"id": msg["id"], **fields}) + "\n").encode())
+
+        await asyncio.sleep(self.rng.uniform(*ACK_DELAY))
+        if self.rng.random() < self.drop_rate:
+            return                                    # lost on the radio link
+        if msg["valve"] not in self.positions:
+            reply(status="fault", error="unknown valve")
+            return
+        reply(status="ack")
+        async with self._locks[msg["valve"]]:         # one motor per valve
+            if self.positions[msg["valve"]] != POSITIONS[msg["action"]]:
+                await asyncio.sleep(self.rng.uniform(*TRAVEL_TIME))
+            if self.rng.random() < self.fault_rate:
+                reply(status="fault", error="limit switch not reached")
+                return
+            self.positions[msg["valve"]] = POSITIONS[msg["action"]]
+        reply(status="done", position=self.positions[msg["valve"]])
+
+
+# --- TRANSPORT ---
+
+class FleetTransport:
+    """One connection to the gateway; replies are routed back to the waiting command by message id."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+        self._waiting = {}
+        self._reader_task = None
+        self._connecting = asyncio.Lock()
+
+    async def connect(self):
+        async with self._connecting:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                self._reader_task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            while line := await self.reader.readline():
+                msg = json.loads(line)
+                queue = self._waiting.get(msg["id"])
+                if queue:
+                    queue.put_nowait(msg)
+        finally:
+            # connection gone: wake every waiter so it can time out / retry on a new connection
+            for queue in self._waiting.values():
+                queue.put_nowait({"status": "disconnected"})
+            self.writer = None
+
+    async def send(self, msg_id, valve, action):
+        if self.writer is None:
+            await self.connect()
+        queue = self._waiting[msg_id] = asyncio.Queue()
+        self.writer.write((json.dumps({"id": msg_id, "valve": valve, "action": action}) + "\n").encode())
+        await self.writer.drain()
+        return queue
+
+    def forget(self, msg_id):
+        self._waiting.pop(msg_id, None)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+        if self._reader_task:
+            self._reader_task.cancel()
+
+
+# --- ENGINE ---
+
+class ValveEngine:
+    def __init__(self, transport, max_inflight=MAX_INFLIGHT, state_path=STATE_PATH, log_path=COMMAND_LOG_PATH,
+                 history=COMMAND_HISTORY):
+        self.transport = transport
+        self.max_inflight = max_inflight
+        self.state_path = state_path
+        self.log_path = log_path
+        self.queue = asyncio.Queue()
+        self.commands = {}            # id → Command not finished yet
+        self.finished = deque(maxlen=history)  # the latest finished commands, oldest first
+        self.positions = self._load_positions()
+        self.max_queue_depth = 0
+        self._locks = {}
+        self._next_id = 0
+        self._workers = []
+
+    def _load_positions(self):
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f).get("positions", {})
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return {}
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_inflight)]
+
+    async def stop(self):
+        for w in self._workers:
+            w.cancel()
+        await self.transport.close()
+
+    def submit(self, valve, action, source="dashboard"):
+        if action not in ACTIONS:
+            raise ValueError(f"❌ Unknown valve action: {action}")
+        self._next_id += 1
+        cmd = Command(f"{int(time.time())}-{self._next_id}", valve, action, source)
+        self.commands[cmd.id] = cmd
+        self.queue.put_nowait(cmd)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return cmd
+
+    async def _worker(self):
+        while True:
+            cmd = await self.queue.get()
+            lock = self._locks.setdefault(cmd.valve, asyncio.Lock())
+            async with lock:
+                await self._execute(cmd)
+            self.queue.task_done()
+
+    async def _execute(self, cmd):
+        while cmd.attempts < MAX_ATTEMPTS and cmd.state not in TERMINAL:
+            cmd.attempts += 1
+            msg_id = f"{cmd.id}.{cmd.attempts}"
+            try:
+                replies = await self.transport.send(msg_id, cmd.valve, cmd.action)
+                reply = await asyncio.wait_for(replies.get(), ACK_TIMEOUT)
+                if reply["status"] == "ack":
+                    cmd.state, cmd.acked_at = "acked", cmd.acked_at or time.time()
+                    reply = await asyncio.wait_for(replies.get(), CONFIRM_TIMEOUT)
+                if reply["status"] == "done":
+                    cmd.state = "confirmed"
+                    self.positions[cmd.valve] = reply["position"]
+                else:
+                    cmd.error = reply.get("error", reply["status"])
+            except asyncio.TimeoutError:
+                cmd.error = "no ack" if cmd.state == "requested" else "no confirmation"
+            except OSError as e:
+                cmd.error = f"transport: {e}"
+            finally:
+                self.transport.forget(msg_id)
+        if cmd.state != "confirmed":
+            cmd.state = "failed"
+        else:
+            cmd.error = None
+        cmd.finished_at = time.time()
+        self.commands.pop(cmd.id, None)
+        self.finished.append(cmd)
+        self._record(cmd)
+        cmd.finished.set()
+
+    def _record(self, cmd):
+        """Persist the finished command and the resulting valve positions."""
+        try:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(cmd.to_dict()) + "\n")
+            tmp = self.state_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"updated_at": datetime.now().isoformat(timespec="seconds"),
+                           "positions": self.positions}, f, indent=2)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"⚠️ Could not persist valve state: {e}", file=sys.stderr)
+
+    async def emergency_shutoff(self, valves, source="emergency"):
+        """Close every valve at once; returns (seconds until all finished, commands)."""
+        t0 = time.perf_counter()
+        cmds = [self.submit(v, "close", source) for v in valves]
+        await asyncio.gather(*(c.finished.wait() for c in cmds))
+        return time.perf_counter() - t0, cmds
+
+    def stats(self, window=None):
+        """Latency percentiles, queue depth and throughput over the latest finished commands."""
+        done = list(self.finished)
+        if window:
+            done = done[-window:]
+        confirmed = [c for c in done if c.state == "confirmed"]
+        lat = sorted(c.latency * 1000 for c in confirmed)
+        acks = sorted((c.acked_at - c.requested_at) * 1000 for c in confirmed if c.acked_at)
+        span = (max(c.finished_at for c in done) - min(c.requested_at for c in done)) if done else 0
+        pct = lambda xs, q: round(xs[min(len(xs) - 1, int(q * len(xs)))], 1) if xs else None
+        return {"finished": len(done), "confirmed": len(confirmed), "failed": len(done) - len(confirmed),
+                "ack_p50_ms": pct(acks, 0.5), "latency_p50_ms": pct(lat, 0.5),
+                "latency_p95_ms": pct(lat, 0.95), "latency_max_ms": round(lat[-1], 1) if lat else None,
+                "queue_depth": self.queue.qsize(), "max_queue_depth": self.max_queue_depth,
+                "throughput_per_s": round(len(done) / span, 1) if span else None}
+
+
+# --- THREADED SERVICE FOR STREAMLIT ---
+
+class ValveService:
+    """
+    Runs the engine (and, with simulate=True, the fleet) on its own event loop
+    thread so Streamlit reruns can submit commands without blocking.
+    """
+
+    def __init__(self, valves=VALVES, simulate=True, host="127.0.0.1", port=8765,
+                 state_path=STATE_PATH, log_path=COMMAND_LOG_PATH, **fleet_opts):
+        self.valves = list(valves)
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="valve-engine", daemon=True).start()
+        self.engine = self._call(self._start(simulate, host, port, state_path, log_path, fleet_opts))
+
+    async def _start(self, simulate, host, port, state_path, log_path, fleet_opts):
+        if simulate:
+            self.fleet = SimulatedFleet(self.valves, **fleet_opts)
+            port = await self.fleet.start(host, 0)
+        engine = ValveEngine(FleetTransport(host, port), state_path=state_path, log_path=log_path)
+        if simulate:
+            # the simulated valves start where the last session left them
+            self.fleet.positions.update({v: p for v, p in engine.positions.items() if v in self.fleet.positions})
+        engine.start()
+        return engine
+
+    def _call(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, valve, action, source="dashboard"):
+        async def _submit():
+            return self.engine.submit(valve, action, source).to_dict()
+        return self._call(_submit())
+
+    def emergency_shutoff(self, timeout=60):
+        async def _shutoff():
+            elapsed, cmds = await self.engine.emergency_shutoff(self.valves)
+            return elapsed, [c.to_dict() for c in cmds]
+        return self._call(_shutoff(), timeout)
+
+    def positions(self):
+        return dict(self.engine.positions)
+
+    def recent(self, n=20):
+        async def _recent():
+            # read on the engine's loop, which is the only one changing the collections
+            cmds = [*list(self.engine.finished)[-n:], *self.engine.commands.values()]
+            return [c.to_dict() for c in sorted(cmds, key=lambda c: c.requested_at)[-n:]][::-1]
+        return self._call(_recent())
+
+    def stats(self):
+        async def _stats():
+            return self.engine.stats()
+        return self._call(_stats())
+
+
+async def benchmark(n_valves, rounds, inflight, drop_rate, fault_rate, seed, state_dir):
+    valves = VALVES[:n_valves] + [f"V{i:03d}" for i in range(len(VALVES), n_valves)]
+    fleet = SimulatedFleet(valves, drop_rate=drop_rate, fault_rate=fault_rate, seed=seed)
+    port = await fleet.start()
+    engine = ValveEngine(FleetTransport("127.0.0.1", port), max_inflight=inflight,
+                         state_path=os.path.join(state_dir, STATE_PATH),
+                         log_path=os.path.join(state_dir, COMMAND_LOG_PATH),
+                         history=max(COMMAND_HISTORY, len(valves) * rounds * 2))
+    engine.start()
+    results = []
+    for r in range(rounds):
+        # reopen between rounds so every shutoff actually moves the valves
+        await asyncio.gather(*(engine.submit(v, "open", "benchmark").finished.wait() for v in valves))
+        elapsed, cmds = await engine.emergency_shutoff(valves)
+        failed = [c for c in cmds if c.state != "confirmed"]
+        results.append((elapsed, len(failed)))
+        print(f"   round {r + 1}: all {len(valves)} valves finished in {elapsed:.2f}s"
+              + (f" | ❌ {len(failed)} failed ({failed[0].error})" if failed else " | ✅ all closed"))
+    stats = engine.stats(window=len(valves) * rounds * 2)
+    await engine.stop()
+    await asyncio.sleep(0.05)     # let the fleet see the disconnect before the loop shuts down
+    fleet.server.close()
+    await fleet.server.wait_closed()
+    return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure an emergency shutoff against the simulated valve fleet.")
+    parser.add_argument("--valves", type=int, default=len(VALVES))
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--inflight", type=int, default=MAX_INFLIGHT, help="commands on the wire at once")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of commands lost before the ack")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="fraction of actuations that fault")
+    # worst case for one command: every attempt waits out both timeouts
+    parser.add_argument("--bound", type=float, default=(ACK_TIMEOUT + CONFIRM_TIMEOUT) * MAX_ATTEMPTS,
+                        help="fail if a shutoff takes longer than this many seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--state-dir", default=".", help="where valve_state.json / valve_commands.jsonl go")
+    args = parser.parse_args()
+
+    print(f"⏳ Emergency shutoff of {args.valves} valves × {args.rounds} rounds "
+          f"(drop {args.drop_rate:.0%}, fault {args.fault_rate:.0%})")
+    results, stats = asyncio.run(benchmark(args.valves, args.rounds, args.inflight, args.drop_rate, args.fault_rate,
+                                           args.seed, args.state_dir))
+    worst = max(e for e, _ in results)
+    print(f"📈 shutoff worst {worst:.2f}s, median {statistics.median(e for e, _ in results):.2f}s | "
+          f"command latency p50 {stats['latency_p50_ms']} ms, p95 {stats['latency_p95_ms']} ms, "
+          f"ack p50 {stats['ack_p50_ms']} ms | max queue depth {stats['max_queue_depth']} | "
+          f"{stats['throughput_per_s']} commands/s")
+    if worst > args.bound or any(f for _, f in results):
+        print(f"❌ Shutoff exceeded {args.bound:.1f}s or left valves unconfirmed")
+        sys.exit(1)
+    print(f"✅ Every shutoff finished within {args.bound:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
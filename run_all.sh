@@ -1,4 +1,10 @@
 #!/bin/bash
+# Usage: ./run_all.sh [--profile] [--force] [--only STAGE ...]
+#   Runs scripts/pipeline.py: ingest first, then forecast / leak detection /
+#   plots / export in parallel; stages whose inputs are unchanged are skipped.
+#   --profile   dump a cProfile per stage into profiles/ (see scripts/instrumentation.py)
+#   --force     run every stage even if its inputs are unchanged
+#   --single-process  run the stages in one process, loading the combined data once
 
 # Activate venv
 source /home/iiitb/campus_digital_twin/venv/bin/activate
@@ -6,15 +12,13 @@ source /home/iiitb/campus_digital_twin/venv/bin/activate
 # Go to scripts dir
 cd /home/iiitb/campus_digital_twin/scripts
 
+# Per-stage metrics go to data/pipeline_metrics.jsonl, tagged with this run's id
+export WMS_RUN_ID="$(date +%Y%m%d-%H%M%S)"
+
 # Run scripts
 echo "====== Running all scripts at $(date) ======"
 
-python export_data.py
-python forecast_demand.py
-python generate_water_usage_plots.py
-python leak_detection.py
-python packet_to_combined_water_data.py
-python update_yaml.py
-python validate_merge.py
+python pipeline.py "$@"
 
 echo "====== All scripts done at $(date) ======"
+python instrumentation.py
@@ -2,8 +2,14 @@ import pandas as pd
 import json
 import os
 
+from instrumentation import start_stage
+
+metrics = start_stage("generate_json")
+
 # Load your combined data
-df = pd.read_csv(r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\data\combined_water_data.csv")
+data_path = r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\data\combined_water_data.csv"
+df = pd.read_csv(data_path)
+metrics.read(data_path, rows=len(df))
 df["Date/Time"] = pd.to_datetime(df["Date/Time"])
 
 # Get last available hour
@@ -26,7 +32,10 @@ for _, row in hourly_data.iterrows():
 output_dir = r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\3D_DT\public\json"
 os.makedirs(output_dir, exist_ok=True)
 
-with open(os.path.join(output_dir, "combined_water_data.json"), "w") as f:
+output_path = os.path.join(output_dir, "combined_water_data.json")
+with open(output_path, "w") as f:
     json.dump(data_json, f, indent=2)
+metrics.wrote(output_path, rows=len(data_json))
+metrics.finish()
 
 print("✅ JSON exported successfully!")
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# baseline_profile.py
+"""
+Hour-of-week baseline per meter, for anomaly scores that cost a table lookup.
+
+Every reading becomes a flow rate (L/h over the interval since the meter's
+previous reading) in one of 168 hour-of-week cells of its meter. Each cell
+keeps its last `samples` rates in a ring buffer (about 8 weeks at the 30-minute
+cadence); the cell's median and robust spread (interquartile range / 1.349)
+are recomputed for the cells that received readings, all cells at once with
+one vectorized quantile call. A reading's score is
+
+    (flow - median[meter, hour of week]) / max(spread[meter, hour of week], min_spread_lph)
+
+and it is anomalous when the score reaches `threshold` and the flow is at
+least `min_excess_lph` above the median. Cells with fewer than `min_samples`
+rates are not scored.
+
+update() scores new readings against the baseline so far, then adds them, so
+a meter is always judged against its own past. detect() runs the history
+through update() `refresh_days` at a time and splits the anomalies like
+leak_detection.py: night (00-05) leaks and spikes. The model is cached in
+data/.baseline_profile.npz and refreshed with the new readings only.
+
+Settings: the `baseline` section of config.yaml.
+"""
+import os, json, argparse
+
+import numpy as np
+import pandas as pd
+
+from water_data import PROJECT_ROOT, atomic_write, load_combined, load_config
+
+# ——— CONFIGURATION ——————————————————————————————————————
+CACHE_PATH = os.path.join(PROJECT_ROOT, "data", ".baseline_profile.npz")
+DEFAULT_BASELINE = {
+    "samples": 16,                  # rates kept per meter and hour of week
+    "min_samples": 4,               # cells with fewer rates are not scored
+    "threshold": 6.0,               # score that makes a reading anomalous
+    "warn": 2.0,                    # score shown as "above usual" on the map
+    "min_excess_lph": 5.0,          # and at least this much above the median
+    "min_spread_lph": 1.0,          # spread floor, so near-idle cells do not flag noise
+    "refresh_days": 7,              # detect(): readings scored per refresh of the baseline
+}
+HOURS_OF_WEEK = 168
+NIGHT_HOURS = (0, 5)                # inclusive, same split as leak_detection.py
+# ————————————————————————————————————————————————————————
+
+
+def load_params(config=None):
+    config = config if config is not None else load_config()
+    return {**DEFAULT_BASELINE, **(config.get("baseline") or {})}
+
+
+def _quantiles(rows, n, qs):
+    """
+    Linear-interpolated quantiles of each row's first n values after sorting
+    (NaN sorts last); np.nanquantile along an axis loops over the rows in Python.
+    """
+    rows = np.sort(rows, axis=1)
+    out = []
+    for q in qs:
+        at = q * np.maximum(n - 1, 0)
+        lo = np.floor(at).astype(np.int64)
+        hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+        a = np.take_along_axis(rows, lo[:, None], axis=1)[:, 0]
+        b = np.take_along_axis(rows, hi[:, None], axis=1)[:, 0]
+        out.append(np.where(n > 0, a + (b - a) * (at - lo), np.nan))
+    return out
+
+
+class BaselineProfile:
+    def __init__(self, params=None):
+        self.params = {**DEFAULT_BASELINE, **(params or {})}
+        k = int(self.params["samples"])
+        self.buildings = []
+        self._codes = {}
+        self.ring = np.full((0, HOURS_OF_WEEK, k), np.nan, dtype=np.float32)
+        self.pos = np.zeros((0, HOURS_OF_WEEK), dtype=np.int32)
+        self.count = np.zeros((0, HOURS_OF_WEEK), dtype=np.int32)
+        self.median = np.full((0, HOURS_OF_WEEK), np.nan)
+        self.spread = np.full((0, HOURS_OF_WEEK), np.nan)
+        self.last_seen = np.zeros(0, dtype="datetime64[ns]")
+        self.last_flow = np.zeros(0)        # newest reading per meter: flow, score, flagged
+        self.last_score = np.zeros(0)
+        self.last_anomaly = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.buildings)
+
+    def _encode(self, names):
+        """Integer code per name, adding rows for meters not seen before."""
+        new = [b for b in pd.unique(names) if b not in self._codes]
+        if new:
+            for b in new:
+                self._codes[b] = len(self.buildings)
+                self.buildings.append(b)
+            n = len(new)
+            self.ring = np.concatenate([self.ring, np.full((n, *self.ring.shape[1:]), np.nan, dtype=np.float32)])
+            self.pos = np.concatenate([self.pos, np.zeros((n, HOURS_OF_WEEK), dtype=np.int32)])
+            self.count = np.concatenate([self.count, np.zeros((n, HOURS_OF_WEEK), dtype=np.int32)])
+            self.median = np.concatenate([self.median, np.full((n, HOURS_OF_WEEK), np.nan)])
+            self.spread = np.concatenate([self.spread, np.full((n, HOURS_OF_WEEK), np.nan)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")])
+            self.last_flow = np.concatenate([self.last_flow, np.full(n, np.nan)])
+            self.last_score = np.concatenate([self.last_score, np.full(n, np.nan)])
+            self.last_anomaly = np.concatenate([self.last_anomaly, np.zeros(n, dtype=bool)])
+        return np.array([self._codes[b] for b in names], dtype=np.int64) if len(names) else np.zeros(0, dtype=np.int64)
+
+    def _prepare(self, df):
+        """Rows newer than their meter's last reading → (frame, codes, cells, flow in L/h)."""
+        if "Quality" in df:
+            # a reading after a long outage carries the whole outage's volume (see totalizer_integrity.py)
+            df = df[~df["Quality"].fillna("").str.contains("long_gap")]
+        df = df.dropna(subset=["Date/Time", "Consumption (Liters)"])
+        codes = self._encode(df["Building"].to_numpy())
+        times = df["Date/Time"].to_numpy(dtype="datetime64[ns]")
+        seen = self.last_seen[codes]
+        fresh = np.isnat(seen) | (times > seen)
+        df, codes, times, seen = df[fresh], codes[fresh], times[fresh], seen[fresh]
+        order = np.lexsort((times, codes))
+        df, codes, times, seen = df.iloc[order], codes[order], times[order], seen[order]
+
+        prev = np.empty_like(times)
+        prev[1:] = times[:-1]
+        first = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype=bool)
+        prev[first] = seen[first]
+        hours = (times - prev).astype("timedelta64[s]").astype(float) / 3600
+        known = ~np.isnat(prev) & (hours > 0)          # duplicate timestamps get the typical interval
+        typical = np.median(hours[known]) if known.any() else 0.5
+        hours = np.where(known, hours, typical)
+        flow = np.clip(df["Consumption (Liters)"].to_numpy(dtype=float), 0, None) / hours
+
+        ts = pd.DatetimeIndex(times)
+        cells = codes * HOURS_OF_WEEK + ts.dayofweek.to_numpy() * 24 + ts.hour.to_numpy()
+        return df, codes, cells, flow
+
+    def score(self, cells, flow):
+        """Score per reading from its flat cell index (meter × 168 + hour of week); NaN where the cell is too thin."""
+        p = self.params
+        med = self.median.ravel()[cells]
+        spread = np.fmax(self.spread.ravel()[cells], p["min_spread_lph"])
+        z = (flow - med) / spread
+        return np.where(self.count.ravel()[cells] >= p["min_samples"], z, np.nan), med
+
+    def update(self, df):
+        """
+        Score the readings newer than each meter's last one against the
+        baseline so far, then add them to it. Returns the scored readings
+        (the input rows plus Flow (L/h), Expected (L/h), Score, Anomaly).
+        """
+        df, codes, cells, flow = self._prepare(df)
+        z, med = self.score(cells, flow)
+        anomaly = self.anomalous(z, flow - med)
+        if len(cells):
+            self._insert(cells, flow)
+            last = np.r_[codes[1:] != codes[:-1], True]
+            self.last_seen[codes[last]] = df["Date/Time"].to_numpy(dtype="datetime64[ns]")[last]
+            self.last_flow[codes[last]] = flow[last]
+            self.last_score[codes[last]] = z[last]
+            self.last_anomaly[codes[last]] = anomaly[last]
+        return df.assign(**{"Flow (L/h)": flow.round(3), "Expected (L/h)": med.round(3), "Score": z.round(2),
+                            "Anomaly": anomaly})
+
+    def anomalous(self, z, excess):
+        p = self.params
+        with np.errstate(invalid="ignore"):
+            return (z >= p["threshold"]) & (excess >= p["min_excess_lph"])
+
+    def _insert(self, cells, flow):
+        """Write rates into the cells' ring buffers (newest `samples` per cell) and refresh those cells."""
+        k = self.ring.shape[2]
+        order = np.argsort(cells, kind="stable")            # readings are in time order within a meter
+        cells, flow = cells[order], flow[order]
+        touched, first, counts = np.unique(cells, return_index=True, return_counts=True)
+        rank = np.arange(len(cells)) - np.repeat(first, counts)
+        keep = rank >= np.repeat(counts, counts) - k
+        pos, count = self.pos.reshape(-1), self.count.reshape(-1)
+        slot = (pos[cells] + rank) % k
+        self.ring.reshape(-1, k)[cells[keep], slot[keep]] = flow[keep]
+        pos[touched] = (pos[touched] + counts) % k
+        count[touched] = np.minimum(count[touched] + counts, k)
+
+        q25, q50, q75 = _quantiles(self.ring.reshape(-1, k)[touched], count[touched], (0.25, 0.5, 0.75))
+        self.median.reshape(-1)[touched] = q50
+        self.spread.reshape(-1)[touched] = (q75 - q25) / 1.349
+
+    def status(self):
+        """{meter: (flow, score, anomalous)} of each meter's newest reading, as scored when it arrived."""
+        return {b: (float(self.last_flow[i]), float(self.last_score[i]), bool(self.last_anomaly[i]))
+                for i, b in enumerate(self.buildings)}
+
+    # --- persistence ---
+
+    def save(self, path=CACHE_PATH):
+        with atomic_write(path, "wb") as f:
+            np.savez(f, params=np.array(json.dumps(self.params, sort_keys=True)), buildings=np.array(self.buildings, dtype=str),
+                     ring=self.ring, pos=self.pos, count=self.count, median=self.median, spread=self.spread,
+                     last_seen=self.last_seen, last_flow=self.last_flow, last_score=self.last_score,
+                     last_anomaly=self.last_anomaly)
+
+    @classmethod
+    def load(cls, path=CACHE_PATH, params=None):
+        """The cached model, or an empty one when there is none or it was built with other settings."""
+        model = cls(params)
+        try:
+            with np.load(path, allow_pickle=False) as cached:
+                if json.loads(str(cached["params"])) != model.params:
+                    return model
+                model.buildings = [str(b) for b in cached["buildings"]]
+                model._codes = {b: i for i, b in enumerate(model.buildings)}
+                for name in ("ring", "pos", "count", "median", "spread", "last_seen", "last_flow", "last_score",
+                             "last_anomaly"):
+                    setattr(model, name, cached[name])
+        except (OSError, KeyError, ValueError):
+            return cls(params)
+        return model
+
+
+def detect(df, params=None, model=None):
+    """
+    Score the history `refresh_days` at a time (each chunk against the baseline
+    of everything before it). Returns (spike_alerts, night_leak_alerts, model);
+    the alerts carry the input columns plus Flow (L/h), Expected (L/h), Score
+    and, as in leak_detection.py's alert files, Hourly Consumption (Liters)
+    (the reading's volume).
+    """
+    model = model or BaselineProfile(params)
+    df = df.sort_values("Date/Time", kind="stable")
+    edges = pd.date_range(df["Date/Time"].min().floor("D"), df["Date/Time"].max() + pd.Timedelta(days=1),
+                          freq=f"{int(model.params['refresh_days'])}D") if len(df) else []
+    bounds = np.searchsorted(df["Date/Time"].to_numpy(), np.asarray(edges, dtype="datetime64[ns]"), side="left")
+    scored = [model.update(df.iloc[a:b]) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    if len(bounds) and bounds[-1] < len(df):
+        scored.append(model.update(df.iloc[bounds[-1]:]))
+    scored = pd.concat(scored) if scored else df.assign(**{"Flow (L/h)": [], "Expected (L/h)": [], "Score": [], "Anomaly": []})
+    alerts = scored[scored["Anomaly"].astype(bool)].drop(columns="Anomaly").sort_values("Date/Time", kind="stable")
+    alerts["Hourly Consumption (Liters)"] = alerts["Consumption (Liters)"]
+    start, end = NIGHT_HOURS
+    night = alerts["Date/Time"].dt.hour.between(start, end)
+    return alerts[~night], alerts[night], model
+
+
+def refresh(df, path=CACHE_PATH, params=None):
+    """Load the cached model, add the readings it has not seen and save it back."""
+    model = BaselineProfile.load(path, params if params is not None else load_params())
+    model.update(df)
+    try:
+        model.save(path)
+    except OSError:
+        pass                        # read-only checkout: just don't cache
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hour-of-week baseline per meter and the readings it flags.")
+    parser.add_argument("--data", help="combined CSV (default: data/combined_water_data.csv)")
+    parser.add_argument("--rebuild", action="store_true", help="fit from scratch instead of refreshing the cache")
+    args = parser.parse_args()
+
+    import time
+    params = load_params()
+    df = load_combined(args.data) if args.data else load_combined()
+    t0 = time.perf_counter()
+    if args.rebuild:
+        spikes, nights, model = detect(df, params)
+        model.save()
+        print(f"✅ Baseline fitted on {len(df):,} readings in {time.perf_counter() - t0:.2f}s: "
+              f"{len(spikes)} spike and {len(nights)} night readings flagged")
+    else:
+        model = refresh(df, params=params)
+        print(f"✅ Baseline refreshed in {time.perf_counter() - t0:.2f}s → {CACHE_PATH}")
+    filled = (model.count >= params["min_samples"]).mean() if len(model) else 0
+    print(f"   {len(model)} meters, {filled:.0%} of hour-of-week cells scored")
+    for b, (flow, score, anomalous) in model.status().items():
+        print(f"   {b:<6} latest {flow:8.1f} L/h | score {score:6.2f}{'  ⚠️' if anomalous else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# benchmark.py
+import os, sys, json, time, argparse, platform, shutil, subprocess, tempfile
+from datetime import datetime
+import pandas as pd
+
+import synthetic_data
+
+# ——— CONFIGURATION ——————————————————————————————————————
+SCRIPTS_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPTS_DIR, ".."))
+TREND_PATH = os.path.join(PROJECT_ROOT, "benchmarks", "benchmark_trend.json")
+
+SCALES = [24, 240, 2400]
+STAGES = ["ingest", "rollup", "leak_detection", "forecast", "export", "dashboard_prep"]
+REGRESSION_TOLERANCE = 0.25   # flag stages more than 25% slower than the previous run
+# ————————————————————————————————————————————————————————
+
+
+def run_script(script, root, timeout):
+    """Run one pipeline script against the synthetic project, the way run_all.sh does."""
+    env = dict(os.environ, WMS_PROJECT_ROOT=root, MPLBACKEND="Agg")
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, script)],
+                          cwd=root, env=env, capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+
+
+def hourly_rollup(root):
+    """Hourly consumption per meter, as the overlay dashboards compute it."""
+    df = pd.read_csv(os.path.join(root, "data", "combined_water_data.csv"), parse_dates=["Date/Time"])
+    df["Hour"] = df["Date/Time"].dt.floor("h")
+    return df.groupby(["Building", "Hour"])["Consumption (Liters)"].max().diff().fillna(0)
+
+
+def dashboard_prep(root):
+    """Overview-tab data prep from enhanced_dashboard.py: load, clean, KPIs, latest values."""
+    df = pd.read_csv(os.path.join(root, "data", "combined_water_data.csv"), parse_dates=["Date/Time"])
+    df = df.sort_values(by=["Building", "Date/Time"]).reset_index(drop=True)
+    df["Consumption (Liters)"] = df["Consumption (Liters)"].clip(lower=0)
+    df["Hourly Consumption (Liters)"] = df.groupby("Building")["Consumption (Liters)"].diff().fillna(0).clip(lower=0)
+    now = df["Date/Time"].max()
+    df[df["Date/Time"] >= now - pd.Timedelta(hours=24)]["Hourly Consumption (Liters)"].sum()
+    df[df["Date/Time"] >= now - pd.Timedelta(days=7)]["Hourly Consumption (Liters)"].sum()
+    df.groupby("Building")["Hourly Consumption (Liters)"].last().to_dict()
+    df.set_index("Date/Time").resample("D")["Hourly Consumption (Liters)"].sum()
+
+
+STAGE_RUNNERS = {
+    "ingest":         lambda root, timeout: run_script("packet_to_combined_water_data.py", root, timeout),
+    "rollup":         lambda root, timeout: hourly_rollup(root),
+    "leak_detection": lambda root, timeout: run_script("leak_detection.py", root, timeout),
+    "forecast":       lambda root, timeout: run_script("forecast_demand.py", root, timeout),
+    "export":         lambda root, timeout: run_script("export_data.py", root, timeout),
+    "dashboard_prep": lambda root, timeout: dashboard_prep(root),
+}
+
+
+def bench_scale(n_meters, days, stages, timeout, keep):
+    """Generate a synthetic project for n_meters and time each stage against it."""
+    root = tempfile.mkdtemp(prefix=f"wms_bench_{n_meters}_")
+    try:
+        t0 = time.perf_counter()
+        summary = synthetic_data.write_project(root, n_meters, days, history_exports=False)
+        print(f"   → generated {summary['readings']} readings in {time.perf_counter() - t0:.1f}s")
+
+        results = {}
+        for stage in stages:
+            t0 = time.perf_counter()
+            try:
+                STAGE_RUNNERS[stage](root, timeout)
+                status = "ok"
+            except subprocess.TimeoutExpired:
+                status = "timeout"
+            except Exception as e:
+                status = f"error: {e}"
+            elapsed = time.perf_counter() - t0
+            results[stage] = {"seconds": round(elapsed, 3), "status": status}
+            mark = "✅" if status == "ok" else "❌"
+            print(f"   {mark} {stage:<15} {elapsed:8.2f}s  {'' if status == 'ok' else status}")
+        return {"readings": summary["readings"], "stages": results}
+    finally:
+        if keep:
+            print(f"   (kept synthetic project at {root})")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_trend(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"runs": []}
+
+
+def compare(previous, current):
+    """Print stages that got slower than REGRESSION_TOLERANCE versus the previous run."""
+    regressions = []
+    for scale, res in current["results"].items():
+        prev = previous["results"].get(scale, {}).get("stages", {})
+        for stage, cur in res["stages"].items():
+            old = prev.get(stage)
+            if not old or old["status"] != "ok" or cur["status"] != "ok" or old["seconds"] <= 0:
+                continue
+            change = cur["seconds"] / old["seconds"] - 1
+            if change > REGRESSION_TOLERANCE:
+                regressions.append((scale, stage, old["seconds"], cur["seconds"], change))
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} regression(s) versus run of {previous['timestamp']}:")
+        for scale, stage, old, cur, change in regressions:
+            print(f"   {scale:>5} meters  {stage:<15} {old:.2f}s → {cur:.2f}s (+{change:.0%})")
+    else:
+        print(f"\n✅ No regressions versus run of {previous['timestamp']}.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the pipeline stages on synthetic campus data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="meter counts to benchmark")
+    parser.add_argument("--days", type=int, default=14, help="days of synthetic history per scale")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--skip", nargs="+", default=[], choices=STAGES, help="stages to leave out")
+    parser.add_argument("--timeout", type=int, default=1800, help="per-stage timeout in seconds")
+    parser.add_argument("--trend", default=TREND_PATH, help="JSON trend file to append results to")
+    parser.add_argument("--keep", action="store_true", help="keep the generated project trees")
+    args = parser.parse_args()
+
+    stages = [s for s in args.stages if s not in args.skip]
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "days": args.days,
+        "results": {},
+    }
+    for scale in args.scales:
+        print(f"⏳ Benchmarking {scale} meters × {args.days} days")
+        run["results"][str(scale)] = bench_scale(scale, args.days, stages, args.timeout, args.keep)
+
+    trend = load_trend(args.trend)
+    if trend["runs"]:
+        compare(trend["runs"][-1], run)
+    trend["runs"].append(run)
+    os.makedirs(os.path.dirname(os.path.abspath(args.trend)), exist_ok=True)
+    with open(args.trend, "w") as f:
+        json.dump(trend, f, indent=2)
+    print(f"📈 Results appended to: {args.trend}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# columnar.py
+"""
+Compact binary export of the combined readings for the 3D twin.
+
+Layout (little-endian):
+
+    "WMSB" | u32 header length | JSON header | padding to 8 | column blocks
+
+The header lists the row count and, per column, its kind, dtype, byte offset
+and length (offsets from the first column block, each block 8-byte aligned so
+the decoder can view it as a typed array without copying):
+
+- time: epoch minutes, delta-encoded from `t0` in row order, zigzag LEB128
+  varints (one byte per row at a regular cadence);
+- dict: integer codes (uint8 / uint16) into the `values` list in the header,
+  used for the building, the source file and the quality flag;
+- f32: float32 values (consumption, totalizer).
+
+Rows keep the order of water_data.load_combined() (meter, then time), so the
+time deltas stay small. decode() is the Python reference decoder;
+3D_DT/src/columnar.ts is the one the twin uses.
+
+`python columnar.py --bench` compares size and parse time against the JSON
+export, on the campus data or on a synthetic campus.
+"""
+import os, io, gzip, json, time, struct, argparse
+import numpy as np
+import pandas as pd
+
+# ——— CONFIGURATION ——————————————————————————————————————
+MAGIC = b"WMSB"
+VERSION = 1
+ALIGN = 8
+# export column → (combined column, kind)
+COLUMNS = [
+    ("datetime", "Date/Time", "time"),
+    ("building", "Building", "dict"),
+    ("consumption", "Consumption (Liters)", "f32"),
+    ("totalizer", "Totalizer (Liters)", "f32"),
+    ("source", "Source File", "dict"),
+    ("quality", "Quality", "dict"),
+]
+# ————————————————————————————————————————————————————————
+
+EPOCH = pd.Timestamp("1970-01-01")
+
+
+def varint_encode(values):
+    """Zigzag LEB128 varints of an int64 array, as one uint8 array."""
+    v = np.asarray(values, dtype=np.int64)
+    z = ((v << 1) ^ (v >> 63)).astype(np.uint64)
+    n = np.ones(len(z), dtype=np.int64)
+    for k in range(1, 10):
+        n += z >= np.uint64(1 << (7 * k))
+    starts = np.cumsum(n) - n
+    out = np.zeros(int(n.sum()), dtype=np.uint8)
+    for k in range(int(n.max()) if len(n) else 0):
+        rows = n > k
+        byte = (z[rows] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(n[rows] - 1 > k, np.uint64(0x80), np.uint64(0))
+        out[starts[rows] + k] = byte
+    return out
+
+
+def varint_decode(data, count):
+    """int64 array of the first `count` varints in data."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(b < 0x80)[:count]
+    if not len(ends):
+        return np.zeros(0, dtype=np.int64)
+    b = b[:ends[-1] + 1]
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shift = (np.arange(len(b)) - np.repeat(starts, ends - starts + 1)) * 7
+    z = np.add.reduceat((b & 0x7F).astype(np.uint64) << shift.astype(np.uint64), starts)
+    return (z >> np.uint64(1)).astype(np.int64) ^ -(z & np.uint64(1)).astype(np.int64)
+
+
+def encode(df):
+    """Binary blob of a cleaned combined frame."""
+    header = {"version": VERSION, "rows": len(df), "columns": []}
+    blocks = []
+    for name, source, kind in COLUMNS:
+        if source not in df.columns:
+            continue
+        col = {"name": name, "kind": kind}
+        if kind == "time":
+            minutes = ((df[source] - EPOCH) // pd.Timedelta(minutes=1)).to_numpy(dtype=np.int64)
+            header["t0"] = int(minutes[0]) if len(minutes) else 0
+            data = varint_encode(np.diff(minutes, prepend=header["t0"]))
+            col["dtype"] = "varint"
+        elif kind == "dict":
+            codes, values = pd.factorize(df[source].astype(str).where(df[source].notna(), ""), sort=True)
+            dtype = np.uint8 if len(values) <= 256 else np.uint16 if len(values) <= 65536 else np.uint32
+            data = codes.astype(dtype)
+            col.update(dtype=np.dtype(dtype).name, values=[str(v) for v in values])
+        else:
+            data = df[source].to_numpy(dtype=np.float32)
+            col["dtype"] = "float32"
+        blocks.append(data.tobytes())
+        header["columns"].append(col)
+
+    offset = 0
+    for col, block in zip(header["columns"], blocks):
+        col.update(offset=offset, bytes=len(block))
+        offset += -(-len(block) // ALIGN) * ALIGN
+    head = json.dumps(header, separators=(",", ":")).encode()
+    start = -(-(8 + len(head)) // ALIGN) * ALIGN
+    out = io.BytesIO()
+    out.write(MAGIC + struct.pack("<I", len(head)) + head)
+    out.write(b"\0" * (start - out.tell()))
+    for col, block in zip(header["columns"], blocks):
+        out.seek(start + col["offset"])
+        out.write(block)
+    out.write(b"\0" * ((-out.tell()) % ALIGN))
+    return out.getvalue()
+
+
+def read_header(blob):
+    if blob[:4] != MAGIC:
+        raise ValueError("❌ Not a WMSB blob")
+    (length,) = struct.unpack_from("<I", blob, 4)
+    header = json.loads(blob[8:8 + length])
+    if header["version"] != VERSION:
+        raise ValueError(f"❌ Unsupported WMSB version {header['version']}")
+    return header, -(-(8 + length) // ALIGN) * ALIGN
+
+
+def decode(blob):
+    """DataFrame with the export columns (datetime, building, consumption, ...)."""
+    header, start = read_header(blob)
+    out = {}
+    for col in header["columns"]:
+        data = memoryview(blob)[start + col["offset"]:start + col["offset"] + col["bytes"]]
+        if col["kind"] == "time":
+            minutes = header["t0"] + np.cumsum(varint_decode(data, header["rows"]))
+            out[col["name"]] = EPOCH + pd.to_timedelta(minutes, unit="min")
+        elif col["kind"] == "dict":
+            out[col["name"]] = pd.Categorical.from_codes(np.frombuffer(data, dtype=col["dtype"]).astype(np.int64),
+                                                         categories=col["values"])
+        else:
+            out[col["name"]] = np.frombuffer(data, dtype=np.float32)
+    return pd.DataFrame(out)
+
+
+# --- BENCHMARK ---
+
+def json_records(df):
+    """The records export_data.py writes."""
+    return [{"datetime": t.isoformat(), "building": b, "consumption": c, "totalizer": z,
+             "meter_id": os.path.basename(str(s)).replace("Packet-", "").replace(".csv", "")}
+            for t, b, c, z, s in df[["Date/Time", "Building", "Consumption (Liters)", "Totalizer (Liters)",
+                                     "Source File"]].itertuples(index=False)]
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best or 1e9, time.perf_counter() - t0)
+    return result, best
+
+
+def bench(df, label):
+    records = json_records(df)
+    text, t_json_enc = timed(lambda: json.dumps(records, indent=2).encode())
+    compact = json.dumps(records, separators=(",", ":")).encode()
+    blob, t_bin_enc = timed(lambda: encode(df))
+    _, t_json_dec = timed(lambda: json.loads(text))
+    decoded, t_bin_dec = timed(lambda: decode(blob))
+
+    # what the twin sees is what was exported
+    assert (decoded["building"].astype(str).to_numpy() == df["Building"].astype(str).to_numpy()).all()
+    assert (decoded["datetime"].to_numpy() == df["Date/Time"].dt.floor("min").to_numpy()).all()
+    err = np.abs(decoded["totalizer"].to_numpy(dtype=float) - df["Totalizer (Liters)"].to_numpy(dtype=float)).max()
+
+    print(f"📦 {label}: {len(df):,} rows")
+    for name, data in (("JSON (indent=2)", text), ("JSON (compact)", compact), ("WMSB binary", blob)):
+        print(f"   {name:<16} {len(data) / 1e6:8.2f} MB  gzip {len(gzip.compress(data, 6)) / 1e6:7.2f} MB  "
+              f"{len(data) / max(len(df), 1):6.1f} B/row")
+    print(f"   encode: JSON {t_json_enc * 1000:.0f} ms, binary {t_bin_enc * 1000:.0f} ms | "
+          f"parse: JSON {t_json_dec * 1000:.0f} ms, binary {t_bin_dec * 1000:.1f} ms "
+          f"({t_json_dec / t_bin_dec:.0f}× faster) | max totalizer error {err:.3f} L (float32)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the WMSB binary export against the JSON export.")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--data", help="combined CSV (default: the project's)")
+    parser.add_argument("--meters", type=int, default=240, help="synthetic campus size for the second run")
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    from water_data import COMBINED_PATH, load_combined
+
+    if not args.bench:
+        parser.print_help()
+        return
+    bench(load_combined(args.data or COMBINED_PATH), os.path.basename(args.data or COMBINED_PATH))
+    if args.meters:
+        import synthetic_data
+        from water_data import clean_combined
+
+        readings, _ = synthetic_data.simulate(synthetic_data.make_meters(args.meters), args.days, seed=42)
+        readings["Source File"] = "Packet-synthetic.csv"
+        bench(clean_combined(readings), f"synthetic {args.meters} meters × {args.days} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# dashboard_benchmark.py
+import os, sys, json, time, argparse, platform, shutil, statistics, subprocess, tempfile
+from datetime import datetime
+
+import synthetic_data
+from benchmark import git_revision, load_trend, run_script
+
+# ——— CONFIGURATION ——————————————————————————————————————
+SCRIPTS_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPTS_DIR, ".."))
+DASHBOARD_DIR = os.path.join(PROJECT_ROOT, "dashboard")
+DIAGRAM_PATH = os.path.join(PROJECT_ROOT, "data", "deployment_diagram.png")
+TREND_PATH = os.path.join(PROJECT_ROOT, "benchmarks", "dashboard_startup_trend.json")
+
+PASSWORD = "water@123"   # same hard-coded admin password as the dashboards
+
+# Runs in a fresh interpreter per measurement so every sample is a cold start:
+# nothing imported, no st.cache_data entries. Streamlit's AppTest executes the
+# script headless; the authenticated run is what renders the Overview tab.
+CHILD = r"""
+import sys, time, json
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[3]))
+at.run()
+for box in at.text_input:
+    if box.label == "Enter password":
+        box.input(sys.argv[2]).run()
+        break
+t2 = time.perf_counter()
+print(json.dumps({"streamlit_import": t1 - t0, "first_paint": t2 - t1,
+                  "exceptions": [str(e.value)[:200] for e in at.exception],
+                  "modules": len(sys.modules)}))
+"""
+# ————————————————————————————————————————————————————————
+
+
+def prepare_project(root, meters, days, timeout):
+    """Synthetic project with alerts, the deployment diagram and a dashboard/ folder."""
+    synthetic_data.write_project(root, meters, days, history_exports=False)
+    run_script("leak_detection.py", root, timeout)
+    os.makedirs(os.path.join(root, "dashboard"), exist_ok=True)
+    shutil.copy(DIAGRAM_PATH, os.path.join(root, "data"))
+    shutil.copy(DIAGRAM_PATH, os.path.join(root, "dashboard"))
+
+
+def dashboard_source(name, ref):
+    """The dashboard file from the working tree, or as of a git ref."""
+    if ref is None:
+        with open(os.path.join(DASHBOARD_DIR, name), "r", encoding="utf-8") as f:
+            return f.read()
+    proc = subprocess.run(["git", "show", f"{ref}:dashboard/{name}"], cwd=PROJECT_ROOT,
+                          capture_output=True, text=True, encoding="utf-8")
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    return proc.stdout
+
+
+def measure(path, runs, timeout):
+    """Median cold-start timings over `runs` fresh processes."""
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", CHILD, path, PASSWORD, str(timeout)],
+                              cwd=os.path.dirname(path), capture_output=True, text=True, timeout=timeout,
+                              env=dict(os.environ, MPLBACKEND="Agg"))
+        wall = time.perf_counter() - t0
+        if proc.returncode != 0:
+            raise RuntimeError((proc.stderr.strip().splitlines() or [f"exit {proc.returncode}"])[-1])
+        sample = json.loads(proc.stdout.strip().splitlines()[-1])
+        sample["cold_start"] = wall
+        samples.append(sample)
+    result = {k: round(statistics.median(s[k] for s in samples), 3)
+              for k in ("cold_start", "streamlit_import", "first_paint", "modules")}
+    result["exceptions"] = samples[-1]["exceptions"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time to first paint of a dashboard's Overview tab.")
+    parser.add_argument("--dashboard", default="enhanced_dashboard.py", help="file in dashboard/ to measure")
+    parser.add_argument("--ref", nargs="*", default=[], help="git refs to compare against (e.g. HEAD~1)")
+    parser.add_argument("--meters", type=int, default=24)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per variant (median reported)")
+    parser.add_argument("--timeout", type=int, default=600)
+    parser.add_argument("--trend", default=TREND_PATH, help="JSON trend file to append results to")
+    parser.add_argument("--keep", action="store_true", help="keep the generated project tree")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="wms_dash_bench_")
+    try:
+        print(f"⏳ Preparing synthetic project ({args.meters} meters × {args.days} days) in {root}")
+        prepare_project(root, args.meters, args.days, args.timeout)
+
+        results = {}
+        for ref in args.ref + [None]:
+            label = ref or "working tree"
+            # each variant sits in <root>/dashboard/ so its PROJECT_ROOT resolves to the synthetic tree
+            path = os.path.join(root, "dashboard", f"bench_{len(results)}_{args.dashboard}")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(dashboard_source(args.dashboard, ref))
+            try:
+                results[label] = measure(path, args.runs, args.timeout)
+            except Exception as e:
+                results[label] = {"error": str(e)}
+                print(f"   ❌ {label}: {e}")
+                continue
+            r = results[label]
+            print(f"   ✅ {label:<14} cold start {r['cold_start']:6.2f}s | streamlit import {r['streamlit_import']:5.2f}s"
+                  f" | first paint {r['first_paint']:6.2f}s | {r['modules']:.0f} modules loaded")
+            for e in r["exceptions"]:
+                print(f"      ⚠️ dashboard raised: {e}")
+    finally:
+        if args.keep:
+            print(f"   (kept synthetic project at {root})")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    trend = load_trend(args.trend)
+    trend["runs"].append({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "dashboard": args.dashboard,
+        "meters": args.meters,
+        "days": args.days,
+        "results": results,
+    })
+    os.makedirs(os.path.dirname(os.path.abspath(args.trend)), exist_ok=True)
+    with open(args.trend, "w") as f:
+        json.dump(trend, f, indent=2)
+    print(f"📈 Results appended to: {args.trend}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# figures.py
+"""
+Figure rendering shared by the plotting stages.
+
+Stages hand over small, pre-aggregated frames (daily totals, hour-of-day
+means, per-meter quantiles, forecast bands), never the raw readings, so the
+cost of drawing does not grow with history. render() hashes each figure's
+input, skips figures whose input and output file are unchanged since the last
+run, and draws the rest in worker processes with the Agg backend.
+"""
+import os, json, hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from water_data import atomic_write
+
+# ——— CONFIGURATION ——————————————————————————————————————
+STATE_FILE = ".figures.json"        # per output folder: figure → input digest
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+ANNOT_MAX_CELLS = 600               # heatmaps larger than this are drawn without cell labels
+MAX_LEGEND = 30                     # line plots with more buildings than this get no legend
+# ————————————————————————————————————————————————————————
+
+
+def digest(*frames):
+    """Content hash of the frames a figure is drawn from."""
+    h = hashlib.sha256()
+    for frame in frames:
+        h.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        h.update(",".join(map(str, frame.columns)).encode())
+    return h.hexdigest()
+
+
+def job_key(job):
+    """Digest of a figure's input frames (job["inputs"] when given), its other arguments and the drawing code."""
+    frames = job.get("inputs") or [a for a in job["args"] if isinstance(a, pd.DataFrame)]
+    rest = [a for a in job["args"] if not isinstance(a, pd.DataFrame)] + sorted(job.get("kwargs", {}).items())
+    h = hashlib.sha256(digest(*frames).encode())
+    h.update(repr((job["draw"].__name__, rest)).encode())
+    h.update(_code_digest())
+    return h.hexdigest()
+
+
+def _code_digest():
+    """Editing the drawing code redraws every figure."""
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def box_stats(df, by, value):
+    """Per-group boxplot statistics (quartiles, 1.5 IQR whiskers) in the form Axes.bxp() takes."""
+    grouped = df.groupby(by)[value]
+    q = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    iqr = q[0.75] - q[0.25]
+    lo, hi = df[by].map(q[0.25] - 1.5 * iqr), df[by].map(q[0.75] + 1.5 * iqr)
+    low = df[value].where(df[value] >= lo).groupby(df[by]).min()
+    high = df[value].where(df[value] <= hi).groupby(df[by]).max()
+    return pd.DataFrame({"q1": q[0.25], "med": q[0.5], "q3": q[0.75], "whislo": low, "whishi": high}).reset_index()
+
+
+# --- FIGURES (run in the worker processes) ---
+
+def _savefig(fig, path):
+    """Save atomically, so a dashboard never shows a half-written image."""
+    with atomic_write(path, "wb") as f:
+        fig.savefig(f, format=os.path.splitext(path)[1].lstrip(".") or "png")
+
+
+def _setup():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    sns.set(style="whitegrid")
+    return plt, sns
+
+
+def lines_by_building(data, path, x, y, title, figsize=(12, 6), rotate=False):
+    """One line per building; the data is already one row per (x, building), so no estimator is needed."""
+    plt, sns = _setup()
+    wide = data.pivot(index=x, columns="Building", values=y).sort_index()
+    fig, ax = plt.subplots(figsize=figsize)
+    colors = sns.color_palette(n_colors=wide.shape[1]) if wide.shape[1] <= 10 else sns.color_palette("husl", wide.shape[1])
+    ax.set_prop_cycle(color=colors)
+    ax.plot(wide.index, wide.to_numpy(), marker="o", markersize=4 if wide.shape[1] <= MAX_LEGEND else 2)
+    if wide.shape[1] <= MAX_LEGEND:
+        ax.legend(wide.columns, title="Building", fontsize="small", bbox_to_anchor=(1.01, 1), loc="upper left")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.set_title(title)
+    if rotate:
+        plt.setp(ax.get_xticklabels(), rotation=45)
+    fig.tight_layout()
+    _savefig(fig, path)
+    plt.close(fig)
+
+
+def boxplot(stats, path, ylabel, title):
+    plt, _ = _setup()
+    fig, ax = plt.subplots(figsize=(10, 6))
+    boxes = [{"label": row["Building"], "q1": row["q1"], "med": row["med"], "q3": row["q3"],
+              "whislo": row["whislo"], "whishi": row["whishi"]} for _, row in stats.iterrows()]
+    ax.bxp(boxes, showfliers=False, patch_artist=True, boxprops={"facecolor": "#8fb8de"})
+    ax.set_xlabel("Building")
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    if len(boxes) > 30:
+        ax.tick_params(axis="x", labelrotation=90, labelsize=6)
+    elif len(boxes) > 12:
+        ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    _savefig(fig, path)
+    plt.close(fig)
+
+
+def heatmap(pivot, path, title):
+    plt, sns = _setup()
+    plt.figure(figsize=(12, 6))
+    sns.heatmap(pivot, cmap="YlGnBu", annot=pivot.size <= ANNOT_MAX_CELLS, fmt=".1f")
+    plt.title(title)
+    plt.tight_layout()
+    _savefig(plt.gcf(), path)
+    plt.close()
+
+
+def forecast(history, predicted, path, title):
+    """History points and the forecast with its uncertainty band (the layout of Prophet's own plot)."""
+    plt, _ = _setup()
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(history["ds"], history["y"], "k.", label="Observed")
+    ax.plot(predicted["ds"], predicted["yhat"], ls="-", c="#0072B2", label="Forecast")
+    ax.fill_between(predicted["ds"], predicted["yhat_lower"], predicted["yhat_upper"], color="#0072B2", alpha=0.2)
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Liters")
+    ax.legend(loc="upper left")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    _savefig(fig, path)
+    plt.close(fig)
+
+
+def _draw(job):
+    job["draw"](*job["args"], job["path"], **job.get("kwargs", {}))
+    return job["path"]
+
+
+# --- RENDERING ---
+
+def render(jobs, metrics=None, workers=MAX_WORKERS):
+    """
+    Draw the jobs whose input changed. Each job is a dict with path, draw (a
+    function above), args (the frames it plots, then nothing but plain
+    values), optional kwargs and optional inputs (the frames that decide
+    whether it is redrawn, when not all of args). Returns (drawn, skipped)
+    file lists.
+    """
+    states = {}
+    todo, skipped = [], []
+    for job in jobs:
+        folder, name = os.path.split(job["path"])
+        state = states.setdefault(folder, _load_state(folder))
+        key = job_key(job)
+        if state.get(name) == key and os.path.exists(job["path"]):
+            skipped.append(job["path"])
+            continue
+        job["key"] = key
+        todo.append(job)
+
+    if len(todo) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            drawn = list(pool.map(_draw, todo))
+    else:
+        drawn = [_draw(job) for job in todo]
+
+    for job in todo:
+        folder, name = os.path.split(job["path"])
+        states[folder][name] = job["key"]
+        if metrics is not None:
+            metrics.wrote(job["path"])
+    for folder, state in states.items():
+        _save_state(folder, state)
+    return drawn, skipped
+
+
+def _load_state(folder):
+    try:
+        with open(os.path.join(folder, STATE_FILE), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_state(folder, state):
+    os.makedirs(folder, exist_ok=True)
+    with atomic_write(os.path.join(folder, STATE_FILE)) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
@@ -1,128 +1,180 @@
 import pandas as pd
-from prophet import Prophet
-import yaml
-import datetime
-import matplotlib.pyplot as plt
 import os
 import numpy as np # Import numpy for numerical operations
 
+import figures
+import readings_db
+import retention
+from instrumentation import start_stage
+from water_data import load_combined, load_config, write_csv
+
 # --- Config ---
 # Ensure this path is correct for your environment
-PROJECT_ROOT = "/home/iiitb/campus_digital_twin"
+# WMS_PROJECT_ROOT lets the benchmark harness point the script at a synthetic project tree
+PROJECT_ROOT = os.environ.get("WMS_PROJECT_ROOT", "/home/iiitb/campus_digital_twin")
 CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.yaml")
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "combined_water_data.csv")
 FORECAST_PATH = os.path.join(PROJECT_ROOT, "data", "demand_forecast.csv")
 PLOTS_DIR = os.path.join(PROJECT_ROOT, "plots")
 
-os.makedirs(PLOTS_DIR, exist_ok=True)
-print("--- Starting Demand Forecasting ---")
-
-# --- Load config ---
-try:
-    with open(CONFIG_PATH, "r") as f:
-        config = yaml.safe_load(f)
-except FileNotFoundError:
-    print(f"❌ Error: 'config.yaml' not found at {CONFIG_PATH}.")
-    print("Please ensure config.yaml exists and is accessible.")
-    exit()
-except Exception as e:
-    print(f"❌ Error loading config.yaml: {e}")
-    exit()
-
-forecast_days = config.get("forecast_days", 3) # Default to 3 days if not specified in config
-buildings = config.get("buildings", []) # Default to empty list if not specified
-
-if not buildings:
-    print("⚠️ No buildings specified in config.yaml. Please define 'buildings' list.")
-    exit()
-
-print(f"Forecasting for the next {forecast_days} days.")
-
-# --- Load and preprocess data ---
-try:
-    df = pd.read_csv(DATA_PATH, parse_dates=["Date/Time"])
-    print(f"Successfully loaded {len(df)} records from {DATA_PATH}.")
-except FileNotFoundError:
-    print(f"❌ Error: 'combined_water_data.csv' not found at {DATA_PATH}.")
-    print("Please ensure your data aggregation scripts have been run to generate this file.")
-    exit()
-except Exception as e:
-    print(f"❌ Error loading or parsing data: {e}")
-    exit()
-
-df["Date/Time"] = pd.to_datetime(df["Date/Time"], errors='coerce')
-df.dropna(subset=['Date/Time'], inplace=True)
-df["Date"] = df["Date/Time"].dt.date
-
-# Ensure 'Consumption (Liters)' is non-negative before summing
-df['Consumption (Liters)'] = df['Consumption (Liters)'].apply(lambda x: max(0, x))
-
-# --- Group daily consumption per building ---
-daily = df.groupby(["Building", "Date"])["Consumption (Liters)"].sum().reset_index()
-
-# --- Forecast and plot ---
-results = []
-
-for building in buildings:
-    print(f"⏳ Processing forecast for: {building}")
-    bdf = daily[daily["Building"] == building].copy()
-    if bdf.empty:
-        print(f"⚠️ No historical data for building: {building}. Skipping forecast.")
-        continue
-
-    # Prophet requires 'ds' (datestamp) and 'y' (value)
-    bdf.rename(columns={"Date": "ds", "Consumption (Liters)": "y"}, inplace=True)
-    bdf["ds"] = pd.to_datetime(bdf["ds"])
-
-    # Prophet model
-    model = Prophet(
-        seasonality_mode='multiplicative', # Good for consumption data where seasonality scales with trend
-        weekly_seasonality=True,
-        daily_seasonality=False # Daily seasonality often captured by hourly if data is granular enough
-    )
-    # Add yearly seasonality if you have more than a year of data
-    # model.add_seasonality(name='yearly', period=365.25, fourier_order=10)
-    # model.add_seasonality(name='weekly', period=7, fourier_order=3) # Already enabled by weekly_seasonality=True
-
-    model.fit(bdf)
-
-    future = model.make_future_dataframe(periods=forecast_days, include_history=False) # Only future dates
-    if future.empty:
-        print(f"⚠️ Could not generate future dataframe for {building}. Skipping forecast.")
-        continue
-
-    forecast = model.predict(future)
-
-    # Ensure forecasts are non-negative
-    forecast["yhat"] = np.maximum(0, forecast["yhat"])
-    forecast["yhat_lower"] = np.maximum(0, forecast["yhat_lower"])
-    forecast["yhat_upper"] = np.maximum(0, forecast["yhat_upper"])
-
-
-    # Plot and save
-    fig = model.plot(forecast, xlabel="Date", ylabel="Forecasted Liters")
-    plt.title(f"Water Consumption Forecast: {building}")
-    plt.xlabel("Date")
-    plt.ylabel("Liters")
-    fig.savefig(os.path.join(PLOTS_DIR, f"{building}_forecast.png"))
-    plt.close(fig) # Close the figure to free memory
-
-    # Store forecast results
-    forecast_current_building = forecast[["ds", "yhat"]].copy()
-    forecast_current_building["Building"] = building
-    forecast_current_building.rename(columns={"ds": "Date", "yhat": "Forecast (Liters)"}, inplace=True)
-    forecast_current_building["Forecast (Liters)"] = forecast_current_building["Forecast (Liters)"].round(2)
-    results.append(forecast_current_building)
-
-# --- Save all forecasts to CSV ---
-if results:
-    forecast_df = pd.concat(results)
-    forecast_df.to_csv(FORECAST_PATH, index=False)
-    print(f"✅ Forecast complete. Results saved to:\n→ {FORECAST_PATH}")
-else:
-    print("⚠️ No forecasts generated for any building. 'demand_forecast.csv' will be empty or not updated.")
-    # Ensure an empty but correctly structured CSV is created if no forecasts
-    pd.DataFrame(columns=['Date', 'Forecast (Liters)', 'Building']).to_csv(FORECAST_PATH, index=False)
-
-
-print(f"🖼️ Plots saved to folder:\n→ {PLOTS_DIR}")
+
+def daily_totals(df=None, daily=None):
+    """
+    Daily consumption per building over the whole history: the readings of the
+    combined file (already clipped to be non-negative by water_data.clean_combined)
+    or their `daily` totals, after the daily rollups of the archived readings (retention.py).
+    """
+    if daily is None:
+        daily = retention.rollup(df, "D")
+    daily = retention.with_archive(daily, "daily")
+    return daily.assign(Date=daily["Date/Time"].dt.date)[["Building", "Date", "Consumption (Liters)"]]
+
+
+def run(df, metrics, config=None, daily=None):
+    """
+    Pipeline stage: fit one Prophet model per configured building on daily
+    totals of the cleaned combined data (or on `daily` when the caller already
+    has them, e.g. from readings_db), save forecasts and forecast plots.
+    """
+    # Prophet is only imported when this stage actually runs
+    from prophet import Prophet
+
+    if config is None:
+        config = load_config(CONFIG_PATH)
+    forecast_days = config.get("forecast_days", 3) # Default to 3 days if not specified in config
+    buildings = config.get("buildings", []) # Default to empty list if not specified
+
+    if not buildings:
+        print("⚠️ No buildings specified in config.yaml. Please define 'buildings' list.")
+        return None
+
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+    print(f"Forecasting for the next {forecast_days} days.")
+
+    # --- Group daily consumption per building ---
+    if daily is None:
+        daily = daily_totals(df)
+
+    # --- Forecast and plot ---
+    results = []
+    plot_jobs = []
+
+    for building in buildings:
+        print(f"⏳ Processing forecast for: {building}")
+        bdf = daily[daily["Building"] == building].copy()
+        if bdf.empty:
+            print(f"⚠️ No historical data for building: {building}. Skipping forecast.")
+            continue
+
+        # Prophet requires 'ds' (datestamp) and 'y' (value)
+        bdf.rename(columns={"Date": "ds", "Consumption (Liters)": "y"}, inplace=True)
+        bdf["ds"] = pd.to_datetime(bdf["ds"])
+
+        # Prophet model
+        model = Prophet(
+            seasonality_mode='multiplicative', # Good for consumption data where seasonality scales with trend
+            weekly_seasonality=True,
+            daily_seasonality=False # Daily seasonality often captured by hourly if data is granular enough
+        )
+        # Add yearly seasonality if you have more than a year of data
+        # model.add_seasonality(name='yearly', period=365.25, fourier_order=10)
+        # model.add_seasonality(name='weekly', period=7, fourier_order=3) # Already enabled by weekly_seasonality=True
+
+        with metrics.step("prophet_fit"):
+            model.fit(bdf)
+
+        future = model.make_future_dataframe(periods=forecast_days, include_history=False) # Only future dates
+        if future.empty:
+            print(f"⚠️ Could not generate future dataframe for {building}. Skipping forecast.")
+            continue
+
+        with metrics.step("prophet_predict"):
+            forecast = model.predict(future)
+
+        # Ensure forecasts are non-negative
+        forecast["yhat"] = np.maximum(0, forecast["yhat"])
+        forecast["yhat_lower"] = np.maximum(0, forecast["yhat_lower"])
+        forecast["yhat_upper"] = np.maximum(0, forecast["yhat_upper"])
+
+        # Plots are drawn after the loop, in parallel, from the history and forecast band only
+        plot_jobs.append({
+            "path": os.path.join(PLOTS_DIR, f"{building}_forecast.png"), "draw": figures.forecast,
+            "args": [bdf[["ds", "y"]].reset_index(drop=True),
+                     forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].reset_index(drop=True)],
+            "kwargs": {"title": f"Water Consumption Forecast: {building}"},
+            # the uncertainty band is sampled anew on every fit; the history decides whether to redraw
+            "inputs": [bdf[["ds", "y"]].reset_index(drop=True)],
+        })
+
+        # Store forecast results
+        forecast_current_building = forecast[["ds", "yhat"]].copy()
+        forecast_current_building["Building"] = building
+        forecast_current_building.rename(columns={"ds": "Date", "yhat": "Forecast (Liters)"}, inplace=True)
+        forecast_current_building["Forecast (Liters)"] = forecast_current_building["Forecast (Liters)"].round(2)
+        results.append(forecast_current_building)
+
+    with metrics.step("plot"):
+        drawn, skipped = figures.render(plot_jobs, metrics)
+
+    # --- Save all forecasts to CSV ---
+    if results:
+        forecast_df = pd.concat(results)
+        write_csv(forecast_df, FORECAST_PATH, index=False)
+        metrics.wrote(FORECAST_PATH, rows=len(forecast_df))
+        print(f"✅ Forecast complete. Results saved to:\n→ {FORECAST_PATH}")
+    else:
+        print("⚠️ No forecasts generated for any building. 'demand_forecast.csv' will be empty or not updated.")
+        # Ensure an empty but correctly structured CSV is created if no forecasts
+        forecast_df = pd.DataFrame(columns=['Date', 'Forecast (Liters)', 'Building'])
+        write_csv(forecast_df, FORECAST_PATH, index=False)
+    readings_db.write_through(tables=["demand_forecast"])
+
+    print(f"🖼️ Plots saved to folder ({len(drawn)} drawn, {len(skipped)} unchanged):\n→ {PLOTS_DIR}")
+    return forecast_df
+
+
+def main():
+    metrics = start_stage("forecast_demand")
+    print("--- Starting Demand Forecasting ---")
+
+    # --- Load config ---
+    try:
+        config = load_config(CONFIG_PATH)
+    except FileNotFoundError:
+        print(f"❌ Error: 'config.yaml' not found at {CONFIG_PATH}.")
+        print("Please ensure config.yaml exists and is accessible.")
+        exit()
+    except Exception as e:
+        print(f"❌ Error loading config.yaml: {e}")
+        exit()
+
+    # --- Daily totals straight from the database when it mirrors the combined file ---
+    with metrics.step("read_sql"):
+        daily = readings_db.load_totals("D", buildings=config.get("buildings") or None)
+    if daily is not None:
+        print(f"Loaded {len(daily)} daily totals from {readings_db.load_params()['path']}.")
+        daily = daily_totals(daily=daily)
+        if run(None, metrics, config, daily=daily) is None:
+            exit()
+        metrics.finish()
+        return
+
+    # --- Load and preprocess data ---
+    try:
+        df = load_combined(DATA_PATH, metrics)
+        print(f"Successfully loaded {len(df)} records from {DATA_PATH}.")
+    except FileNotFoundError:
+        print(f"❌ Error: 'combined_water_data.csv' not found at {DATA_PATH}.")
+        print("Please ensure your data aggregation scripts have been run to generate this file.")
+        exit()
+    except Exception as e:
+        print(f"❌ Error loading or parsing data: {e}")
+        exit()
+
+    if run(df, metrics, config) is None:
+        exit()
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
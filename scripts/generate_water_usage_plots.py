@@ -1,58 +1,101 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 
-# Set style
-sns.set(style="whitegrid")
+import figures
+import retention
+from instrumentation import start_stage
+from water_data import load_combined
 
 # === File Path ===
-csv_path = r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\data\combined_water_data.csv"
-
-# === Load and Clean Data ===
-df = pd.read_csv(csv_path)
-df["Date/Time"] = pd.to_datetime(df["Date/Time"])
-df["Date"] = df["Date/Time"].dt.date
-df["Hour"] = df["Date/Time"].dt.hour
+PROJECT_ROOT = os.environ.get("WMS_PROJECT_ROOT", r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin")
+csv_path = os.path.join(PROJECT_ROOT, "data", "combined_water_data.csv")
 
 # === Output Folder ===
-output_dir = "water_usage_plots"
-os.makedirs(output_dir, exist_ok=True)
-
-# === 1. Daily Water Usage by Building ===
-plt.figure(figsize=(12, 6))
-daily_usage = df.groupby(["Date", "Building"])["Consumption (Liters)"].sum().reset_index()
-sns.lineplot(data=daily_usage, x="Date", y="Consumption (Liters)", hue="Building", marker="o")
-plt.title("📈 Daily Water Consumption per Building")
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig(os.path.join(output_dir, "daily_consumption_by_building.png"))
-plt.close()
-
-# === 2. Hourly Usage Pattern (Average by Building) ===
-plt.figure(figsize=(10, 6))
-hourly_avg = df.groupby(["Hour", "Building"])["Consumption (Liters)"].mean().reset_index()
-sns.lineplot(data=hourly_avg, x="Hour", y="Consumption (Liters)", hue="Building", marker="o")
-plt.title("🕓 Average Hourly Consumption Pattern")
-plt.tight_layout()
-plt.savefig(os.path.join(output_dir, "hourly_avg_by_building.png"))
-plt.close()
-
-# === 3. Boxplot: Distribution of Usage per Building ===
-plt.figure(figsize=(10, 6))
-sns.boxplot(data=df, x="Building", y="Consumption (Liters)")
-plt.title("📦 Consumption Distribution by Building")
-plt.tight_layout()
-plt.savefig(os.path.join(output_dir, "boxplot_consumption.png"))
-plt.close()
-
-# === 4. Heatmap of Hourly Usage (Building x Hour) ===
-pivot = df.groupby(["Building", "Hour"])["Consumption (Liters)"].mean().unstack()
-plt.figure(figsize=(12, 6))
-sns.heatmap(pivot, cmap="YlGnBu", annot=True, fmt=".1f")
-plt.title("🌡️ Avg Hourly Water Usage (Heatmap)")
-plt.tight_layout()
-plt.savefig(os.path.join(output_dir, "heatmap_hourly_usage.png"))
-plt.close()
-
-print("✅ Graphs saved in:", os.path.abspath(output_dir))
+output_dir = os.path.join(PROJECT_ROOT, "water_usage_plots")
+
+# The boxplot shows hourly totals of this many most recent days, so its quartiles cost the same at any history length
+BOX_WINDOW_DAYS = 30
+
+
+def rollups(df):
+    """
+    The small frames the figures are drawn from, in one pass over the readings:
+    daily totals, hour-of-day means, per-meter quartiles of the hourly totals of the
+    last BOX_WINDOW_DAYS and the Building × Hour pivot.
+    Readings already archived by retention.py come in as their stored rollups,
+    so the figures keep the whole history after compaction.
+    """
+    hour = df["Date/Time"].dt.floor("h")
+    hourly = (df.groupby(["Building", hour])["Consumption (Liters)"].agg(["sum", "count"])
+              .reset_index().rename(columns={"Date/Time": "Hour"}))
+    hourly["Date"] = hourly["Hour"].dt.normalize()
+
+    recent = (hourly.groupby(["Date", "Building"])[["sum", "count"]].sum().reset_index()
+              .rename(columns={"Date": "Date/Time", "sum": "Consumption (Liters)", "count": "Readings"}))
+    daily = retention.with_archive(recent.assign(**{"Totalizer (Liters)": float("nan")}), "daily")
+    daily = daily.rename(columns={"Date/Time": "Date"})[["Date", "Building", "Consumption (Liters)"]]
+
+    archived = retention.archived_totals("hourly", hourly["Hour"].min() if len(hourly) else None)
+    if len(archived):               # (an empty frame would turn the sums into objects)
+        archived = archived.rename(columns={"Date/Time": "Hour", "Consumption (Liters)": "sum", "Readings": "count"})
+        hourly = pd.concat([archived[["Building", "Hour", "sum", "count"]], hourly[["Building", "Hour", "sum", "count"]]],
+                           ignore_index=True)
+    hourly["Hour of Day"] = hourly["Hour"].dt.hour
+
+    by_hour = hourly.groupby(["Building", "Hour of Day"])[["sum", "count"]].sum()
+    mean = (by_hour["sum"] / by_hour["count"]).rename("Consumption (Liters)")
+    hourly_avg = mean.reset_index().rename(columns={"Hour of Day": "Hour"})[["Hour", "Building", "Consumption (Liters)"]]
+    pivot = mean.unstack("Hour of Day")
+    pivot.columns.name = "Hour"
+    recent_hours = hourly[hourly["Hour"] > hourly["Hour"].max() - pd.Timedelta(days=BOX_WINDOW_DAYS)]
+    return {"daily": daily, "hourly_avg": hourly_avg, "pivot": pivot,
+            "box": figures.box_stats(recent_hours, "Building", "sum")}
+
+
+def run(df, metrics):
+    """
+    Pipeline stage: render the four usage overview plots from rollups of the
+    cleaned combined data; figures whose rollup is unchanged are not redrawn.
+    """
+    with metrics.step("rollups"):
+        r = rollups(df[["Date/Time", "Building", "Consumption (Liters)"]])
+
+    path = lambda name: os.path.join(output_dir, name)
+    jobs = [
+        # === 1. Daily Water Usage by Building ===
+        {"path": path("daily_consumption_by_building.png"), "draw": figures.lines_by_building,
+         "args": [r["daily"]], "kwargs": {"x": "Date", "y": "Consumption (Liters)", "rotate": True,
+                                          "title": "📈 Daily Water Consumption per Building"}},
+        # === 2. Hourly Usage Pattern (Average by Building) ===
+        {"path": path("hourly_avg_by_building.png"), "draw": figures.lines_by_building,
+         "args": [r["hourly_avg"]], "kwargs": {"x": "Hour", "y": "Consumption (Liters)", "figsize": (10, 6),
+                                               "title": "🕓 Average Hourly Consumption Pattern"}},
+        # === 3. Boxplot: Distribution of Hourly Usage per Building (recent window, quartiles, no outlier points) ===
+        {"path": path("boxplot_consumption.png"), "draw": figures.boxplot,
+         "args": [r["box"]], "kwargs": {"ylabel": "Consumption per hour (Liters)",
+                                        "title": f"📦 Hourly Consumption Distribution by Building "
+                                                 f"(last {BOX_WINDOW_DAYS} days)"}},
+        # === 4. Heatmap of Hourly Usage (Building x Hour) ===
+        {"path": path("heatmap_hourly_usage.png"), "draw": figures.heatmap,
+         "args": [r["pivot"]], "kwargs": {"title": "🌡️ Avg Hourly Water Usage (Heatmap)"}},
+    ]
+    os.makedirs(output_dir, exist_ok=True)
+    with metrics.step("render"):
+        drawn, skipped = figures.render(jobs, metrics)
+
+    print(f"✅ Graphs saved in: {os.path.abspath(output_dir)} "
+          f"({len(drawn)} drawn, {len(skipped)} unchanged)")
+    return drawn
+
+
+def main():
+    metrics = start_stage("generate_water_usage_plots")
+
+    # === Load and Clean Data ===
+    df = load_combined(csv_path, metrics)
+    run(df, metrics)
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
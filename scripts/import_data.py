@@ -3,6 +3,10 @@ import glob
 import os
 import yaml
 
+from instrumentation import start_stage
+
+metrics = start_stage("import_data")
+
 # Load config
 with open(r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\config.yaml", "r") as f:
     config = yaml.safe_load(f)
@@ -22,6 +26,7 @@ for building in buildings:
     for file in files:
         try:
             df = pd.read_csv(file)
+            metrics.read(file, rows=len(df))
             df["Building"] = building
             df["Source File"] = os.path.basename(file)
             all_data.append(df)
@@ -35,7 +40,10 @@ if all_data:
     combined_df = combined_df.sort_values(by=["Building", "Date/Time"])
 
     # Save cleaned dataset
-    combined_df.to_csv(r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\data\combined_water_data.csv", index=False)
+    output_path = r"C:\Users\maila\OneDrive\Desktop\campus_digital_twin\data\combined_water_data.csv"
+    combined_df.to_csv(output_path, index=False)
+    metrics.wrote(output_path, rows=len(combined_df))
     print("✅ Combined data saved to data/combined_water_data.csv")
 else:
     print("⚠️ No data files found.")
+metrics.finish()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# instrumentation.py
+import os, sys, json, time, atexit, cProfile
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# ——— CONFIGURATION ——————————————————————————————————————
+# WMS_METRICS_PATH  JSON-lines file every stage run is appended to
+# WMS_METRICS_PROM  directory for Prometheus text-format files (node_exporter textfile collector)
+# WMS_PROFILE=1     (or --profile on the command line) dump a cProfile per stage to WMS_PROFILE_DIR
+# WMS_RUN_ID        groups the stages of one run_all.sh cycle
+PROJECT_ROOT = os.path.abspath(os.environ.get("WMS_PROJECT_ROOT", os.path.join(os.path.dirname(__file__), "..")))
+METRICS_PATH = os.environ.get("WMS_METRICS_PATH", os.path.join(PROJECT_ROOT, "data", "pipeline_metrics.jsonl"))
+PROM_DIR = os.environ.get("WMS_METRICS_PROM")
+PROFILE_DIR = os.environ.get("WMS_PROFILE_DIR", os.path.join(PROJECT_ROOT, "profiles"))
+# ————————————————————————————————————————————————————————
+
+
+def profiling_enabled():
+    return os.environ.get("WMS_PROFILE", "") not in ("", "0") or "--profile" in sys.argv
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def cpu_seconds():
+    """CPU time of this process plus finished children (Prophet runs cmdstan as a child)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class StageMetrics:
+    """Wall/CPU time, peak RSS, row and byte counts for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.steps = {}
+        self.finished = False
+        self._wall0 = time.perf_counter()
+        self._cpu0 = cpu_seconds()
+        self._profiler = None
+        if profiling_enabled():
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    # --- accounting -----------------------------------------------------
+    def read(self, path, rows=None):
+        """Count a file read by the stage (size taken from disk)."""
+        self.bytes_read += _file_size(path)
+        if rows is not None:
+            self.rows_in += int(rows)
+
+    def wrote(self, path, rows=None):
+        """Count a file written by the stage (size taken from disk)."""
+        self.bytes_written += _file_size(path)
+        if rows is not None:
+            self.rows_out += int(rows)
+
+    @contextmanager
+    def step(self, name):
+        """Time a sub-step; repeated steps (e.g. one Prophet fit per building) accumulate."""
+        wall0, cpu0 = time.perf_counter(), cpu_seconds()
+        try:
+            yield
+        finally:
+            s = self.steps.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+            s["wall_seconds"] += time.perf_counter() - wall0
+            s["cpu_seconds"] += cpu_seconds() - cpu0
+            s["calls"] += 1
+
+    # --- reporting ------------------------------------------------------
+    def finish(self, status="ok"):
+        """Stop the clocks and write the record; later calls are no-ops."""
+        if self.finished:
+            return None
+        self.finished = True
+        profile_path = None
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            profile_path = os.path.join(PROFILE_DIR, f"{self.name}-{stamp}.prof")
+            self._profiler.dump_stats(profile_path)
+
+        record = {
+            "run_id": os.environ.get("WMS_RUN_ID"),
+            "stage": self.name,
+            "started_at": self.started_at,
+            "status": status,
+            "wall_seconds": round(time.perf_counter() - self._wall0, 3),
+            "cpu_seconds": round(cpu_seconds() - self._cpu0, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "steps": {k: {"wall_seconds": round(v["wall_seconds"], 3),
+                          "cpu_seconds": round(v["cpu_seconds"], 3),
+                          "calls": v["calls"]} for k, v in self.steps.items()},
+            "profile": profile_path,
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(METRICS_PATH)), exist_ok=True)
+            with open(METRICS_PATH, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            if PROM_DIR:
+                write_prometheus(record, PROM_DIR)
+        except OSError as e:
+            print(f"⚠️ Could not write stage metrics: {e}")
+        return record
+
+
+def start_stage(name):
+    """
+    Start measuring a stage. Call .finish() at the end of the script. A script
+    that dies on an uncaught exception is recorded with status "error" (or
+    "interrupted" on Ctrl-C); one that exits early on purpose (e.g. exit() on
+    a missing file) is recorded at interpreter shutdown as "exited_early".
+    """
+    metrics = StageMetrics(name)
+    previous = sys.excepthook
+
+    def excepthook(exc_type, exc, tb):
+        metrics.finish("interrupted" if issubclass(exc_type, KeyboardInterrupt) else "error")
+        previous(exc_type, exc, tb)
+
+    sys.excepthook = excepthook
+    atexit.register(metrics.finish, "exited_early")
+    return metrics
+
+
+@contextmanager
+def stage(name):
+    """Context-manager form of start_stage for code that is already in functions."""
+    metrics = StageMetrics(name)
+    try:
+        yield metrics
+    except BaseException:
+        metrics.finish("error")
+        raise
+    metrics.finish("ok")
+
+
+def _prom_line(metric, labels, value):
+    label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return f"{metric}{{{label_str}}} {value}"
+
+
+def write_prometheus(record, prom_dir):
+    """Write one <stage>.prom file in Prometheus text format (atomically, for the textfile collector)."""
+    labels = {"stage": record["stage"]}
+    gauges = [
+        ("wms_stage_wall_seconds", "Wall time of the last run of the stage.", record["wall_seconds"]),
+        ("wms_stage_cpu_seconds", "CPU time (incl. child processes) of the last run.", record["cpu_seconds"]),
+        ("wms_stage_peak_rss_megabytes", "Peak resident memory of the stage process.", record["peak_rss_mb"]),
+        ("wms_stage_rows_in", "Rows read by the last run.", record["rows_in"]),
+        ("wms_stage_rows_out", "Rows written by the last run.", record["rows_out"]),
+        ("wms_stage_bytes_read", "Bytes read by the last run.", record["bytes_read"]),
+        ("wms_stage_bytes_written", "Bytes written by the last run.", record["bytes_written"]),
+        ("wms_stage_success", "1 if the last run finished ok.", int(record["status"] == "ok")),
+        ("wms_stage_last_run_timestamp_seconds", "Unix time the last run finished.", int(time.time())),
+    ]
+    lines = []
+    for metric, help_text, value in gauges:
+        if value is None:
+            continue
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", _prom_line(metric, labels, value)]
+    if record["steps"]:
+        lines += ["# HELP wms_stage_step_wall_seconds Wall time of a sub-step within the stage.",
+                  "# TYPE wms_stage_step_wall_seconds gauge"]
+        for step_name, s in record["steps"].items():
+            lines.append(_prom_line("wms_stage_step_wall_seconds", dict(labels, step=step_name), s["wall_seconds"]))
+
+    os.makedirs(prom_dir, exist_ok=True)
+    path = os.path.join(prom_dir, f"wms_{record['stage']}.prom")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def load_records(path=METRICS_PATH):
+    try:
+        with open(path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def main():
+    """Print the latest run of each stage, slowest first."""
+    records = load_records()
+    if not records:
+        print(f"❌ No stage metrics found at {METRICS_PATH}")
+        return
+    latest = {}
+    for r in records:
+        latest[r["stage"]] = r
+    print(f"{'stage':<32}{'status':<14}{'wall s':>9}{'cpu s':>9}{'rss MB':>9}{'rows in':>10}{'rows out':>10}")
+    for r in sorted(latest.values(), key=lambda r: r["wall_seconds"], reverse=True):
+        print(f"{r['stage']:<32} {r['status']:<14}{r['wall_seconds']:>9.2f}{r['cpu_seconds']:>9.2f}"
+              f"{(r['peak_rss_mb'] or 0):>9.1f}{r['rows_in']:>10}{r['rows_out']:>10}")
+        for step_name, s in sorted(r["steps"].items(), key=lambda kv: kv[1]["wall_seconds"], reverse=True):
+            print(f"   └ {step_name:<28} {'':<14}{s['wall_seconds']:>9.2f}{s['cpu_seconds']:>9.2f}   ×{s['calls']}")
+
+
+if __name__ == "__main__":
+    main()
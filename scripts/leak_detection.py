@@ -1,11 +1,15 @@
 import pandas as pd
-from sklearn.ensemble import IsolationForest
-from datetime import datetime
 import os
 import numpy as np
 
+import baseline_profile
+import readings_db
+from instrumentation import start_stage
+from water_data import load_combined, load_config, write_csv
+
 # === CONFIGURATION ===
-PROJECT_ROOT = "/home/iiitb/campus_digital_twin" # Ensure this path is correct
+# Ensure this path is correct (WMS_PROJECT_ROOT overrides it, e.g. for the benchmark harness)
+PROJECT_ROOT = os.environ.get("WMS_PROJECT_ROOT", "/home/iiitb/campus_digital_twin")
 DATA_FOLDER = os.path.join(PROJECT_ROOT, "data")
 
 DATA_PATH = os.path.join(DATA_FOLDER, "combined_water_data.csv")
@@ -17,124 +21,174 @@ NIGHT_LEAK_PATH = os.path.join(DATA_FOLDER, "night_leak_alerts.csv")
 # Adjust this based on sensor precision and what you consider negligible usage.
 NO_FLOW_THRESHOLD = 0.05 # For example, 50 milliliters per hour, accounting for sensor noise
 
-print("--- Starting Leak Detection ---")
-print(f"Loading data from: {DATA_PATH}")
-
-# === LOAD AND PREPROCESS DATA ===
-try:
-    df = pd.read_csv(DATA_PATH, parse_dates=["Date/Time"])
-    print(f"Successfully loaded {len(df)} records.")
-except FileNotFoundError:
-    print(f"❌ Error: 'combined_water_data.csv' not found at {DATA_PATH}.")
-    print("Please ensure your data aggregation scripts have been run to generate this file.")
-    # Create empty alert files with headers to avoid dashboard errors
-    pd.DataFrame(columns=['Date/Time', 'Building', 'Hourly Consumption (Liters)']).to_csv(SPIKE_ALERT_PATH, index=False)
-    pd.DataFrame(columns=['Date/Time', 'Building', 'Hourly Consumption (Liters)']).to_csv(NIGHT_LEAK_PATH, index=False)
-    exit()
-except Exception as e:
-    print(f"❌ Error loading or parsing data: {e}")
-    # Create empty alert files with headers
-    pd.DataFrame(columns=['Date/Time', 'Building', 'Hourly Consumption (Liters)']).to_csv(SPIKE_ALERT_PATH, index=False)
-    pd.DataFrame(columns=['Date/Time', 'Building', 'Hourly Consumption (Liters)']).to_csv(NIGHT_LEAK_PATH, index=False)
-    exit()
-
-df['Date/Time'] = pd.to_datetime(df['Date/Time'], errors='coerce')
-df.dropna(subset=['Date/Time'], inplace=True)
-df = df.sort_values(by=['Building', 'Date/Time']).reset_index(drop=True)
-
-df['Consumption (Liters)'] = df['Consumption (Liters)'].apply(lambda x: max(0, x))
-
-df['Hourly Consumption (Liters)'] = df.groupby('Building')['Consumption (Liters)'].diff().fillna(0)
-df['Hourly Consumption (Liters)'] = df['Hourly Consumption (Liters)'].apply(lambda x: max(0, x))
-
-df["Hour"] = df["Date/Time"].dt.hour
-df["DayOfWeek"] = df["Date/Time"].dt.dayofweek # Monday=0, Sunday=6
-
-# Initialize anomaly column to 1 (not anomaly)
-df['anomaly'] = 1
-
-# === NIGHT LEAK DETECTION (0-5 AM: Should be near zero flow) ===
-# We are looking for small, *persistent* flows when there should be no activity.
-night_df = df[(df["Hour"] >= 0) & (df["Hour"] <= 5) & (df["Hourly Consumption (Liters)"] > NO_FLOW_THRESHOLD)].copy()
-
-if not night_df.empty:
-    print(f"Detecting night leaks from {len(night_df)} night-time consumption points...")
-    # Features for night leaks: just the consumption value
-    # Contamination should be set relatively low, as we expect few actual night leaks
-    night_features = night_df[["Hourly Consumption (Liters)"]].copy()
-    model_night = IsolationForest(n_estimators=100, contamination=0.01, random_state=42) # Adjust contamination
-    
-    # Handle potential inf/nan
-    night_features.replace([np.inf, -np.inf], np.nan, inplace=True)
-    night_features.dropna(inplace=True)
-
-    if not night_features.empty:
-        night_df.loc[night_features.index, "anomaly"] = model_night.fit_predict(night_features)
+ALERT_COLUMNS = ['Date/Time', 'Building', 'Hourly Consumption (Liters)']
+
+# Detector settings (the `leak_detection` section of config.yaml); replay.py runs
+# detect() with overrides to compare configurations
+DEFAULT_DETECTION = {
+    "detector": "isolation_forest", # or "baseline": hour-of-week profile (baseline_profile.py)
+    "no_flow_threshold": NO_FLOW_THRESHOLD,
+    "night_contamination": 0.01,    # expected share of night-time points that are leaks
+    "active_contamination": 0.02,   # expected share of active-hour points that are spikes
+    "n_estimators": 100,
+}
+
+
+def load_params(config=None):
+    config = config if config is not None else load_config()
+    return {**DEFAULT_DETECTION, **(config.get("leak_detection") or {})}
+
+
+def write_empty_alerts():
+    """Create empty alert files with headers to avoid dashboard errors."""
+    write_csv(pd.DataFrame(columns=ALERT_COLUMNS), SPIKE_ALERT_PATH, index=False)
+    write_csv(pd.DataFrame(columns=ALERT_COLUMNS), NIGHT_LEAK_PATH, index=False)
+
+
+def detect(df, metrics, params=None):
+    """
+    Run both IsolationForest detectors over the cleaned combined data
+    (see water_data.clean_combined): the raw window of retention.py, so
+    archived readings are not flagged again. `params` overrides DEFAULT_DETECTION.
+    Returns (spike_alerts, night_leak_alerts).
+    """
+    p = {**DEFAULT_DETECTION, **(params or {})}
+    if p["detector"] == "baseline":
+        # each reading against its meter's usual flow for that hour of the week; no model fit
+        # baseline settings passed in (e.g. by a replay run) override the `baseline` config section
+        settings = {**baseline_profile.load_params(), **{k: v for k, v in p.items() if k in baseline_profile.DEFAULT_BASELINE}}
+        with metrics.step("baseline_profile"):
+            spike_alerts, night_leak_alerts, _ = baseline_profile.detect(df, settings)
+        return spike_alerts, night_leak_alerts
+
+    from sklearn.ensemble import IsolationForest
+
+    no_flow = p["no_flow_threshold"]
+
+    if "Quality" in df:
+        # a reading after a long outage carries the whole outage's volume (see totalizer_integrity.py)
+        df = df[~df["Quality"].fillna("").str.contains("long_gap")]
+    df = df[["Date/Time", "Building", "Consumption (Liters)"]].copy()
+    df['Hourly Consumption (Liters)'] = df.groupby('Building')['Consumption (Liters)'].diff().fillna(0).clip(lower=0)
+
+    df["Hour"] = df["Date/Time"].dt.hour
+    df["DayOfWeek"] = df["Date/Time"].dt.dayofweek # Monday=0, Sunday=6
+
+    # Initialize anomaly column to 1 (not anomaly)
+    df['anomaly'] = 1
+
+    # === NIGHT LEAK DETECTION (0-5 AM: Should be near zero flow) ===
+    # We are looking for small, *persistent* flows when there should be no activity.
+    night_df = df[(df["Hour"] >= 0) & (df["Hour"] <= 5) & (df["Hourly Consumption (Liters)"] > no_flow)].copy()
+
+    if not night_df.empty:
+        print(f"Detecting night leaks from {len(night_df)} night-time consumption points...")
+        # Features for night leaks: just the consumption value
+        # Contamination should be set relatively low, as we expect few actual night leaks
+        night_features = night_df[["Hourly Consumption (Liters)"]].copy()
+        model_night = IsolationForest(n_estimators=p["n_estimators"], contamination=p["night_contamination"], random_state=42)
+
+        # Handle potential inf/nan
+        night_features.replace([np.inf, -np.inf], np.nan, inplace=True)
+        night_features.dropna(inplace=True)
+
+        if not night_features.empty:
+            with metrics.step("isolation_forest_night"):
+                night_df.loc[night_features.index, "anomaly"] = model_night.fit_predict(night_features)
+        else:
+            print("No valid night features after cleaning.")
     else:
-        print("No valid night features after cleaning.")
-else:
-    print("No significant night-time consumption data to detect night leaks.")
-
-# === SPIKE ALERT DETECTION (Active Hours: 6 AM - 23 PM) ===
-# We are looking for unusually high consumption spikes during active hours.
-active_df = df[(df["Hour"] >= 6) | (df["Hour"] <= 23)].copy() # Covers 6 AM to 11 PM
-# Only consider consumption above the no-flow threshold for spikes
-active_df = active_df[active_df["Hourly Consumption (Liters)"] > NO_FLOW_THRESHOLD].copy()
-
-
-if not active_df.empty:
-    print(f"Detecting spike alerts from {len(active_df)} active-hour consumption points...")
-    # Features for spike alerts: consumption, hour, day of week
-    active_features = active_df[["Hourly Consumption (Liters)", "Hour", "DayOfWeek"]].copy()
-    model_active = IsolationForest(n_estimators=100, contamination=0.02, random_state=42) # Adjust contamination
-
-    # Handle potential inf/nan
-    active_features.replace([np.inf, -np.inf], np.nan, inplace=True)
-    active_features.dropna(inplace=True)
-
-    if not active_features.empty:
-        active_df.loc[active_features.index, "anomaly"] = model_active.fit_predict(active_features)
+        print("No significant night-time consumption data to detect night leaks.")
+
+    # === SPIKE ALERT DETECTION (Active Hours: 6 AM - 23 PM) ===
+    # We are looking for unusually high consumption spikes during active hours.
+    active_df = df[(df["Hour"] >= 6) | (df["Hour"] <= 23)].copy() # Covers 6 AM to 11 PM
+    # Only consider consumption above the no-flow threshold for spikes
+    active_df = active_df[active_df["Hourly Consumption (Liters)"] > no_flow].copy()
+
+    if not active_df.empty:
+        print(f"Detecting spike alerts from {len(active_df)} active-hour consumption points...")
+        # Features for spike alerts: consumption, hour, day of week
+        active_features = active_df[["Hourly Consumption (Liters)", "Hour", "DayOfWeek"]].copy()
+        model_active = IsolationForest(n_estimators=p["n_estimators"], contamination=p["active_contamination"], random_state=42)
+
+        # Handle potential inf/nan
+        active_features.replace([np.inf, -np.inf], np.nan, inplace=True)
+        active_features.dropna(inplace=True)
+
+        if not active_features.empty:
+            with metrics.step("isolation_forest_active"):
+                active_df.loc[active_features.index, "anomaly"] = model_active.fit_predict(active_features)
+        else:
+            print("No valid active hour features after cleaning.")
     else:
-        print("No valid active hour features after cleaning.")
-else:
-    print("No significant active-hour consumption data to detect spike alerts.")
-
+        print("No significant active-hour consumption data to detect spike alerts.")
 
-# === COMBINE ANOMALIES AND CLASSIFY ===
-# Update the main df's anomaly column based on detected anomalies in night_df and active_df
-if 'anomaly' in night_df.columns:
+    # === COMBINE ANOMALIES AND CLASSIFY ===
+    # Update the main df's anomaly column based on detected anomalies in night_df and active_df
     df.loc[night_df[night_df['anomaly'] == -1].index, 'anomaly'] = -1
-if 'anomaly' in active_df.columns:
     df.loc[active_df[active_df['anomaly'] == -1].index, 'anomaly'] = -1
 
-# Filter for all detected anomalies
-anomalies_final_df = df[df["anomaly"] == -1].copy()
-
-# Separate into spike alerts and night leaks based on hour and NO_FLOW_THRESHOLD
-night_leak_alerts = anomalies_final_df[(anomalies_final_df["Hour"] >= 0) & \
-                                       (anomalies_final_df["Hour"] <= 5) & \
-                                       (anomalies_final_df["Hourly Consumption (Liters)"] > NO_FLOW_THRESHOLD)].copy()
-
-spike_alerts = anomalies_final_df[~anomalies_final_df.index.isin(night_leak_alerts.index)].copy()
-# Also ensure spike alerts have consumption above the no-flow threshold
-spike_alerts = spike_alerts[spike_alerts["Hourly Consumption (Liters)"] > NO_FLOW_THRESHOLD].copy()
-
-
-# === SAVE RESULTS FOR DASHBOARD ===
-required_cols = ['Date/Time', 'Building', 'Hourly Consumption (Liters)']
-
-# Ensure alert files are created with correct columns, even if empty
-if not spike_alerts.empty:
-    spike_alerts[required_cols].to_csv(SPIKE_ALERT_PATH, index=False)
-else:
-    pd.DataFrame(columns=required_cols).to_csv(SPIKE_ALERT_PATH, index=False)
-
-if not night_leak_alerts.empty:
-    night_leak_alerts[required_cols].to_csv(NIGHT_LEAK_PATH, index=False)
-else:
-    pd.DataFrame(columns=required_cols).to_csv(NIGHT_LEAK_PATH, index=False)
-
-print("✅ Leak detection completed.")
-print(f"  - Spike Alerts Saved: {SPIKE_ALERT_PATH}")
-print(f"  - Night Leak Alerts Saved: {NIGHT_LEAK_PATH}")
-print(f"📈 Total Spike Alerts: {len(spike_alerts)} | 🌙 Total Night Leak Alerts: {len(night_leak_alerts)}")
+    # Filter for all detected anomalies
+    anomalies_final_df = df[df["anomaly"] == -1].copy()
+
+    # Separate into spike alerts and night leaks based on hour and NO_FLOW_THRESHOLD
+    night_leak_alerts = anomalies_final_df[(anomalies_final_df["Hour"] >= 0) & \
+                                           (anomalies_final_df["Hour"] <= 5) & \
+                                           (anomalies_final_df["Hourly Consumption (Liters)"] > no_flow)].copy()
+
+    spike_alerts = anomalies_final_df[~anomalies_final_df.index.isin(night_leak_alerts.index)].copy()
+    # Also ensure spike alerts have consumption above the no-flow threshold
+    spike_alerts = spike_alerts[spike_alerts["Hourly Consumption (Liters)"] > no_flow].copy()
+    return spike_alerts, night_leak_alerts
+
+
+def run(df, metrics, params=None):
+    """Pipeline stage: detect and save spike / night-leak alerts for the dashboard."""
+    spike_alerts, night_leak_alerts = detect(df, metrics, params or load_params())
+
+    # === SAVE RESULTS FOR DASHBOARD ===
+    # Ensure alert files are created with correct columns, even if empty
+    write_csv(spike_alerts[ALERT_COLUMNS], SPIKE_ALERT_PATH, index=False)
+    write_csv(night_leak_alerts[ALERT_COLUMNS], NIGHT_LEAK_PATH, index=False)
+    metrics.wrote(SPIKE_ALERT_PATH, rows=len(spike_alerts))
+    metrics.wrote(NIGHT_LEAK_PATH, rows=len(night_leak_alerts))
+    readings_db.write_through(tables=["spike_alerts", "night_leak_alerts"])
+
+    # the dashboards score the newest readings against this baseline by lookup
+    with metrics.step("refresh_baseline"):
+        baseline_profile.refresh(df)
+    metrics.wrote(baseline_profile.CACHE_PATH)
+
+    print("✅ Leak detection completed.")
+    print(f"  - Spike Alerts Saved: {SPIKE_ALERT_PATH}")
+    print(f"  - Night Leak Alerts Saved: {NIGHT_LEAK_PATH}")
+    print(f"📈 Total Spike Alerts: {len(spike_alerts)} | 🌙 Total Night Leak Alerts: {len(night_leak_alerts)}")
+    return spike_alerts, night_leak_alerts
+
+
+def main():
+    metrics = start_stage("leak_detection")
+    print("--- Starting Leak Detection ---")
+    print(f"Loading data from: {DATA_PATH}")
+
+    # === LOAD AND PREPROCESS DATA ===
+    try:
+        df = load_combined(DATA_PATH, metrics)
+        print(f"Successfully loaded {len(df)} records.")
+    except FileNotFoundError:
+        print(f"❌ Error: 'combined_water_data.csv' not found at {DATA_PATH}.")
+        print("Please ensure your data aggregation scripts have been run to generate this file.")
+        write_empty_alerts()
+        exit()
+    except Exception as e:
+        print(f"❌ Error loading or parsing data: {e}")
+        write_empty_alerts()
+        exit()
+
+    run(df, metrics)
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# mass_balance.py
+"""
+Water balance across the meter hierarchy.
+
+Each pipe segment runs from an upstream meter (a terrace tank meter such as
+ATTD) to the meters it feeds (the A1*/AG*/A2MF* floor meters on the same
+line). Per time window the volume through the upstream meter minus the sum of
+the downstream volumes is the flow the segment lost on the way: a leak in the
+unmetered pipework, or a meter that under-reads. Windows where every meter of a
+segment reported are kept; unaccounted flow above the configured limits for
+several consecutive windows becomes an alert episode for that segment.
+
+The topology comes from the `mass_balance.segments` section of config.yaml
+when present ({upstream: [downstream, ...]}), else from the sensor mapping
+workbook (mapping/IIIT B - Installed Sensors Mapping.xlsx, needs openpyxl),
+else from the meter names.
+"""
+import os, re, glob, time, argparse
+import numpy as np
+import pandas as pd
+
+import readings_db
+from instrumentation import start_stage
+from water_data import PROJECT_ROOT, COMBINED_PATH, CONFIG_PATH, load_combined, load_config, write_csv
+
+# ——— CONFIGURATION ——————————————————————————————————————
+DATA_FOLDER = os.path.join(PROJECT_ROOT, "data")
+MAPPING_GLOB = os.path.join(PROJECT_ROOT, "mapping", "*Sensors Mapping*.xlsx")
+BALANCE_PATH = os.path.join(DATA_FOLDER, "mass_balance.csv")
+ALERT_PATH = os.path.join(DATA_FOLDER, "unaccounted_flow_alerts.csv")
+
+# Defaults for the `mass_balance` section of config.yaml
+DEFAULT_BALANCE = {
+    "window": "1h",                 # balance window (pandas offset: 1h, 3h, 1D, ...)
+    "min_unaccounted_lph": 5.0,     # ignore smaller gaps (meter resolution, timing skew)
+    "tolerance_pct": 10.0,          # ...and gaps below this share of the upstream volume
+    "sustain_windows": 3,           # consecutive flagged windows before an alert episode
+}
+SUMMARY_ROWS = 12                   # segments listed in the console summary
+ALERT_COLUMNS = ["Segment", "Downstream", "Start", "End", "Windows",
+                 "Mean Unaccounted (L/h)", "Total Unaccounted (Liters)"]
+# ————————————————————————————————————————————————————————
+
+
+def segments_from_workbook(path):
+    """
+    {tank meter: [floor meters]} per block and line from the sensor mapping
+    workbook: one sheet per block, 'Installed Place' reads like
+    'Block A – 1st Floor – Female Toilet – Domestic' or 'Block A – Terrace – Tank – Flush'.
+    """
+    sheets = pd.read_excel(path, sheet_name=None)
+    lines = {}
+    for sheet in sheets.values():
+        if not {"Installed Place", "Alias Name"} <= set(sheet.columns):
+            continue
+        for place, alias in zip(sheet["Installed Place"], sheet["Alias Name"]):
+            if not isinstance(place, str) or not isinstance(alias, str):
+                continue
+            parts = [p.strip() for p in re.split(r"\s[–-]\s", place)]
+            entry = lines.setdefault((parts[0], parts[-1]), {"tank": None, "floors": []})
+            if "Tank" in parts:
+                entry["tank"] = alias.strip()
+            else:
+                entry["floors"].append(alias.strip())
+    return {e["tank"]: e["floors"] for e in lines.values() if e["tank"] and e["floors"]}
+
+
+def segments_from_names(meter_ids):
+    """{tank meter: [floor meters]} from names like ATTD / A1FD (see meter_registry.parse_meter)."""
+    from meter_registry import parse_meter
+
+    tanks, floors = {}, {}
+    for m in meter_ids:
+        block, _, _, line, is_tank = parse_meter(m)
+        if is_tank:
+            tanks[(block, line)] = m
+        else:
+            floors.setdefault((block, line), []).append(m)
+    return {tank: floors[key] for key, tank in tanks.items() if floors.get(key)}
+
+
+def load_topology(config):
+    """Segments and where they came from: config.yaml, the mapping workbook or the meter names."""
+    section = config.get("mass_balance") or {}
+    if section.get("segments"):
+        return {up: list(down) for up, down in section["segments"].items()}, "config.yaml"
+    for path in sorted(glob.glob(MAPPING_GLOB)):
+        try:
+            segments = segments_from_workbook(path)
+        except ImportError:
+            print("⚠️ openpyxl is not installed; deriving the topology from the meter names instead.")
+            break
+        if segments:
+            return segments, os.path.basename(path)
+    return segments_from_names(config.get("buildings", [])), "meter names"
+
+
+def rollup(df, window):
+    """Volume per meter per window as a (windows × meters) frame; NaN where a meter did not report."""
+    df = df.drop_duplicates(subset=["Building", "Date/Time"])
+    volume = (df.groupby([df["Date/Time"].dt.floor(window), "Building"])["Consumption (Liters)"]
+              .sum().unstack("Building"))
+    return volume.reindex(pd.date_range(volume.index.min(), volume.index.max(), freq=window))
+
+
+def balance(volume, segments):
+    """
+    Vectorized balance over all windows and segments. Returns the segment
+    names and (upstream, downstream, complete) as (windows × segments) arrays.
+    """
+    meters = {m: i for i, m in enumerate(volume.columns)}
+    names = [up for up, down in segments.items() if up in meters and any(d in meters for d in down)]
+    H = volume.to_numpy(dtype=float)
+    up = np.array([meters[u] for u in names], dtype=int)
+    feeds = np.zeros((len(names), H.shape[1]))
+    for s, u in enumerate(names):
+        feeds[s, [meters[d] for d in segments[u] if d in meters]] = 1.0
+    missing = np.isnan(H)
+    complete = ~missing[:, up] & ((missing.astype(float) @ feeds.T) == 0)
+    downstream = np.nan_to_num(H) @ feeds.T
+    return names, H[:, up], downstream, complete
+
+
+def episodes(flagged, index, names, unaccounted, hours, segments, sustain):
+    """Runs of at least `sustain` consecutive flagged windows per segment."""
+    rows = []
+    padded = np.vstack([np.zeros((1, flagged.shape[1]), bool), flagged, np.zeros((1, flagged.shape[1]), bool)])
+    edges = np.diff(padded.astype(np.int8), axis=0)
+    for s, name in enumerate(names):
+        starts, ends = np.flatnonzero(edges[:, s] == 1), np.flatnonzero(edges[:, s] == -1)
+        for a, b in zip(starts, ends):
+            if b - a < sustain:
+                continue
+            lost = unaccounted[a:b, s]
+            rows.append({"Segment": name, "Downstream": " ".join(segments[name]),
+                         "Start": index[a], "End": index[b - 1], "Windows": int(b - a),
+                         "Mean Unaccounted (L/h)": round(float(lost.mean() / hours), 2),
+                         "Total Unaccounted (Liters)": round(float(lost.sum()), 2)})
+    return pd.DataFrame(rows, columns=ALERT_COLUMNS)
+
+
+def run(df, metrics, config=None):
+    """Pipeline stage: per-window balance of every segment, saved with its alert episodes."""
+    config = load_config(CONFIG_PATH) if config is None else config
+    params = {**DEFAULT_BALANCE, **{k: v for k, v in (config.get("mass_balance") or {}).items() if k != "segments"}}
+    segments, source = load_topology(config)
+    if not segments:
+        print("⚠️ No upstream/downstream meter pairs found; nothing to balance.")
+        return None
+    print(f"🕸️ {len(segments)} segment(s) from {source}, window {params['window']}")
+
+    with metrics.step("rollup"):
+        volume = rollup(df, params["window"])
+    with metrics.step("balance"):
+        names, upstream, downstream, complete = balance(volume, segments)
+        unaccounted = upstream - downstream
+        hours = pd.Timedelta(params["window"]).total_seconds() / 3600
+        limit = np.maximum(params["min_unaccounted_lph"] * hours, upstream * params["tolerance_pct"] / 100)
+        flagged = complete & (unaccounted > limit)
+        alerts = episodes(flagged, volume.index, names, np.nan_to_num(unaccounted), hours, segments,
+                          params["sustain_windows"])
+
+    w, s = np.nonzero(complete)
+    table = pd.DataFrame({
+        "Date/Time": volume.index[w],
+        "Segment": np.array(names)[s],
+        "Upstream (Liters)": upstream[w, s].round(2),
+        "Downstream (Liters)": downstream[w, s].round(2),
+        "Unaccounted (Liters)": unaccounted[w, s].round(2),
+        "Flagged": flagged[w, s],
+    })
+    write_csv(table, BALANCE_PATH, index=False)
+    write_csv(alerts, ALERT_PATH, index=False)
+    metrics.wrote(BALANCE_PATH, rows=len(table))
+    metrics.wrote(ALERT_PATH, rows=len(alerts))
+    readings_db.write_through(tables=["mass_balance", "unaccounted_flow_alerts"])
+
+    # segments with the largest unaccounted share first
+    up_total = np.where(complete, upstream, 0).sum(axis=0)
+    down_total = np.where(complete, downstream, 0).sum(axis=0)
+    share = np.where(up_total > 0, (up_total - down_total) / np.maximum(up_total, 1e-9), -np.inf)
+    order = np.argsort(-share)
+    for k in order[:SUMMARY_ROWS]:
+        pct = f"{100 * share[k]:5.1f}%" if up_total[k] > 0 else "   n/a"
+        print(f"   {names[k]:<6} → {len(segments[names[k]])} meter(s) | {complete[:, k].sum():>6} complete windows | "
+              f"in {up_total[k]:>12,.0f} L, out {down_total[k]:>12,.0f} L, unaccounted {pct} | "
+              f"{flagged[:, k].sum()} flagged, {(alerts['Segment'] == names[k]).sum()} episode(s)")
+    if len(names) > SUMMARY_ROWS:
+        print(f"   ... and {len(names) - SUMMARY_ROWS} more segment(s)")
+    print(f"✅ Mass balance saved to: {BALANCE_PATH}")
+    print(f"🚨 {len(alerts)} unaccounted-flow episode(s) saved to: {ALERT_PATH}")
+    return table, alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Water balance per pipe segment of the meter hierarchy.")
+    parser.add_argument("--window", help="balance window, e.g. 1h, 3h or 1D (overrides config.yaml)")
+    parser.add_argument("--topology", action="store_true", help="print the segments and exit")
+    args = parser.parse_args()
+
+    metrics = start_stage("mass_balance")
+    config = load_config(CONFIG_PATH)
+    if args.window:
+        config.setdefault("mass_balance", {})["window"] = args.window
+    if args.topology:
+        segments, source = load_topology(config)
+        print(f"🕸️ Segments from {source}:")
+        for up, down in segments.items():
+            print(f"   {up:<6} → {', '.join(down)}")
+        return
+
+    print("--- Starting Mass Balance ---")
+    df = load_combined(COMBINED_PATH, metrics)
+    t0 = time.perf_counter()
+    if run(df, metrics, config) is None:
+        exit()
+    print(f"⏱️ Balanced {len(df):,} readings in {time.perf_counter() - t0:.2f}s")
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
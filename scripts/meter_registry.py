@@ -0,0 +1,230 @@
+# meter_registry.py
+"""
+One registry of the campus meters, shared by the scripts and the dashboards.
+
+Every meter gets an integer code (its position in the registry) and its
+block, floor, line (domestic / flush), tank flag, parent (the terrace tank
+meter that feeds it), DCU, sensor ID and floor-plan coordinates. Sources, in
+order:
+
+- the sensor mapping workbook (mapping/*Sensors Mapping*.xlsx, needs
+  openpyxl): alias, installed place, sensor ID, DCU;
+- config.yaml: the `buildings` list and the `meter_registry.coords` section
+  (pixel position on deployment_diagram.png);
+- the meter name itself (A1FD, A2MFF, ATTD, ...) for whatever the other two
+  do not say.
+
+The result is compiled to data/.meter_registry.npz, keyed by a hash of the
+sources, so later loads are a single numpy read without openpyxl or YAML
+parsing. Readings are mapped to meters with encode(): a hash lookup per
+distinct name, then integer codes for every row; no regex runs per row.
+"""
+import os, re, glob, hashlib
+import numpy as np
+import pandas as pd
+import yaml
+
+# ——— CONFIGURATION ——————————————————————————————————————
+PROJECT_ROOT = os.path.abspath(os.environ.get("WMS_PROJECT_ROOT", os.path.join(os.path.dirname(__file__), "..")))
+CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.yaml")
+MAPPING_GLOB = os.path.join(PROJECT_ROOT, "mapping", "*Sensors Mapping*.xlsx")
+CACHE_PATH = os.path.join(PROJECT_ROOT, "data", ".meter_registry.npz")
+FIELDS = ["id", "block", "floor", "line", "is_tank", "parent", "dcu", "sensor_id", "x", "y"]
+# ————————————————————————————————————————————————————————
+
+METER_NAME = re.compile(r"^([A-Z]+?)(?:(TT)|(G|1|2M)([MF]))([DF])$")
+LINE_NAMES = {"D": "domestic", "F": "flush"}
+FLOOR_NAMES = {"ground": "G", "1st": "1", "2nd": "2", "3rd": "3", "terrace": "TT"}
+
+
+def parse_meter(meter_id):
+    """(block, floor, tap, line, is_tank) from a meter name like A1FD, A2MFF or ATTD."""
+    match = METER_NAME.match(meter_id)
+    if match is None:
+        raise ValueError(f"Unrecognised meter name: {meter_id}")
+    block, tank, floor, tap, line = match.groups()
+    return block, floor or "TT", tap, line, tank is not None
+
+
+def _from_workbook(path):
+    """{alias: attributes} from the mapping workbook ('Block A – 1st Floor – Female Toilet – Domestic')."""
+    rows = {}
+    for sheet in pd.read_excel(path, sheet_name=None).values():
+        if not {"Installed Place", "Alias Name"} <= set(sheet.columns):
+            continue
+        for _, r in sheet.iterrows():
+            place, alias = r["Installed Place"], r["Alias Name"]
+            if not isinstance(place, str) or not isinstance(alias, str):
+                continue
+            parts = [p.strip() for p in re.split(r"\s[–-]\s", place)]
+            floor = parts[1].split()[0].lower() if len(parts) > 1 else ""
+            rows[alias.strip()] = {
+                "block": parts[0].split()[-1],
+                "floor": FLOOR_NAMES.get(floor, floor),
+                "line": parts[-1].lower(),
+                "is_tank": "Tank" in parts,
+                "dcu": str(r.get("Connected To", "") or ""),
+                "sensor_id": str(r.get("Sensor ID", "") or ""),
+            }
+    return rows
+
+
+def _from_name(meter_id):
+    try:
+        block, floor, _, line, is_tank = parse_meter(meter_id)
+    except ValueError:
+        return {}
+    return {"block": block, "floor": "2" if floor == "2M" else floor, "line": LINE_NAMES[line], "is_tank": is_tank}
+
+
+def _sources(config_path):
+    return [config_path] + sorted(glob.glob(MAPPING_GLOB))
+
+
+def _digest(paths):
+    h = hashlib.sha256()
+    for path in paths + [os.path.abspath(__file__)]:
+        h.update(path.encode())
+        try:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(b"<missing>")
+    return h.hexdigest()
+
+
+def build(config_path=CONFIG_PATH):
+    """Assemble the registry arrays from the workbook, config.yaml and the meter names."""
+    try:
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    coords = (config.get("meter_registry") or {}).get("coords") or {}
+
+    workbook = {}
+    for path in sorted(glob.glob(MAPPING_GLOB)):
+        try:
+            workbook.update(_from_workbook(path))
+        except ImportError:
+            print("⚠️ openpyxl is not installed; the meter registry is built from config.yaml only.")
+            break
+
+    ids = list(dict.fromkeys([*workbook, *(config.get("buildings") or []), *coords]))
+    rows = [{**_from_name(m), **workbook.get(m, {})} for m in ids]
+    tanks = {(r.get("block"), r.get("line")): m for m, r in zip(ids, rows) if r.get("is_tank")}
+    index = {m: i for i, m in enumerate(ids)}
+    xy = np.array([coords.get(m, (np.nan, np.nan)) for m in ids], dtype=float).reshape(-1, 2)
+    return {
+        "id": np.array(ids, dtype=str),
+        "block": np.array([r.get("block", "") for r in rows], dtype=str),
+        "floor": np.array([r.get("floor", "") for r in rows], dtype=str),
+        "line": np.array([r.get("line", "") for r in rows], dtype=str),
+        "is_tank": np.array([bool(r.get("is_tank")) for r in rows], dtype=bool),
+        "parent": np.array([-1 if r.get("is_tank") else index.get(tanks.get((r.get("block"), r.get("line"))), -1)
+                            for r in rows], dtype=np.int32),
+        "dcu": np.array([r.get("dcu", "") for r in rows], dtype=str),
+        "sensor_id": np.array([r.get("sensor_id", "") for r in rows], dtype=str),
+        "x": xy[:, 0],
+        "y": xy[:, 1],
+    }
+
+
+class MeterRegistry:
+    def __init__(self, arrays):
+        for field in FIELDS:
+            setattr(self, field if field != "id" else "ids", arrays[field])
+        self.index = {m: i for i, m in enumerate(self.ids.tolist())}
+        self._lookup = pd.Index(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, meter):
+        return meter in self.index
+
+    def code(self, meter):
+        return self.index.get(meter, -1)
+
+    def encode(self, values):
+        """
+        Integer code per value (-1 for names that are not meters). Each distinct
+        name is resolved once, exactly or as the longest meter ID it contains
+        (e.g. 'Water_History_A1FD'); rows then take their code by position.
+        """
+        uniques_codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        resolved = self._lookup.get_indexer(uniques)
+        for k in np.flatnonzero(resolved < 0):
+            name = str(uniques[k])
+            hits = [m for m in self.index if m in name]
+            if hits:
+                resolved[k] = self.index[max(hits, key=len)]
+        resolved = np.append(resolved, -1).astype(np.int32)      # factorize marks NaN as -1
+        return resolved[uniques_codes]
+
+    def with_alias(self, df, column="Building"):
+        """Rows of df that belong to a registered meter, with its ID in 'Alias' and its code in 'Meter Code'."""
+        codes = self.encode(df[column])
+        known = codes >= 0
+        out = df[known].copy()
+        out["Meter Code"] = codes[known]
+        out["Alias"] = self.ids[codes[known]].astype(object)
+        return out
+
+    def coords(self):
+        """{meter: (x, y)} for the meters with a position on the floor plan, in registry order."""
+        placed = np.flatnonzero(~np.isnan(self.x))
+        return {self.ids[i]: (int(self.x[i]), int(self.y[i])) for i in placed}
+
+    def segments(self):
+        """{tank meter: [meters it feeds]} from the parent codes."""
+        out = {}
+        for child in np.flatnonzero(self.parent >= 0):
+            out.setdefault(self.ids[self.parent[child]], []).append(self.ids[child])
+        return out
+
+    def frame(self):
+        return pd.DataFrame({"code": np.arange(len(self)), **{f: getattr(self, f if f != "id" else "ids") for f in FIELDS}})
+
+
+_registry = None
+
+
+def load_registry(config_path=CONFIG_PATH, refresh=False):
+    """The registry, from the compiled cache when its sources are unchanged (once per process)."""
+    global _registry
+    if _registry is not None and not refresh:
+        return _registry
+    key = _digest(_sources(config_path))
+    arrays = None
+    if not refresh:
+        try:
+            with np.load(CACHE_PATH, allow_pickle=False) as cached:
+                if str(cached["key"]) == key:
+                    arrays = {f: cached[f] for f in FIELDS}
+        except (OSError, KeyError, ValueError):
+            pass
+    if arrays is None:
+        arrays = build(config_path)
+        try:
+            os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+            tmp = CACHE_PATH + ".tmp.npz"
+            np.savez(tmp, key=np.array(key), **arrays)
+            os.replace(tmp, CACHE_PATH)
+        except OSError:
+            pass                                                  # read-only checkout: just don't cache
+    _registry = MeterRegistry(arrays)
+    return _registry
+
+
+if __name__ == "__main__":
+    import argparse, time
+
+    parser = argparse.ArgumentParser(description="Show the meter registry (rebuilding its cache with --refresh).")
+    parser.add_argument("--refresh", action="store_true")
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    registry = load_registry(refresh=args.refresh)
+    print(f"📇 {len(registry)} meters loaded in {(time.perf_counter() - t0) * 1000:.1f} ms "
+          f"({len(registry.coords())} placed on the floor plan, {len(registry.segments())} tank lines)")
+    print(registry.frame().to_string(index=False))
@@ -2,17 +2,31 @@
 import os, glob, json
 import pandas as pd
 
+import readings_db
+from instrumentation import start_stage
+from totalizer_integrity import integrate, load_params, load_state, save_state, state_from_combined, state_matches, describe
+from water_data import append_csv, file_lock, write_csv
+
 # ——— CONFIGURATION ——————————————————————————————————————
-# (the script file is in scripts/, data/ is sibling)
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+# (the script file is in scripts/, data/ is sibling; WMS_PROJECT_ROOT overrides)
+PROJECT_ROOT = os.environ.get("WMS_PROJECT_ROOT", os.path.join(os.path.dirname(__file__), ".."))
+BASE_DIR = os.path.abspath(os.path.join(PROJECT_ROOT, "data"))
 COMBINED_CSV = os.path.join(BASE_DIR, "combined_water_data.csv")
 PACKET_GLOB = os.path.join(BASE_DIR, "Packet-*.csv")
 # ————————————————————————————————————————————————————————
 
 
-def main():
-    # 1) load existing combined data
-    combined = pd.read_csv(COMBINED_CSV, parse_dates=["Date/Time"])
+def run(combined, metrics):
+    """
+    Pipeline stage: append readings from packet files newer than the latest
+    combined row. Returns the updated (raw, uncleaned) combined frame so a
+    single-process run can hand it to the other stages without re-reading.
+    """
+    # 1) load existing combined data (unless the caller already has it)
+    if combined is None:
+        with metrics.step("read_combined"):
+            combined = pd.read_csv(COMBINED_CSV, parse_dates=["Date/Time"])
+        metrics.read(COMBINED_CSV)
     if combined.empty:
         last_ts = pd.Timestamp.min
     else:
@@ -22,61 +36,86 @@ def main():
     packet_files = sorted(glob.glob(PACKET_GLOB))
     new_rows = []
 
-    for pf in packet_files:
-        df = pd.read_csv(pf)
-        # parse packet_sent_at into a Timestamp
-        df["ts"] = pd.to_datetime(df["packet_sent_at"], errors="coerce")
-        # only keep strictly newer than last_ts
-        df = df[df["ts"] > last_ts]
-
-        for _, row in df.iterrows():
-            ts = row["ts"].floor("min")
-            try:
-                payload = json.loads(row["sensor_data"])
-            except json.JSONDecodeError:
-                continue
-            for reading in payload.get("t", []):
-                il = reading.get("il")
-                r  = reading.get("r")
-                if il is None or r is None:
-                    continue
+    with metrics.step("parse_packets"):
+        for pf in packet_files:
+            df = pd.read_csv(pf)
+            metrics.read(pf, rows=len(df))
+            # parse packet_sent_at into a Timestamp
+            df["ts"] = pd.to_datetime(df["packet_sent_at"], errors="coerce")
+            # only keep strictly newer than last_ts
+            df = df[df["ts"] > last_ts]
+
+            for _, row in df.iterrows():
+                ts = row["ts"].floor("min")
                 try:
-                    tot = float(r)
-                except:
+                    payload = json.loads(row["sensor_data"])
+                except json.JSONDecodeError:
                     continue
+                for reading in payload.get("t", []):
+                    il = reading.get("il")
+                    r  = reading.get("r")
+                    if il is None or r is None:
+                        continue
+                    try:
+                        tot = float(r)
+                    except:
+                        continue
 
-                new_rows.append({
-                    "Date/Time": ts,
-                    "Totalizer (Liters)": tot,
-                    "Building": il,
-                    "Source File": os.path.basename(pf)
-                })
+                    new_rows.append({
+                        "Date/Time": ts,
+                        "Totalizer (Liters)": tot,
+                        "Building": il,
+                        "Source File": os.path.basename(pf)
+                    })
 
     if not new_rows:
         print("❌ No new packets found since", last_ts)
-        return
+        return combined
 
     # 3) build DataFrame of all new readings
     new_df = pd.DataFrame(new_rows)
     new_df.sort_values(["Building", "Date/Time"], inplace=True)
 
-    # 4) compute consumption as diff of totalizer
-    new_df["Consumption (Liters)"] = (
-        new_df
-        .groupby("Building")["Totalizer (Liters)"]
-        .diff()
-        .fillna(0)
-    )
+    # 4) consumption from the totalizers, continuing from each meter's last trusted
+    #    level: duplicates dropped, rollovers/resets/gaps handled, Quality flags set
+    #    (the state is rebuilt from combined when a crashed run left them out of step)
+    state = load_state()
+    if not state or not state_matches(state, combined):
+        state = state_from_combined(combined)
+    with metrics.step("integrity"):
+        new_df, state, counts = integrate(new_df, state, load_params())
+    if new_df.empty:
+        print("❌ No new readings after dropping duplicates since", last_ts)
+        return combined
 
-    # 5) append and re-sort
+    # 5) append and re-sort (stable, so the frame matches the file appended below)
+    new_df.sort_values("Date/Time", kind="stable", inplace=True)
     combined_updated = pd.concat([combined, new_df], ignore_index=True)
-    combined_updated.sort_values("Date/Time", inplace=True)
+    combined_updated.sort_values("Date/Time", kind="stable", inplace=True)
 
-    # 6) save back (same columns, same order)
-    cols = ["Date/Time", "Totalizer (Liters)", "Consumption (Liters)", "Building", "Source File"]
-    combined_updated.to_csv(COMBINED_CSV, columns=cols, index=False)
+    # 6) save back (same columns plus Quality, same order). New readings are all
+    #    later than the file's last row, so they are appended in place and the
+    #    live server's tail (dashboard/live_server.py) reads only them; an old
+    #    layout or a torn last line gets an atomic rewrite instead
+    cols = ["Date/Time", "Totalizer (Liters)", "Consumption (Liters)", "Building", "Source File", "Quality"]
+    with metrics.step("write_combined"), file_lock(COMBINED_CSV):
+        if combined.empty or not append_csv(new_df, COMBINED_CSV, cols):
+            write_csv(combined_updated, COMBINED_CSV, columns=cols, index=False)
+    save_state(state)
+    metrics.wrote(COMBINED_CSV, rows=len(new_df))
+    readings_db.write_through(combined=combined_updated, appended=new_df, metrics=metrics)
 
     print(f"✅ Appended {len(new_df)} new readings. Combined updated.")
+    if describe(counts):
+        print(f"   🧹 Totalizer integrity: {describe(counts)}")
+    return combined_updated
+
+
+def main():
+    metrics = start_stage("packet_to_combined_water_data")
+    run(None, metrics)
+    metrics.finish()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# pipeline.py
+import os, sys, glob, json, time, hashlib, argparse, importlib, subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+# ——— CONFIGURATION ——————————————————————————————————————
+SCRIPTS_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.environ.get("WMS_PROJECT_ROOT", os.path.join(SCRIPTS_DIR, "..")))
+STATE_PATH = os.path.join(PROJECT_ROOT, "data", ".pipeline_state.json")
+COMBINED = "data/combined_water_data.csv"
+
+# Each stage declares the files it reads and writes (paths relative to the
+# project root, globs allowed). Dependencies are derived from these: a stage
+# runs after every stage that writes one of its inputs. Stages marked optional
+# are skipped with a warning when their script is missing.
+# In --single-process mode the script is imported as a module instead and its
+# run() is called with the shared, already-cleaned combined frame.
+STAGES = [
+    {"name": "ingest", "script": "packet_to_combined_water_data.py",
+     "inputs": ["data/Packet-*.csv"], "outputs": [COMBINED]},
+    {"name": "retention", "script": "retention.py",
+     "inputs": [COMBINED], "outputs": [COMBINED, "data/rollups/*.csv", "data/archive/raw-*"]},
+    {"name": "update_yaml", "script": "update_yaml.py", "optional": True,
+     "inputs": [COMBINED], "outputs": ["config.yaml"]},
+    {"name": "validate", "script": "validate_merge.py",
+     "inputs": [COMBINED, "data/Packet-*.csv"], "outputs": []},
+    {"name": "forecast", "script": "forecast_demand.py",
+     "inputs": [COMBINED, "data/rollups/daily.csv", "config.yaml"], "outputs": ["data/demand_forecast.csv", "plots/*_forecast.png"]},
+    {"name": "leak_detection", "script": "leak_detection.py",
+     "inputs": [COMBINED], "outputs": ["data/spike_alerts.csv", "data/night_leak_alerts.csv"]},
+    {"name": "mass_balance", "script": "mass_balance.py",
+     "inputs": [COMBINED, "config.yaml", "mapping/*.xlsx"],
+     "outputs": ["data/mass_balance.csv", "data/unaccounted_flow_alerts.csv"]},
+    {"name": "plots", "script": "generate_water_usage_plots.py",
+     "inputs": [COMBINED, "data/rollups/*.csv"], "outputs": ["water_usage_plots/*.png"]},
+    {"name": "export", "script": "export_data.py",
+     "inputs": [COMBINED], "outputs": ["3D_DT/public/combined_water_data.json", "3D_DT/public/combined_water_data.bin"]},
+]
+# ————————————————————————————————————————————————————————
+
+
+def module_name(stage):
+    return os.path.splitext(stage["script"])[0]
+
+
+def expand(patterns):
+    """Resolve project-relative paths/globs to the sorted list of existing files."""
+    files = set()
+    for pattern in patterns:
+        files.update(p for p in glob.glob(os.path.join(PROJECT_ROOT, pattern)) if os.path.isfile(p))
+    return sorted(files)
+
+
+def hash_inputs(stage):
+    """Content hash over the stage's input files and its own script."""
+    h = hashlib.sha256()
+    paths = expand(stage["inputs"]) + [os.path.join(SCRIPTS_DIR, stage["script"])]
+    for path in paths:
+        h.update(os.path.relpath(path, PROJECT_ROOT).encode())
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        except OSError:
+            h.update(b"<missing>")
+    return h.hexdigest()
+
+
+def resolve_dependencies(stages):
+    """Map stage name → set of upstream stage names, derived from inputs/outputs."""
+    writers = {}
+    for s in stages:
+        for out in s["outputs"]:
+            writers.setdefault(out, set()).add(s["name"])
+    deps = {}
+    for s in stages:
+        upstream = set()
+        for inp in s["inputs"]:
+            upstream |= writers.get(inp, set())
+        upstream.discard(s["name"])
+        deps[s["name"]] = upstream
+    # Refuse cycles early rather than deadlocking the scheduler
+    seen, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in seen:
+            raise ValueError(f"❌ Stage dependency cycle: {' → '.join(path + [name])}")
+        seen.add(name)
+        for up in deps[name]:
+            visit(up, path + [name])
+        done.add(name)
+
+    for name in deps:
+        visit(name, [])
+    return deps
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def rewrites_input(stage):
+    """Stages that write one of their own inputs are recorded with the hash of what they left behind."""
+    return bool(set(stage["inputs"]) & set(stage["outputs"]))
+
+
+def record(stage, digest, elapsed):
+    """State entry for a successful run, with the output files it left behind."""
+    return {"inputs_sha256": digest,
+            "outputs": [os.path.relpath(p, PROJECT_ROOT) for p in expand(stage["outputs"])],
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "seconds": round(elapsed, 2)}
+
+
+def is_unchanged(stage, digest, state):
+    """
+    True when the inputs hash matches the last successful run and the outputs
+    that run produced still exist. Output globs that matched nothing last time
+    (e.g. retention's rollups before any data is old enough) don't count.
+    """
+    last = state.get(stage["name"])
+    if not last or last.get("inputs_sha256") != digest:
+        return False
+    if "outputs" not in last:       # state written before outputs were recorded
+        return all(expand([out]) for out in stage["outputs"])
+    return all(os.path.isfile(os.path.join(PROJECT_ROOT, p)) for p in last["outputs"])
+
+
+def run_stage(stage, env):
+    """Run one stage script as its own process from the scripts dir (like run_all.sh)."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, stage["script"])],
+                          cwd=SCRIPTS_DIR, env=env, capture_output=True, text=True)
+    return proc.returncode, proc.stdout, proc.stderr, time.perf_counter() - t0
+
+
+def run_pipeline(stages=STAGES, jobs=None, force=False, only=None, dry_run=False):
+    deps = resolve_dependencies(stages)
+    by_name = {s["name"]: s for s in stages}
+    selected = set(only) if only else set(by_name)
+    state = load_state()
+    env = dict(os.environ, WMS_PROJECT_ROOT=PROJECT_ROOT, MPLBACKEND="Agg")
+    env.setdefault("WMS_RUN_ID", datetime.now().strftime("%Y%m%d-%H%M%S"))
+
+    if dry_run:
+        for s in stages:
+            after = ", ".join(sorted(deps[s["name"]])) or "—"
+            print(f"   {s['name']:<16} after: {after}")
+        return {}
+
+    status = {}          # name → ok | unchanged | skipped | failed | blocked
+    running = {}         # future → (stage, digest)
+    pending = [s["name"] for s in stages]
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 4) as pool:
+        while pending or running:
+            for name in list(pending):
+                upstream = deps[name]
+                if any(status.get(u) in ("failed", "blocked") for u in upstream):
+                    status[name] = "blocked"
+                    pending.remove(name)
+                    print(f"⛔ {name}: blocked by failed upstream stage")
+                    continue
+                if not all(u in status for u in upstream):
+                    continue
+                pending.remove(name)
+                stage = by_name[name]
+                if name not in selected:
+                    status[name] = "skipped"
+                    continue
+                if not os.path.exists(os.path.join(SCRIPTS_DIR, stage["script"])):
+                    if stage.get("optional"):
+                        status[name] = "skipped"
+                        print(f"⚠️ {name}: {stage['script']} not found, skipping")
+                    else:
+                        status[name] = "failed"
+                        print(f"❌ {name}: {stage['script']} not found")
+                    continue
+                digest = hash_inputs(stage)
+                if not force and is_unchanged(stage, digest, state):
+                    status[name] = "unchanged"
+                    print(f"⏭️ {name}: inputs unchanged since {state[name]['finished_at']}, skipping")
+                    continue
+                print(f"⏳ {name}: starting ({stage['script']})")
+                running[pool.submit(run_stage, stage, env)] = (stage, digest)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage, digest = running.pop(fut)
+                code, out, err, elapsed = fut.result()
+                if code == 0:
+                    status[stage["name"]] = "ok"
+                    if rewrites_input(stage):
+                        digest = hash_inputs(stage)
+                    state[stage["name"]] = record(stage, digest, elapsed)
+                    save_state(state)
+                    print(f"✅ {stage['name']}: done in {elapsed:.1f}s")
+                else:
+                    status[stage["name"]] = "failed"
+                    tail = (err or out).strip().splitlines()[-5:]
+                    print(f"❌ {stage['name']}: exit {code} after {elapsed:.1f}s")
+                    for line in tail:
+                        print(f"   {line}")
+    return status
+
+
+def call_stage(name, module, data, metrics):
+    """
+    Call one stage in-process. The combined CSV is read and cleaned at most
+    once per run: ingest hands back its updated frame, later stages reuse it.
+    """
+    if name == "ingest":
+        data["raw"] = module.run(None, metrics)
+        data.pop("clean", None)
+        return
+    if name == "retention":
+        data["raw"] = module.run(data.get("raw"), metrics)
+        data.pop("clean", None)
+        return
+    if name == "validate":
+        summary = module.validate(data.get("raw"))
+        metrics.rows_out = summary["missing"] + summary["mismatched"]
+        return
+    if "clean" not in data:
+        import water_data
+        if "raw" in data:
+            with metrics.step("clean_combined"):
+                data["clean"] = water_data.clean_combined(data["raw"])
+        else:
+            data["clean"] = water_data.load_combined(water_data.COMBINED_PATH, metrics)
+    module.run(data["clean"], metrics)
+
+
+def run_single_process(stages=STAGES, force=False, only=None):
+    """
+    Run the stages one after another inside this interpreter, in dependency
+    order, sharing one loaded dataset. Heavy modules (Prophet, sklearn,
+    matplotlib) are only imported for stages that actually run.
+    """
+    os.environ["WMS_PROJECT_ROOT"] = PROJECT_ROOT
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    os.environ.setdefault("WMS_RUN_ID", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    from instrumentation import stage as stage_metrics
+
+    deps = resolve_dependencies(stages)
+    selected = set(only) if only else {s["name"] for s in stages}
+    state = load_state()
+    status, data = {}, {}
+
+    # stages are listed in a valid order already; resolve_dependencies rejected cycles
+    for s in stages:
+        name = s["name"]
+        if any(status.get(u) in ("failed", "blocked") for u in deps[name]):
+            status[name] = "blocked"
+            print(f"⛔ {name}: blocked by failed upstream stage")
+            continue
+        if name not in selected:
+            status[name] = "skipped"
+            continue
+        if not os.path.exists(os.path.join(SCRIPTS_DIR, s["script"])):
+            status[name] = "skipped" if s.get("optional") else "failed"
+            print(f"{'⚠️' if s.get('optional') else '❌'} {name}: {s['script']} not found")
+            continue
+        digest = hash_inputs(s)
+        if not force and is_unchanged(s, digest, state):
+            status[name] = "unchanged"
+            print(f"⏭️ {name}: inputs unchanged since {state[name]['finished_at']}, skipping")
+            continue
+
+        print(f"⏳ {name}: starting ({module_name(s)}, in-process)")
+        t0 = time.perf_counter()
+        try:
+            module = importlib.import_module(module_name(s))
+            with stage_metrics(module_name(s)) as metrics:
+                call_stage(name, module, data, metrics)
+        except (Exception, SystemExit) as e:
+            status[name] = "failed"
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+            continue
+        elapsed = time.perf_counter() - t0
+        status[name] = "ok"
+        state[name] = record(s, hash_inputs(s) if name == "ingest" or rewrites_input(s) else digest, elapsed)
+        save_state(state)
+        print(f"✅ {name}: done in {elapsed:.1f}s")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the WMS pipeline as a dependency graph.")
+    parser.add_argument("--jobs", type=int, default=None, help="max stages running at once")
+    parser.add_argument("--force", action="store_true", help="run stages even if their inputs are unchanged")
+    parser.add_argument("--only", nargs="+", choices=[s["name"] for s in STAGES], help="run just these stages")
+    parser.add_argument("--dry-run", action="store_true", help="print the stage graph and exit")
+    parser.add_argument("--profile", action="store_true", help="dump a cProfile per stage (see instrumentation.py)")
+    parser.add_argument("--single-process", action="store_true",
+                        help="run stages in this process, loading the combined data once")
+    args = parser.parse_args()
+    if args.profile:
+        os.environ["WMS_PROFILE"] = "1"
+
+    print(f"====== Pipeline started at {datetime.now():%Y-%m-%d %H:%M:%S} ({PROJECT_ROOT}) ======")
+    if args.single_process and not args.dry_run:
+        status = run_single_process(force=args.force, only=args.only)
+    else:
+        status = run_pipeline(jobs=args.jobs, force=args.force, only=args.only, dry_run=args.dry_run)
+    if status:
+        print(f"====== Pipeline finished at {datetime.now():%Y-%m-%d %H:%M:%S} ======")
+        print("   " + "  ".join(f"{k}={v}" for k, v in status.items()))
+    sys.exit(1 if "failed" in status.values() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# readings_db.py
+"""
+Optional SQLite mirror of the CSV data (`database.enabled` in config.yaml),
+so loaders can push filters and aggregation down into indexed SQL instead of
+parsing whole CSVs.
+
+- readings: combined_water_data.csv, stored in (building, ts) order with an
+  index on ts. Ingest appends its new rows, retention deletes the rows it
+  archived; anything else (or a row count that does not add up) rebuilds
+  the table.
+- totals: per-meter hourly and daily totals of the readings, kept up to date
+  by the same transaction (only the periods an append or a trim touches are
+  recomputed), so aggregate queries read a few thousand rows.
+- rollups, alerts, forecasts, mass balance (TABLES): each replaced whole
+  from its CSV right after the stage writing it, indexed on (key, time).
+
+Row fetching through the sqlite3 module costs more per value than pandas'
+CSV parser, so loaders only go to SQL for selective or aggregated queries
+(a meter, a time window, totals); whole-table loads stay on the CSV.
+
+The CSV files stay the source of truth. For every mirrored file the database
+records the size and mtime it was built from; a loader only reads from SQL
+when these still match, and falls back to the CSV otherwise.
+
+The database is one local file in WAL mode: readers (dashboards, stages)
+keep reading the last committed state while a writer syncs, and every sync
+is a single transaction.
+
+`python readings_db.py --rebuild` mirrors everything once;
+`python readings_db.py --bench` compares the SQL and CSV loaders.
+"""
+import os, time, shutil, sqlite3, argparse, tempfile, threading
+import numpy as np
+import pandas as pd
+
+from water_data import PROJECT_ROOT, COMBINED_PATH, CONFIG_PATH, clean_combined, load_config
+
+# ——— CONFIGURATION ——————————————————————————————————————
+# Defaults for the `database` section of config.yaml
+DEFAULT_DATABASE = {
+    "enabled": False,               # mirror the CSVs and let loaders query SQL
+    "path": "data/water.db",        # SQLite file, relative to the project root
+    "busy_timeout_ms": 10000,       # how long a writer waits for another writer
+}
+# mirrored tables: name → (CSV relative to the project root, key column, time column)
+TABLES = {
+    "spike_alerts": ("data/spike_alerts.csv", "Building", "Date/Time"),
+    "night_leak_alerts": ("data/night_leak_alerts.csv", "Building", "Date/Time"),
+    "demand_forecast": ("data/demand_forecast.csv", "Building", "Date"),
+    "rollup_hourly": ("data/rollups/hourly.csv", "Building", "Date/Time"),
+    "rollup_daily": ("data/rollups/daily.csv", "Building", "Date/Time"),
+    "mass_balance": ("data/mass_balance.csv", "Segment", "Date/Time"),
+    "unaccounted_flow_alerts": ("data/unaccounted_flow_alerts.csv", "Segment", "Start"),
+}
+# readings columns: combined column → SQL column
+READING_COLUMNS = {
+    "Date/Time": "ts", "Totalizer (Liters)": "totalizer", "Consumption (Liters)": "consumption",
+    "Building": "building", "Source File": "source", "Quality": "quality",
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    building TEXT NOT NULL, ts INTEGER NOT NULL,  -- epoch seconds
+    seq INTEGER NOT NULL,                         -- CSV row order
+    totalizer REAL, consumption REAL, source TEXT, quality TEXT,
+    PRIMARY KEY (building, ts, seq)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+CREATE TABLE IF NOT EXISTS totals (
+    freq TEXT NOT NULL, building TEXT NOT NULL, period INTEGER NOT NULL,
+    consumption REAL, totalizer REAL, readings INTEGER,
+    PRIMARY KEY (freq, building, period)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY, path TEXT, size INTEGER, mtime_ns INTEGER, rows INTEGER, columns TEXT);
+"""
+PERIODS = {"h": 3600, "D": 86400}  # totals kept per hour and per day
+# ————————————————————————————————————————————————————————
+
+EPOCH = pd.Timestamp("1970-01-01")
+
+
+def load_params(config=None):
+    if config is None:
+        config = load_config(CONFIG_PATH) if os.path.exists(CONFIG_PATH) else {}
+    params = {**DEFAULT_DATABASE, **(config.get("database") or {})}
+    params["path"] = os.path.join(PROJECT_ROOT, params["path"])
+    return params
+
+
+def connect(params=None):
+    """Connection in autocommit mode (transactions are explicit), WAL journal."""
+    params = params or load_params()
+    os.makedirs(os.path.dirname(params["path"]), exist_ok=True)
+    conn = sqlite3.connect(params["path"], timeout=params["busy_timeout_ms"] / 1000, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _record(conn, name, path, rows, columns):
+    size, mtime = _signature(path)
+    conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                 (name, path, size, mtime, rows, "\x1f".join(columns)))
+
+
+def _source(conn, name):
+    row = conn.execute("SELECT path, size, mtime_ns, rows, columns FROM sources WHERE name = ?", (name,)).fetchone()
+    return None if row is None else {"path": row[0], "size": row[1], "mtime_ns": row[2], "rows": row[3],
+                                     "columns": row[4].split("\x1f") if row[4] else []}
+
+
+def is_fresh(conn, name, path):
+    """True when the table `name` was built from the current contents of `path`."""
+    src = _source(conn, name)
+    try:
+        return src is not None and (src["size"], src["mtime_ns"]) == _signature(path)
+    except FileNotFoundError:
+        return False
+
+
+def open_fresh(name, path):
+    """A connection when the database is enabled and mirrors `path`, else None (use the CSV)."""
+    params = load_params()
+    if not params["enabled"] or not os.path.exists(params["path"]):
+        return None
+    conn = connect(params)
+    if is_fresh(conn, name, path):
+        return conn
+    conn.close()
+    return None
+
+
+def _epoch(ts):
+    return int((ts - EPOCH) // pd.Timedelta(seconds=1))
+
+
+# --- WRITING ---
+
+def _reading_rows(df, first_seq=0):
+    out = pd.DataFrame({"building": df["Building"].astype(str),
+                        "ts": (pd.to_datetime(df["Date/Time"]) - EPOCH) // pd.Timedelta(seconds=1),
+                        "seq": np.arange(first_seq, first_seq + len(df))})
+    for column, name in READING_COLUMNS.items():
+        if name not in out and column in df:
+            out[name] = df[column]
+    out = out[out["ts"].notna()].astype({"ts": np.int64})
+    columns = ["seq"] + [c for c in READING_COLUMNS.values() if c in out]
+    values = out[columns].astype(object).where(out[columns].notna(), None)
+    return columns, values.itertuples(index=False, name=None), int(out["ts"].min()) if len(out) else None
+
+
+def _distinct(df):
+    """Rows of a combined frame once duplicate readings (same meter and time) are dropped."""
+    return len(df.drop_duplicates(subset=["Building", "Date/Time"]))
+
+
+def _insert_readings(conn, df):
+    """
+    Insert after the rows already there; returns the earliest timestamp inserted.
+    Only the last reading per meter and time is kept (as clean_combined does),
+    replacing one already stored.
+    """
+    df = df.drop_duplicates(subset=["Building", "Date/Time"], keep="last")
+    (last,) = conn.execute("SELECT MAX(seq) FROM readings").fetchone()
+    columns, rows, first_ts = _reading_rows(df, 0 if last is None else last + 1)
+    if last is not None:
+        rows = list(rows)
+        b, t = columns.index("building"), columns.index("ts")
+        conn.executemany("DELETE FROM readings WHERE building = ? AND ts = ?", [(r[b], r[t]) for r in rows])
+    conn.executemany(f"INSERT INTO readings ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+    return first_ts
+
+
+def _refresh_totals(conn, start=None, end=None):
+    """Recompute the totals of every period overlapping [start, end) (all of them by default)."""
+    for freq, seconds in PERIODS.items():
+        lo = None if start is None else start - start % seconds
+        hi = None if end is None else end - end % seconds + (seconds if end % seconds else 0)
+        bounds = [(c, v) for c, v in (("period >= ?", lo), ("period < ?", hi)) if v is not None]
+        conn.execute(f"DELETE FROM totals WHERE freq = ?{''.join(' AND ' + c for c, _ in bounds)}",
+                     [freq] + [v for _, v in bounds])
+        bounds = [(c, v) for c, v in (("ts >= ?", lo), ("ts < ?", hi)) if v is not None]
+        where = (" WHERE " + " AND ".join(c for c, _ in bounds)) if bounds else ""
+        conn.execute(f"INSERT INTO totals SELECT ?, building, ts - ts % {seconds} AS period, "
+                     f"SUM(MAX(consumption, 0)), MAX(totalizer), COUNT(*) FROM readings{where} "
+                     "GROUP BY building, period", [freq] + [v for _, v in bounds])
+
+
+def sync_readings(conn, combined, appended=None, cutoff=None, path=COMBINED_PATH):
+    """
+    Mirror the combined frame just written to `path` (combined_water_data.csv).
+    `appended`: the rows ingest added; `cutoff`: retention archived everything
+    before it. Falls back to a full rebuild when the counts do not add up.
+    Returns "appended" / "trimmed" / "rebuilt".
+    """
+    columns = [c for c in READING_COLUMNS if c in combined.columns]
+    src = _source(conn, "readings")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        mode = "rebuilt"
+        if src is not None and src["columns"] == columns:
+            if appended is not None and src["rows"] + len(appended) == len(combined):
+                first = _insert_readings(conn, appended)
+                if first is not None:
+                    _refresh_totals(conn, start=first)
+                mode = "appended"
+            elif cutoff is not None:
+                cut = _epoch(pd.Timestamp(cutoff))
+                conn.execute("DELETE FROM readings WHERE ts < ?", (cut,))
+                for freq, seconds in PERIODS.items():
+                    conn.execute("DELETE FROM totals WHERE freq = ? AND period < ?", (freq, cut - cut % seconds))
+                _refresh_totals(conn, cut, cut + 1)  # the period the cutoff falls in
+                mode = "trimmed"
+            if mode != "rebuilt":
+                (count,) = conn.execute("SELECT COUNT(*) FROM readings").fetchone()
+                if count != _distinct(combined):
+                    mode = "rebuilt"
+        if mode == "rebuilt":
+            conn.execute("DELETE FROM readings")
+            _insert_readings(conn, combined)
+            _refresh_totals(conn)
+        _record(conn, "readings", path, len(combined), columns)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return mode
+
+
+def publish(conn, name):
+    """Replace table `name` with the current contents of its CSV, in one transaction."""
+    rel, key, when = TABLES[name]
+    path = os.path.join(PROJECT_ROOT, rel)
+    df = pd.read_csv(path)
+    kinds = {c: "REAL" if pd.api.types.is_float_dtype(t) else "INTEGER" if pd.api.types.is_integer_dtype(t)
+             or pd.api.types.is_bool_dtype(t) else "TEXT" for c, t in df.dtypes.items()}
+    staging = _q(name + "__new")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        conn.execute(f"CREATE TABLE {staging} ({', '.join(f'{_q(c)} {k}' for c, k in kinds.items())})")
+        values = df.astype(object).where(df.notna(), None)
+        conn.executemany(f"INSERT INTO {staging} VALUES ({', '.join('?' * len(df.columns))})",
+                         values.itertuples(index=False, name=None))
+        conn.execute(f"DROP TABLE IF EXISTS {_q(name)}")
+        conn.execute(f"ALTER TABLE {staging} RENAME TO {_q(name)}")
+        indexed = [c for c in (key, when) if c in df.columns]
+        if indexed:
+            conn.execute(f"CREATE INDEX {_q(name + '_key_time')} ON {_q(name)} ({', '.join(map(_q, indexed))})")
+        _record(conn, name, path, len(df), list(df.columns))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(df)
+
+
+def write_through(combined=None, appended=None, cutoff=None, tables=(), metrics=None):
+    """
+    Called by the stages right after they write a mirrored CSV; does nothing
+    unless `database.enabled`. A failed sync only leaves the mirror stale
+    (loaders then read the CSV), so it never fails the stage.
+    """
+    params = load_params()
+    if not params["enabled"]:
+        return
+    try:
+        conn = connect(params)
+        if combined is not None:
+            if metrics is not None:
+                with metrics.step("db_sync"):
+                    mode = sync_readings(conn, combined, appended, cutoff)
+                metrics.wrote(params["path"], rows=len(combined))
+            else:
+                mode = sync_readings(conn, combined, appended, cutoff)
+            print(f"🗃️ Database: readings {mode} ({len(combined):,} rows)")
+        for name in tables:
+            if os.path.exists(os.path.join(PROJECT_ROOT, TABLES[name][0])):
+                publish(conn, name)
+        conn.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️ Database sync failed, loaders will read the CSV files: {e}")
+
+
+# --- READING ---
+
+def _where(time_column, start, end, key_column, keys, to_param=lambda t: t):
+    clauses, args = [], []
+    if start is not None:
+        clauses.append(f"{time_column} >= ?")
+        args.append(to_param(pd.Timestamp(start)))
+    if end is not None:
+        clauses.append(f"{time_column} <= ?")
+        args.append(to_param(pd.Timestamp(end)))
+    if keys is not None:
+        keys = list(keys)
+        clauses.append(f"{key_column} IN ({', '.join('?' * len(keys))})")
+        args += [str(k) for k in keys]
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+
+def query_readings(conn, start=None, end=None, buildings=None):
+    """Cleaned readings (like water_data.clean_combined) filtered in SQL."""
+    columns = _source(conn, "readings")["columns"]
+    select = {"Date/Time": "ts", "Totalizer (Liters)": "totalizer",
+              "Consumption (Liters)": "COALESCE(MAX(consumption, 0), 0)", "Building": "building",
+              "Source File": "source", "Quality": "quality"}
+    where, args = _where("ts", start, end, "building", buildings, _epoch)
+    cur = conn.execute(f"SELECT {', '.join(select[c] for c in columns)} FROM readings{where} "
+                       "ORDER BY building, ts, seq", args)
+    df = pd.DataFrame(cur.fetchall(), columns=columns)
+    df["Date/Time"] = (df["Date/Time"].to_numpy(dtype=np.int64) * 10 ** 9).astype("datetime64[ns]")
+    for c in ("Totalizer (Liters)", "Consumption (Liters)"):
+        if c in df:
+            df[c] = df[c].astype(float)
+    return df
+
+
+def query_totals(conn, freq="D", start=None, end=None, buildings=None):
+    """Per-meter totals per hour ("h") or day ("D") from the totals table: like retention.rollup()."""
+    where, args = _where("period", start, end, "building", buildings, _epoch)
+    where = (where + " AND" if where else " WHERE") + " freq = ?"
+    cur = conn.execute(f"SELECT period, building, consumption, totalizer, readings FROM totals{where} "
+                       "ORDER BY period, building", args + [freq])
+    df = pd.DataFrame(cur.fetchall(), columns=["Date/Time", "Building", "Consumption (Liters)",
+                                               "Totalizer (Liters)", "Readings"])
+    df["Date/Time"] = (df["Date/Time"].to_numpy(dtype=np.int64) * 10 ** 9).astype("datetime64[ns]")
+    df["Consumption (Liters)"] = df["Consumption (Liters)"].astype(float).fillna(0).round(3)
+    return df
+
+
+def load_totals(freq="D", start=None, end=None, buildings=None):
+    """query_totals() when the database mirrors the combined file, else None."""
+    conn = open_fresh("readings", COMBINED_PATH)
+    if conn is None:
+        return None
+    try:
+        return query_totals(conn, freq, start, end, buildings)
+    finally:
+        conn.close()
+
+
+def load_table(name, start=None, end=None, keys=None, parse_dates=None):
+    """A mirrored table, filtered on its time and key columns: from SQL when fresh, else from the CSV."""
+    rel, key, when = TABLES[name]
+    path = os.path.join(PROJECT_ROOT, rel)
+    conn = open_fresh(name, path)
+    if conn is None:
+        df = pd.read_csv(path)
+        if start is not None:
+            df = df[pd.to_datetime(df[when]) >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[pd.to_datetime(df[when]) <= pd.Timestamp(end)]
+        if keys is not None:
+            df = df[df[key].astype(str).isin([str(k) for k in keys])]
+    else:
+        try:
+            where, args = _where(_q(when), start, end, _q(key), keys, lambda t: str(t))
+            cur = conn.execute(f"SELECT * FROM {_q(name)}{where}", args)
+            df = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+        finally:
+            conn.close()
+    for c in parse_dates or []:
+        df[c] = pd.to_datetime(df[c], errors="coerce")
+    return df.reset_index(drop=True)
+
+
+def table_for(path):
+    """Name of the mirrored table built from `path`, if any."""
+    path = os.path.abspath(path)
+    for name, (rel, _, _) in TABLES.items():
+        if os.path.abspath(os.path.join(PROJECT_ROOT, rel)) == path:
+            return name
+    return None
+
+
+def rebuild(params=None):
+    """Mirror the combined file and every existing table CSV from scratch."""
+    params = params or load_params()
+    conn = connect(params)
+    conn.execute("DELETE FROM sources")
+    combined = pd.read_csv(COMBINED_PATH, parse_dates=["Date/Time"])
+    sync_readings(conn, combined)
+    names = [n for n, (rel, _, _) in TABLES.items() if os.path.exists(os.path.join(PROJECT_ROOT, rel))]
+    for name in names:
+        publish(conn, name)
+    conn.close()
+    print(f"🗃️ {params['path']}: {len(combined):,} readings, tables {', '.join(names) or '-'} "
+          f"({os.path.getsize(params['path']) / 1e6:.1f} MB)")
+
+
+# --- BENCHMARK ---
+
+def _timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best or 1e9, time.perf_counter() - t0)
+    return result, best
+
+
+def bench(meters, days):
+    """Synthetic campus in a scratch directory: SQL loaders vs the CSV path."""
+    import synthetic_data
+
+    scratch = tempfile.mkdtemp(prefix="wms_db_bench_")
+    csv_path = os.path.join(scratch, "combined_water_data.csv")
+    readings, _ = synthetic_data.simulate(synthetic_data.make_meters(meters), days, seed=42)
+    readings["Source File"] = "Packet-synthetic.csv"
+    readings.to_csv(csv_path, index=False)
+    params = {**DEFAULT_DATABASE, "path": os.path.join(scratch, "water.db")}
+    conn = connect(params)
+    _, t_sync = _timed(lambda: sync_readings(conn, readings, path=csv_path), repeat=1)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")   # so the file size below includes the synced rows
+    newest = readings["Date/Time"].max()
+    one = readings["Building"].iloc[0]
+    week = (newest - pd.Timedelta(days=7), newest)
+
+    def csv(start=None, end=None, buildings=None):
+        df = clean_combined(pd.read_csv(csv_path, parse_dates=["Date/Time"]))
+        keep = pd.Series(True, index=df.index)
+        if start is not None:
+            keep &= (df["Date/Time"] >= start) & (df["Date/Time"] <= end)
+        if buildings is not None:
+            keep &= df["Building"].isin(buildings)
+        return df[keep]
+
+    def csv_totals(freq, buildings=None):
+        df = csv(buildings=buildings)
+        return df.groupby(["Building", df["Date/Time"].dt.floor(freq)])["Consumption (Liters)"].sum()
+
+    cases = [
+        ("all readings", lambda: csv(), lambda: query_readings(conn)),
+        ("one meter, all time", lambda: csv(buildings=[one]), lambda: query_readings(conn, buildings=[one])),
+        ("all meters, last 7 days", lambda: csv(*week), lambda: query_readings(conn, *week)),
+        ("one meter, last 7 days", lambda: csv(*week, [one]), lambda: query_readings(conn, *week, [one])),
+        ("daily totals, all meters", lambda: csv_totals("D"), lambda: query_totals(conn, "D")),
+        ("hourly totals, one meter", lambda: csv_totals("h", [one]), lambda: query_totals(conn, "h", buildings=[one])),
+    ]
+    print(f"📦 synthetic {meters} meters × {days} days: {len(readings):,} readings, "
+          f"CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, SQLite {os.path.getsize(params['path']) / 1e6:.1f} MB "
+          f"(full sync {t_sync:.1f}s)")
+    print(f"   {'query':<26} {'rows':>9} {'CSV':>9} {'SQLite':>9}")
+    for label, via_csv, via_sql in cases:
+        a, t_csv = _timed(via_csv)
+        b, t_sql = _timed(via_sql)
+        assert len(a) == len(b), (label, len(a), len(b))
+        print(f"   {label:<26} {len(b):>9,} {t_csv * 1000:>7.0f}ms {t_sql * 1000:>7.0f}ms  ({t_csv / t_sql:.0f}×)")
+
+    # readers keep going while a writer appends a day in one transaction
+    extra, _ = synthetic_data.simulate(synthetic_data.make_meters(meters), 1, seed=7)
+    extra["Date/Time"] += newest - extra["Date/Time"].min() + pd.Timedelta(minutes=30)
+    extra["Source File"] = "Packet-synthetic.csv"
+    seen, errors, stop = [], [], threading.Event()
+
+    def reader():
+        rc = connect(params)
+        while not stop.is_set():
+            try:
+                seen.append(rc.execute("SELECT COUNT(*) FROM readings").fetchone()[0])
+            except sqlite3.Error as e:
+                errors.append(e)
+        rc.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    t0 = time.perf_counter()
+    mode = sync_readings(conn, pd.concat([readings, extra], ignore_index=True), appended=extra, path=csv_path)
+    t_append = time.perf_counter() - t0
+    time.sleep(0.05)
+    stop.set()
+    for t in threads:
+        t.join()
+    print(f"   append of {len(extra):,} rows ({mode}) {t_append * 1000:.0f} ms while 2 readers ran "
+          f"{len(seen):,} queries: {len(errors)} errors, counts seen {sorted(set(seen))}")
+    conn.close()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite mirror of the CSV data with pushed-down loaders.")
+    parser.add_argument("--rebuild", action="store_true", help="mirror the combined file and all tables now")
+    parser.add_argument("--bench", action="store_true", help="compare SQL and CSV loaders on a synthetic campus")
+    parser.add_argument("--meters", type=int, default=240)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.meters, args.days)
+    elif args.rebuild:
+        rebuild()
+    else:
+        params = load_params()
+        print(f"🗃️ database {'enabled' if params['enabled'] else 'disabled'}: {params['path']}")
+        if os.path.exists(params["path"]):
+            conn = connect(params)
+            for name, path in [("readings", COMBINED_PATH)] + [(n, os.path.join(PROJECT_ROOT, t[0])) for n, t in TABLES.items()]:
+                src = _source(conn, name)
+                if src is not None:
+                    print(f"   {name:<24} {src['rows']:>10,} rows  {'fresh' if is_fresh(conn, name, path) else 'stale'}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# replay.py
+"""
+Replay / backfill: run detectors over the stored history, with any number of
+configurations side by side, as fast as the machine allows.
+
+Readings come from every retention tier (retention.query: archive partitions
+plus the combined file), from a CSV (--data) or from a synthetic campus
+(--synthetic). Each configuration is a run: a detector from DETECTORS plus
+parameter overrides, e.g.
+
+    python replay.py --run base=isolation_forest \\
+                     --run strict=isolation_forest:night_contamination=0.005 \\
+                     --run rule=leak_controller:spike_ratio=4
+
+Detectors:
+
+- isolation_forest: leak_detection.detect(), batch, fitted on the whole
+  campus at once (as the pipeline stage does), so a run is one task;
+- leak_controller: the online night-flow and 3× spike rules of
+  dashboard/leak_controller.py, fed reading by reading with valves switched
+  off;
+- baseline: the hour-of-week profile of baseline_profile.py, each week
+  scored against the weeks before it.
+
+Meters are independent for the last two, so their runs are sharded by
+building: buildings are split into `workers` shards of about equal size.
+
+Tasks (run × shard) go to a process pool. Alerts become episodes (alerts of
+one meter and kind no more than `merge_gap_minutes` apart), written to
+data/replay/episodes.csv with one row per episode and run. The summary
+compares every run with the first: episodes in both, and only in either.
+Throughput is reported in readings per second, per run (single core) and
+for the whole replay.
+
+Settings: the `replay` section of config.yaml.
+"""
+import os, sys, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import StageMetrics, start_stage
+from water_data import PROJECT_ROOT, load_combined, load_config, write_csv
+
+# ——— CONFIGURATION ——————————————————————————————————————
+DASHBOARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard")
+DEFAULT_REPLAY = {
+    "merge_gap_minutes": 60,        # alerts closer than this (same meter and kind) are one episode
+    "workers": min(4, os.cpu_count() or 1),
+    "out_dir": "data/replay",
+}
+EPISODE_COLUMNS = ["run", "detector", "Building", "kind", "start", "end", "alerts", "peak"]
+# ————————————————————————————————————————————————————————
+
+
+def load_params(config=None):
+    config = config if config is not None else load_config()
+    return {**DEFAULT_REPLAY, **(config.get("replay") or {})}
+
+
+# --- DETECTORS ---
+
+def episodes(alerts, kind, gap, value):
+    """Alert rows (Building, Date/Time, value column) → one row per episode of consecutive alerts."""
+    if alerts.empty:
+        return pd.DataFrame(columns=EPISODE_COLUMNS[2:])
+    a = alerts.sort_values(["Building", "Date/Time"], kind="stable")
+    new = (a["Building"] != a["Building"].shift()) | (a["Date/Time"].diff() > gap)
+    return (a.assign(_episode=new.cumsum())
+             .groupby("_episode")
+             .agg(Building=("Building", "first"), start=("Date/Time", "min"), end=("Date/Time", "max"),
+                  alerts=("Date/Time", "size"), peak=(value, "max"))
+             .assign(kind=kind)
+             .reset_index(drop=True)[EPISODE_COLUMNS[2:]])
+
+
+def _isolation_forest(df, params, gap):
+    from leak_detection import detect
+
+    spikes, nights = detect(df, StageMetrics("replay"), params)
+    value = "Hourly Consumption (Liters)"
+    return pd.concat([episodes(spikes, "spike", gap, value), episodes(nights, "night", gap, value)],
+                     ignore_index=True)
+
+
+class _NoValves:
+    """Valve sink for replays: commands are recorded on the episode, nothing is actuated."""
+
+    def submit(self, valve, action, source):
+        return None
+
+
+def _leak_controller(df, params, gap):
+    if DASHBOARD_DIR not in sys.path:
+        sys.path.insert(0, DASHBOARD_DIR)
+    from leak_controller import LeakController
+
+    controller = LeakController(_NoValves(), params, source="replay")
+    df = df.dropna(subset=["Totalizer (Liters)"]).sort_values(["Building", "Date/Time"], kind="stable")
+    times = pd.DatetimeIndex(df["Date/Time"]).to_pydatetime()
+    totals = df["Totalizer (Liters)"].to_numpy(dtype=float)
+    on_reading = controller.on_reading
+    for meter, idx in df.groupby("Building", sort=False).indices.items():
+        for ts, total in zip(times[idx], totals[idx]):
+            on_reading(meter, ts, total, 0.0)
+    last = df.groupby("Building")["Date/Time"].max()
+    rows = [{"Building": ep["meter"], "kind": "night" if ep["kind"] == "night_flow" else ep["kind"],
+             "start": ep["started"], "end": ep["ended"] or last[ep["meter"]], "alerts": 1, "peak": ep["peak_lph"]}
+            for ep in controller.episodes]
+    if not rows:
+        return pd.DataFrame(columns=EPISODE_COLUMNS[2:])
+    out = pd.DataFrame(rows)
+    out["start"], out["end"] = pd.to_datetime(out["start"]), pd.to_datetime(out["end"])
+    # back-to-back spike alerts of one meter are one episode, as for the batch detector
+    spikes = out["kind"] == "spike"
+    merged = episodes(out[spikes].rename(columns={"start": "Date/Time"}), "spike", gap, "peak")
+    return pd.concat([out[~spikes], merged], ignore_index=True)[EPISODE_COLUMNS[2:]]
+
+
+def _baseline(df, params, gap):
+    import baseline_profile
+
+    spikes, nights, _ = baseline_profile.detect(df, params)
+    value = "Hourly Consumption (Liters)"
+    return pd.concat([episodes(spikes, "spike", gap, value), episodes(nights, "night", gap, value)],
+                     ignore_index=True)
+
+
+def _baseline_defaults():
+    import baseline_profile
+    return baseline_profile.load_params()
+
+
+def _leak_controller_defaults():
+    if DASHBOARD_DIR not in sys.path:
+        sys.path.insert(0, DASHBOARD_DIR)
+    from leak_controller import load_policy
+    return load_policy()
+
+
+def _isolation_forest_defaults():
+    from leak_detection import load_params
+    return {**load_params(), "detector": "isolation_forest"}
+
+
+# name → (scope, function(df, params, gap) → episodes, current settings)
+# scope "campus": one task over all buildings; "meter": sharded by building
+DETECTORS = {
+    "isolation_forest": ("campus", _isolation_forest, _isolation_forest_defaults),
+    "leak_controller": ("meter", _leak_controller, _leak_controller_defaults),
+    "baseline": ("meter", _baseline, _baseline_defaults),
+}
+
+
+def _baseline_warmup(params, cadence):
+    # a cell is scored once it holds min_samples rates, and detect() scores refresh_days at a time
+    per_week = max(1, int(pd.Timedelta(hours=1) / cadence))    # rates per hour-of-week cell and week
+    days = -(-int(params["min_samples"]) // per_week) * 7
+    step = int(params["refresh_days"])
+    return pd.Timedelta(days=-(-days // step) * step)
+
+
+def _leak_controller_warmup(params, cadence):
+    return int(params["spike_history"]) * cadence
+
+
+# detector → function(params, cadence) → history it needs before it can flag anything (none when absent)
+WARMUP = {
+    "leak_controller": _leak_controller_warmup,
+    "baseline": _baseline_warmup,
+}
+
+
+def warmup(detector, overrides, cadence):
+    """History the detector needs, with these overrides, before it can flag anything; `cadence` is the reading interval."""
+    if detector not in WARMUP:
+        return pd.Timedelta(0)
+    return WARMUP[detector]({**DETECTORS[detector][2](), **overrides}, cadence)
+
+
+def parse_run(spec):
+    """'name=detector:key=value,key=value' (name and overrides optional) → (name, detector, overrides)."""
+    head, _, options = spec.partition(":")
+    name, _, detector = head.rpartition("=")
+    if detector not in DETECTORS:
+        raise ValueError(f"unknown detector {detector!r} (choose from {', '.join(DETECTORS)})")
+    overrides = {}
+    for item in filter(None, options.split(",")):
+        key, _, value = item.partition("=")
+        try:
+            overrides[key] = float(value) if "." in value or "e" in value.lower() else int(value)
+        except ValueError:
+            overrides[key] = {"true": True, "false": False}.get(value.lower(), value)
+    return name or (detector + (":" + options if options else "")), detector, overrides
+
+
+# --- REPLAY ---
+
+def shards(df, n):
+    """Split the buildings into n groups of about the same number of readings (largest first)."""
+    sizes = df["Building"].value_counts()
+    groups = [[] for _ in range(max(1, min(n, len(sizes))))]
+    load = [0] * len(groups)
+    for building, size in sizes.items():
+        i = load.index(min(load))
+        groups[i].append(building)
+        load[i] += size
+    return [g for g in groups if g]
+
+
+def _task(job):
+    name, detector, params, gap, df = job
+    t0 = time.perf_counter()
+    out = DETECTORS[detector][1](df, params, gap)
+    return name, len(df), time.perf_counter() - t0, out
+
+
+def replay(df, runs, settings):
+    """
+    Run every (name, detector, overrides) over the readings. Returns
+    (episodes frame, per-run stats {name: {readings, seconds, readings_per_s}}, elapsed seconds).
+    """
+    gap = pd.Timedelta(minutes=settings["merge_gap_minutes"])
+    workers = int(settings["workers"])
+    groups = shards(df, workers)
+    by_building = df.groupby("Building", sort=False).indices
+    jobs = []
+    for name, detector, overrides in runs:
+        scope, _, defaults = DETECTORS[detector]
+        params = {**defaults(), **overrides}
+        if scope == "meter":
+            for group in groups:
+                idx = np.concatenate([by_building[b] for b in group])
+                jobs.append((name, detector, params, gap, df.iloc[np.sort(idx)]))
+        else:
+            jobs.append((name, detector, params, gap, df))
+
+    t0 = time.perf_counter()
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_task, jobs))
+    else:
+        results = [_task(job) for job in jobs]
+    elapsed = time.perf_counter() - t0
+
+    detector_of = {name: detector for name, detector, _ in runs}
+    stats, frames = {}, []
+    for name, rows, seconds, out in results:
+        s = stats.setdefault(name, {"readings": 0, "seconds": 0.0})
+        s["readings"] += rows
+        s["seconds"] += seconds
+        if not out.empty:
+            frames.append(out.assign(run=name, detector=detector_of[name]))
+    for s in stats.values():
+        s["readings_per_s"] = s["readings"] / s["seconds"] if s["seconds"] else None
+    found = (pd.concat(frames, ignore_index=True)[EPISODE_COLUMNS] if frames
+             else pd.DataFrame(columns=EPISODE_COLUMNS))
+    return found.sort_values(["run", "Building", "start"], kind="stable").reset_index(drop=True), stats, elapsed
+
+
+def compare(found, base, other, gap):
+    """Episodes of `other` that overlap one of `base` (same meter and kind, within gap) and those that do not."""
+    a = found[found["run"] == base].reset_index(drop=True)
+    b = found[found["run"] == other].reset_index(drop=True)
+    pairs = a.reset_index().merge(b.reset_index(), on=["Building", "kind"], suffixes=("_a", "_b"))
+    pairs = pairs[(pairs["start_a"] <= pairs["end_b"] + gap) & (pairs["start_b"] <= pairs["end_a"] + gap)]
+    return {"both": pairs["index_b"].nunique(), "only_base": len(a) - pairs["index_a"].nunique(),
+            "only_run": len(b) - pairs["index_b"].nunique()}
+
+
+def load_readings(args):
+    if args.synthetic:
+        import synthetic_data
+        meters = synthetic_data.make_meters(args.meters)
+        readings, _ = synthetic_data.simulate(meters, args.days, seed=args.seed)
+        return readings
+    if args.data:
+        return load_combined(args.data, start=args.start, end=args.end)
+    import retention
+    return retention.query(args.start, args.end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the stored history through detectors and compare configurations.")
+    parser.add_argument("--run", action="append", metavar="NAME=DETECTOR[:KEY=VALUE,...]",
+                        help=f"a detector configuration (repeatable; detectors: {', '.join(DETECTORS)}). "
+                             "Default: every detector with its current settings")
+    parser.add_argument("--start", help="first timestamp to replay")
+    parser.add_argument("--end", help="last timestamp to replay")
+    parser.add_argument("--data", help="replay this combined CSV instead of the retention tiers")
+    parser.add_argument("--synthetic", action="store_true", help="replay a synthetic campus instead")
+    parser.add_argument("--meters", type=int, default=240)
+    parser.add_argument("--days", type=int, default=56)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, help="override replay.workers")
+    parser.add_argument("--out", help="episodes CSV (default: <out_dir>/episodes.csv)")
+    args = parser.parse_args()
+
+    settings = load_params()
+    if args.workers is not None:
+        settings["workers"] = args.workers
+    try:
+        runs = [parse_run(spec) for spec in (args.run or DETECTORS)]
+    except ValueError as e:
+        parser.error(str(e))
+    if len({name for name, _, _ in runs}) < len(runs):
+        parser.error("run names must be unique")
+
+    metrics = start_stage("replay")
+    with metrics.step("load"):
+        df = load_readings(args)
+    print(f"⏳ Replaying {len(df):,} readings of {df['Building'].nunique()} meters "
+          f"({df['Date/Time'].min()} → {df['Date/Time'].max()}) through {len(runs)} run(s), "
+          f"{settings['workers']} worker(s)")
+    with metrics.step("replay"):
+        found, stats, elapsed = replay(df, runs, settings)
+
+    out = args.out or os.path.join(PROJECT_ROOT, settings["out_dir"], "episodes.csv")
+    write_csv(found, out, index=False)
+    metrics.wrote(out, rows=len(found))
+
+    gap = pd.Timedelta(minutes=settings["merge_gap_minutes"])
+    base = runs[0][0]
+    total = sum(s["readings"] for s in stats.values())
+    print(f"✅ Replay done in {elapsed:.1f}s: {total / elapsed:,.0f} readings/s over all runs → {out}")
+    for name, detector, overrides in runs:
+        eps = found[found["run"] == name]
+        kinds = ", ".join(f"{k} {v}" for k, v in eps["kind"].value_counts().sort_index().items()) or "none"
+        line = (f"   {name:<24} {len(eps):>5} episode(s) ({kinds}) on {eps['Building'].nunique()} meter(s) | "
+                f"{stats[name]['readings_per_s']:,.0f} readings/s")
+        if name != base:
+            c = compare(found, base, name, gap)
+            line += f" | vs {base}: {c['both']} shared, +{c['only_run']} new, −{c['only_base']} missing"
+        print(line)
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
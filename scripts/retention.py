@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# retention.py
+"""
+Retention tiers for the readings.
+
+- raw: combined_water_data.csv keeps the last `raw_days` of readings (counted
+  back from the newest reading), so every stage that loads it pays for a
+  bounded window, not the whole history;
+- archive: older readings move, de-duplicated, into monthly partitions
+  data/archive/raw-YYYY-MM.csv.gz (or .wmsz, the block-compressed series
+  format of series_codec.py, with `archive_format: wmsz`);
+- hourly: data/rollups/hourly.csv holds per-meter hourly totals of the
+  archived readings for the last `hourly_days`;
+- daily: data/rollups/daily.csv holds per-meter daily totals of everything
+  archived, kept forever.
+
+Rollups of a month are recomputed from its archive partition whenever the
+partition changes, so compacting twice (or after a crash half-way) never
+double-counts. query() reads across the tiers: raw readings come from the
+combined file plus only the archive partitions that overlap the requested
+range; hourly and daily series combine the rollups with the hot readings.
+Stages that get the hot frame from the pipeline extend their totals back
+over the archive with with_archive() (forecast_demand.py, the usage plots);
+leak detection stays on the raw window on purpose.
+
+Policy: the `retention` section of config.yaml.
+"""
+import os, glob, argparse
+import pandas as pd
+
+import readings_db
+import series_codec
+from instrumentation import start_stage
+from water_data import PROJECT_ROOT, COMBINED_PATH, CONFIG_PATH, clean_combined, file_lock, load_config, write_csv
+
+# ——— CONFIGURATION ——————————————————————————————————————
+DATA_FOLDER = os.path.join(PROJECT_ROOT, "data")
+
+# Defaults for the `retention` section of config.yaml
+DEFAULT_RETENTION = {
+    "raw_days": 90,                 # readings kept in combined_water_data.csv
+    "hourly_days": 730,             # hourly rollups kept for archived readings
+    "archive_dir": "data/archive",  # monthly partitions of the archived readings
+    "archive_format": "csv.gz",     # or "wmsz" (series_codec.py); partitions convert on their next write
+    "rollup_dir": "data/rollups",   # hourly.csv and daily.csv
+}
+COLUMNS = ["Date/Time", "Totalizer (Liters)", "Consumption (Liters)", "Building", "Source File", "Quality"]
+ROLLUP_COLUMNS = ["Date/Time", "Building", "Consumption (Liters)", "Totalizer (Liters)", "Readings"]
+ARCHIVE_FORMATS = ("csv.gz", "wmsz")
+FREQS = {"hourly": "h", "daily": "D"}
+# ————————————————————————————————————————————————————————
+
+
+def load_policy(config=None):
+    if config is None:
+        config = load_config(CONFIG_PATH) if os.path.exists(CONFIG_PATH) else {}
+    policy = {**DEFAULT_RETENTION, **(config.get("retention") or {})}
+    for key in ("archive_dir", "rollup_dir"):
+        policy[key] = os.path.join(PROJECT_ROOT, policy[key])
+    if policy["archive_format"] not in ARCHIVE_FORMATS:
+        raise ValueError(f"❌ retention.archive_format must be one of {', '.join(ARCHIVE_FORMATS)}")
+    return policy
+
+
+def partition_path(policy, month):
+    return os.path.join(policy["archive_dir"], f"raw-{month}.{policy['archive_format']}")
+
+
+def partitions(policy, start=None, end=None):
+    """Archive partitions (month → path) overlapping [start, end], in either format."""
+    out = {}
+    paths = [p for fmt in ARCHIVE_FORMATS for p in glob.glob(os.path.join(policy["archive_dir"], f"raw-*.{fmt}"))]
+    # sorted so that, should a month exist in both formats, the configured one wins
+    for path in sorted(paths, key=lambda p: (os.path.basename(p)[4:11], p.endswith(policy["archive_format"]))):
+        month = os.path.basename(path)[4:11]
+        first = pd.Timestamp(month + "-01")
+        if (end is None or first <= pd.Timestamp(end)) and \
+                (start is None or first + pd.offsets.MonthBegin(1) > pd.Timestamp(start)):
+            out[month] = path
+    return out
+
+
+def rollup(df, freq):
+    """Per-meter totals per period: consumption sum, last totalizer, number of readings."""
+    if df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    period = df["Date/Time"].dt.floor(freq)
+    df = df.assign(**{"Consumption (Liters)": df["Consumption (Liters)"].clip(lower=0)})
+    out = (df.groupby(["Building", period])
+           .agg(**{"Consumption (Liters)": ("Consumption (Liters)", "sum"),
+                   "Totalizer (Liters)": ("Totalizer (Liters)", "max"),
+                   "Readings": ("Consumption (Liters)", "size")})
+           .reset_index())
+    out["Consumption (Liters)"] = out["Consumption (Liters)"].round(3)
+    return out[ROLLUP_COLUMNS]
+
+
+def _write(df, path, **kwargs):
+    """Atomic replace (water_data.write_csv), so a crash never leaves half a file behind."""
+    write_csv(df, path, index=False, **kwargs)
+
+
+def _read(path, start=None, end=None):
+    try:
+        if path.endswith(".wmsz"):
+            return series_codec.read(path, start, end)
+        return pd.read_csv(path, parse_dates=["Date/Time"])
+    except FileNotFoundError:
+        return None
+
+
+def _write_partition(part, path):
+    if path.endswith(".wmsz"):
+        series_codec.write(part, path)
+    else:
+        _write(part, path, columns=[c for c in COLUMNS if c in part.columns], compression="gzip")
+
+
+def compact(combined, policy, metrics=None):
+    """
+    Move readings older than the raw window into the archive and refresh the
+    rollups of the months they belong to. Returns the hot frame (only
+    de-duplicated when there was nothing to move) and a summary dict.
+    """
+    combined = combined.copy()
+    combined["Date/Time"] = pd.to_datetime(combined["Date/Time"], errors="coerce")
+    # duplicate source exports carry the same reading twice; both tiers keep one
+    dupes = combined.duplicated(subset=["Building", "Date/Time"], keep="last").to_numpy()
+    combined = combined[~dupes]
+    newest = combined["Date/Time"].max()
+    summary = {"archived": 0, "months": [], "kept": len(combined), "duplicates": int(dupes.sum())}
+    if pd.isna(newest):
+        return combined, summary
+    cutoff = (newest - pd.Timedelta(days=policy["raw_days"])).normalize()
+    old = (combined["Date/Time"] < cutoff).to_numpy()
+    if not old.any():
+        return combined, summary
+
+    aged = combined[old]
+    months = aged["Date/Time"].dt.strftime("%Y-%m")
+    hourly_cutoff = newest - pd.Timedelta(days=policy["hourly_days"])
+    hourly_parts, daily_parts = [], []
+    stored = partitions(policy)
+    for month, rows in aged.groupby(months):
+        path = partition_path(policy, month)
+        existing = _read(stored[month]) if month in stored else None
+        part = pd.concat([existing, rows], ignore_index=True) if existing is not None else rows
+        part = (part.drop_duplicates(subset=["Building", "Date/Time"], keep="last")
+                .sort_values(["Date/Time", "Building"], kind="stable"))
+        _write_partition(part, path)
+        if month in stored and stored[month] != path:
+            os.remove(stored[month])  # converted to the configured format
+        if metrics is not None:
+            metrics.wrote(path, rows=len(part))
+        hourly_parts.append(rollup(part, "h"))
+        daily_parts.append(rollup(part, "D"))
+        summary["months"].append(month)
+
+    # the rollups of every touched month are replaced, not added to
+    touched = set(summary["months"])
+    for name, parts, keep_after in (("hourly", hourly_parts, hourly_cutoff), ("daily", daily_parts, None)):
+        path = os.path.join(policy["rollup_dir"], f"{name}.csv")
+        existing = _read(path)
+        if existing is not None:
+            existing = existing[~existing["Date/Time"].dt.strftime("%Y-%m").isin(touched)]
+        table = pd.concat([t for t in [existing, *parts] if t is not None and not t.empty], ignore_index=True)
+        if keep_after is not None:
+            table = table[table["Date/Time"] >= keep_after.floor("D")]
+        table = table.sort_values(["Date/Time", "Building"], kind="stable")
+        _write(table, path, columns=ROLLUP_COLUMNS)
+        if metrics is not None:
+            metrics.wrote(path, rows=len(table))
+
+    hot = combined[~old]
+    summary.update(archived=int(old.sum()), kept=len(hot), cutoff=cutoff)
+    return hot, summary
+
+
+def run(combined, metrics, config=None):
+    """
+    Pipeline stage: apply the retention policy to combined_water_data.csv.
+    Returns the hot (raw, uncleaned) frame for the stages after it.
+    """
+    policy = load_policy(config)
+    if combined is None:
+        with metrics.step("read_combined"):
+            combined = pd.read_csv(COMBINED_PATH, parse_dates=["Date/Time"])
+        metrics.read(COMBINED_PATH, rows=len(combined))
+    with metrics.step("compact"):
+        hot, summary = compact(combined, policy, metrics)
+    if summary["duplicates"]:
+        print(f"🧹 Retention: dropped {summary['duplicates']:,} duplicate readings")
+    if not summary["archived"] and not summary["duplicates"]:
+        print(f"✅ Retention: all {len(hot):,} readings are within the last {policy['raw_days']} days")
+        return combined
+    with metrics.step("write_combined"), file_lock(COMBINED_PATH):
+        _write(hot, COMBINED_PATH, columns=[c for c in COLUMNS if c in hot.columns])
+    metrics.wrote(COMBINED_PATH, rows=len(hot))
+    readings_db.write_through(combined=hot, cutoff=summary.get("cutoff"), tables=["rollup_hourly", "rollup_daily"],
+                              metrics=metrics)
+    if not summary["archived"]:
+        print(f"✅ Retention: all {len(hot):,} readings are within the last {policy['raw_days']} days")
+        return hot
+    print(f"🗄️ Retention: archived {summary['archived']:,} readings before {summary['cutoff']:%Y-%m-%d} "
+          f"({', '.join(summary['months'])}), {summary['kept']:,} kept in {os.path.basename(COMBINED_PATH)}")
+    return hot
+
+
+def query(start=None, end=None, buildings=None, resolution="raw", policy=None):
+    """
+    Readings (or hourly / daily totals) between start and end from every tier:
+    the combined file, the archive partitions that overlap the range and the rollups.
+    Raw results come back cleaned like water_data.load_combined().
+    """
+    policy = policy or load_policy()
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    hot = pd.read_csv(COMBINED_PATH, parse_dates=["Date/Time"])
+    hot_from = hot["Date/Time"].min()
+
+    def clip(df):
+        keep = pd.Series(True, index=df.index)
+        if start is not None:
+            keep &= df["Date/Time"] >= start
+        if end is not None:
+            keep &= df["Date/Time"] <= end
+        if buildings is not None:
+            keep &= df["Building"].isin(list(buildings))
+        return df[keep]
+
+    if resolution == "raw":
+        cold = [clip(_read(p, start, end)) for p in partitions(policy, start, end).values()]
+        out = pd.concat([*cold, clip(hot)], ignore_index=True)
+        return clean_combined(out.drop_duplicates(subset=["Building", "Date/Time"], keep="last"))
+
+    freq = FREQS[resolution]
+    # stored rollups only cover archived readings; anything from the hot file's start on comes from the hot file
+    return _join([rollup(clip(clean_combined(hot)), freq),
+                  clip(archived_totals(resolution, hot_from.floor(freq), policy))])
+
+
+def archived_totals(resolution, before=None, policy=None):
+    """Stored hourly / daily rollups of the archived readings (those before `before`); empty before the first compaction."""
+    policy = policy or load_policy()
+    stored = _read(os.path.join(policy["rollup_dir"], f"{resolution}.csv"))
+    if stored is None:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    return stored if before is None else stored[stored["Date/Time"] < pd.Timestamp(before)]
+
+
+def with_archive(recent, resolution, policy=None):
+    """
+    Totals over the whole history for stages that only load the hot window:
+    `recent` (rollup() columns, e.g. of the combined file or readings_db) after
+    the archived totals of the periods before it.
+    """
+    before = recent["Date/Time"].min() if len(recent) else None
+    return _join([recent, archived_totals(resolution, before, policy)])
+
+
+def _join(parts):
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    return (pd.concat(parts, ignore_index=True).sort_values(["Date/Time", "Building"], kind="stable")
+            .reset_index(drop=True)[ROLLUP_COLUMNS])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retention tiers: raw window, archive partitions, hourly/daily rollups.")
+    parser.add_argument("--raw-days", type=int, help="override retention.raw_days")
+    parser.add_argument("--status", action="store_true", help="show what each tier holds and exit")
+    args = parser.parse_args()
+
+    metrics = start_stage("retention")
+    config = load_config(CONFIG_PATH)
+    if args.raw_days is not None:
+        config.setdefault("retention", {})["raw_days"] = args.raw_days
+    policy = load_policy(config)
+    if args.status:
+        hot = pd.read_csv(COMBINED_PATH, usecols=["Date/Time"], parse_dates=["Date/Time"])
+        print(f"📦 raw     {len(hot):>10,} readings  {hot['Date/Time'].min()} → {hot['Date/Time'].max()} "
+              f"({os.path.getsize(COMBINED_PATH) / 1e6:.1f} MB)")
+        parts = partitions(policy)
+        size = sum(os.path.getsize(p) for p in parts.values())
+        print(f"🗄️ archive {len(parts):>10} partition(s) {', '.join(parts) or '-'} ({size / 1e6:.1f} MB)")
+        for name in ("hourly", "daily"):
+            table = _read(os.path.join(policy["rollup_dir"], f"{name}.csv"))
+            rows = 0 if table is None else len(table)
+            span = "" if not rows else f"  {table['Date/Time'].min():%Y-%m-%d} → {table['Date/Time'].max():%Y-%m-%d}"
+            print(f"📊 {name:<7} {rows:>10,} rows{span}")
+        return
+    run(None, metrics, config)
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# series_codec.py
+"""
+Compressed storage for meter series (Gorilla-style), used for the archive
+partitions of retention.py when `archive_format: wmsz`.
+
+Readings are grouped by meter and cut into blocks of BLOCK_ROWS. In a block:
+
+- time: epoch seconds as the first delta then delta-of-deltas, zigzag varints
+  (a reading on the regular cadence costs one byte);
+- totalizer / consumption: the values scaled to millilitres when that is
+  exact (it is for everything parsed from the CSVs), delta-encoded as
+  varints; otherwise the XOR of consecutive float64 bit patterns, as varints
+  (the leading zero bits of the XOR are what is saved);
+- source file / quality: run-length encoded codes into file-level
+  dictionaries.
+
+File layout: "WMSZ" | blocks | JSON index | u32 index length | "WMSZ". Per
+block the index holds its offset, row count, first/last time and, per value
+column, min / max / sum / count. aggregate() answers sums, extremes and
+counts over a time range from these footers and only decodes the blocks that
+straddle the range edges.
+
+`python series_codec.py --bench` reports the compression ratio against CSV
+and gzip CSV, decode throughput, and footer vs full-decode aggregate times on
+the campus data and on a synthetic year.
+"""
+import os, io, gzip, json, time, struct, argparse
+import numpy as np
+import pandas as pd
+
+from columnar import varint_encode, varint_decode
+from water_data import atomic_write
+
+# ——— CONFIGURATION ——————————————————————————————————————
+MAGIC = b"WMSZ"
+VERSION = 1
+BLOCK_ROWS = 1024                   # readings per meter block (~3 weeks at 30 min)
+DECIMALS = 3                        # values are stored as exact integers of up to 3 decimals (mL)
+VALUES = ["Totalizer (Liters)", "Consumption (Liters)"]
+LABELS = ["Source File", "Quality"]
+COLUMNS = ["Date/Time", "Totalizer (Liters)", "Consumption (Liters)", "Building", "Source File", "Quality"]
+# ————————————————————————————————————————————————————————
+
+EPOCH = pd.Timestamp("1970-01-01")
+MODE_XOR = DECIMALS + 1            # modes 0..DECIMALS are "scaled by 10**mode"
+
+
+def _encode_values(v):
+    """
+    (mode, varints, patches). Scaled: deltas of round(v * 10**mode), with the
+    fewest decimals that fit the block; the values that are not exactly on
+    that grid (NaN, float noise such as 93.34400000000001) become patches
+    (row step, XOR of their bits with the grid value's bits), which are small
+    numbers. XOR: consecutive float64 bit patterns XORed, for blocks that are
+    mostly off the grid.
+    """
+    best = None
+    for decimals in range(DECIMALS + 1):
+        scaled = np.nan_to_num(np.round(v * 10 ** decimals), nan=0.0, posinf=0.0, neginf=0.0)
+        if np.abs(scaled).max(initial=0) >= 2 ** 53:
+            break
+        residual = v.view(np.int64) ^ (scaled / 10 ** decimals).view(np.int64)
+        rows = np.flatnonzero(residual)
+        if best is None or len(rows) < len(best[2]):
+            best = decimals, scaled, rows, residual
+    if best is not None and len(best[2]) <= len(v) // 2:
+        decimals, scaled, rows, residual = best
+        patches = np.column_stack([np.diff(rows, prepend=0), residual[rows]]).ravel()
+        return decimals, np.diff(scaled.astype(np.int64), prepend=0), patches
+    bits = v.view(np.int64)
+    return MODE_XOR, bits ^ np.concatenate([[0], bits[:-1]]), np.zeros(0, dtype=np.int64)
+
+
+def _runs(codes):
+    """Run-length pairs (code, length)."""
+    if not len(codes):
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.diff(codes, prepend=codes[0] - 1))
+    return np.column_stack([codes[starts], np.diff(np.append(starts, len(codes)))]).ravel()
+
+
+def encode_block(seconds, values, labels):
+    """
+    One block: a mode byte per value column, then a single varint stream:
+    time unit, patch count per value column, run count per label column,
+    times (first, first delta, delta-of-deltas, in units), values, patches, runs.
+    """
+    unit = int(np.gcd.reduce(seconds - seconds[0])) or 1
+    steps = np.diff(seconds) // unit
+    stream = [[seconds[0], *steps[:1]], np.diff(steps)]
+    modes, head = [], [unit]
+    for v in values:
+        mode, body, patches = _encode_values(v)
+        modes.append(mode)
+        head.append(len(patches) // 2)
+        stream += [body, patches]
+    for c in labels:
+        runs = _runs(c)
+        head.append(len(runs) // 2)
+        stream.append(runs)
+    return bytes(modes) + varint_encode(np.concatenate([head, *stream]).astype(np.int64)).tobytes()
+
+
+def decode_block(buf, count, n_values, n_labels):
+    """(seconds, [value arrays], [label code arrays]) of one block."""
+    modes = buf[:n_values]
+    raw = varint_decode(buf[n_values:], len(buf))
+    unit, heads, pos = raw[0], raw[1:1 + n_values + n_labels], 1 + n_values + n_labels
+    steps = np.cumsum(raw[pos + 1:pos + count])
+    seconds = raw[pos] + unit * np.concatenate([[0], np.cumsum(steps)])
+    pos += count
+    values, labels = [], []
+    for mode, n_patches in zip(modes, heads[:n_values]):
+        body, patches = raw[pos:pos + count], raw[pos + count:pos + count + 2 * n_patches]
+        pos += count + 2 * n_patches
+        if mode == MODE_XOR:
+            values.append(np.bitwise_xor.accumulate(body).view(np.float64))
+            continue
+        v = np.cumsum(body) / 10 ** int(mode)
+        if n_patches:
+            rows = np.cumsum(patches[0::2])
+            v[rows] = (v[rows].view(np.int64) ^ patches[1::2]).view(np.float64)
+        values.append(v)
+    for n_runs in heads[n_values:]:
+        runs = raw[pos:pos + 2 * n_runs]
+        pos += 2 * n_runs
+        labels.append(np.repeat(runs[0::2], runs[1::2]))
+    return seconds, values, labels
+
+
+def _footer(v):
+    finite = v[np.isfinite(v)]
+    if not len(finite):
+        return {"min": None, "max": None, "sum": 0.0, "n": 0}
+    return {"min": float(finite.min()), "max": float(finite.max()), "sum": float(finite.sum()), "n": int(len(finite))}
+
+
+def encode(df):
+    """WMSZ bytes of a combined frame (Date/Time, values, Building, labels)."""
+    df = df.dropna(subset=["Date/Time", "Building"])
+    values = [c for c in VALUES if c in df.columns]
+    labels = [c for c in LABELS if c in df.columns]
+    dicts = {}
+    codes = {}
+    for c in labels:
+        codes[c], uniques = pd.factorize(df[c].astype(str).where(df[c].notna(), ""), sort=True)
+        dicts[c] = [str(u) for u in uniques]
+    seconds = ((df["Date/Time"] - EPOCH) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+
+    order = np.lexsort((seconds, df["Building"].to_numpy()))
+    meters = df["Building"].to_numpy()[order]
+    bounds = np.flatnonzero(np.r_[True, meters[1:] != meters[:-1], True])
+
+    out = io.BytesIO()
+    out.write(MAGIC)
+    index = {}
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        rows = order[a:b]
+        blocks = index[str(meters[a])] = []
+        for s in range(0, len(rows), BLOCK_ROWS):
+            r = rows[s:s + BLOCK_ROWS]
+            vals = [df[c].to_numpy(dtype=np.float64)[r] for c in values]
+            data = encode_block(seconds[r], vals, [codes[c][r] for c in labels])
+            blocks.append({"offset": out.tell(), "bytes": len(data), "rows": len(r),
+                           "t_first": int(seconds[r[0]]), "t_last": int(seconds[r[-1]]),
+                           "stats": [_footer(v) for v in vals]})
+            out.write(data)
+    trailer = json.dumps({"version": VERSION, "values": values, "labels": labels, "dicts": dicts,
+                          "series": index}, separators=(",", ":")).encode()
+    out.write(trailer + struct.pack("<I", len(trailer)) + MAGIC)
+    return out.getvalue()
+
+
+def read_index(buf):
+    if buf[:4] != MAGIC or buf[-4:] != MAGIC:
+        raise ValueError("❌ Not a WMSZ file")
+    (length,) = struct.unpack_from("<I", buf, len(buf) - 8)
+    index = json.loads(buf[len(buf) - 8 - length:len(buf) - 8])
+    if index["version"] != VERSION:
+        raise ValueError(f"❌ Unsupported WMSZ version {index['version']}")
+    return index
+
+
+def _seconds(ts):
+    return None if ts is None else int((pd.Timestamp(ts) - EPOCH) // pd.Timedelta(seconds=1))
+
+
+def _overlapping(blocks, lo, hi):
+    return [b for b in blocks if (lo is None or b["t_last"] >= lo) and (hi is None or b["t_first"] <= hi)]
+
+
+def _within(sec, lo, hi):
+    keep = np.ones(len(sec), dtype=bool)
+    if lo is not None:
+        keep &= sec >= lo
+    if hi is not None:
+        keep &= sec <= hi
+    return keep
+
+
+def decode(buf, start=None, end=None, meters=None):
+    """Combined-style frame of the readings in [start, end] for the given meters (all by default)."""
+    index = read_index(buf)
+    lo, hi = _seconds(start), _seconds(end)
+    n_values, n_labels = len(index["values"]), len(index["labels"])
+    parts = []
+    for meter, blocks in index["series"].items():
+        if meters is not None and meter not in meters:
+            continue
+        for blk in _overlapping(blocks, lo, hi):
+            sec, vals, labs = decode_block(buf[blk["offset"]:blk["offset"] + blk["bytes"]], blk["rows"],
+                                           n_values, n_labels)
+            keep = _within(sec, lo, hi)
+            parts.append((meter, sec[keep], [v[keep] for v in vals], [c[keep] for c in labs]))
+
+    if not parts:
+        return pd.DataFrame(columns=[c for c in COLUMNS if c in ["Date/Time", "Building", *index["values"], *index["labels"]]])
+    # parts come in meter-name order, so (time, part) orders rows like the CSV partitions
+    sec = np.concatenate([p[1] for p in parts])
+    part = np.repeat(np.arange(len(parts)), [len(p[1]) for p in parts])
+    order = np.lexsort((part, sec))
+    df = pd.DataFrame({"Date/Time": (sec[order] * 10 ** 9).astype("datetime64[ns]")})
+    for k, c in enumerate(index["values"]):
+        df[c] = np.concatenate([p[2][k] for p in parts])[order]
+    df["Building"] = np.array([p[0] for p in parts], dtype=object)[part[order]]
+    for k, c in enumerate(index["labels"]):
+        names = np.array([v or np.nan for v in index["dicts"][c]], dtype=object)
+        df[c] = names[np.concatenate([p[3][k] for p in parts])[order]]
+    return df[[c for c in COLUMNS if c in df.columns]]
+
+
+def aggregate(buf, column="Consumption (Liters)", start=None, end=None, meters=None):
+    """
+    Per meter sum / min / max / count of a value column over [start, end].
+    Blocks inside the range are answered from their footer; only blocks that
+    straddle an edge are decoded. Returns (frame, blocks from footers, blocks decoded).
+    """
+    index = read_index(buf)
+    k = index["values"].index(column)
+    lo, hi = _seconds(start), _seconds(end)
+    rows, from_footer, decoded = [], 0, 0
+    for meter, blocks in index["series"].items():
+        if meters is not None and meter not in meters:
+            continue
+        acc = {"Building": meter, "sum": 0.0, "min": np.inf, "max": -np.inf, "count": 0}
+        for blk in _overlapping(blocks, lo, hi):
+            if (lo is None or blk["t_first"] >= lo) and (hi is None or blk["t_last"] <= hi):
+                st = blk["stats"][k]
+                from_footer += 1
+            else:
+                sec, vals, _ = decode_block(buf[blk["offset"]:blk["offset"] + blk["bytes"]], blk["rows"],
+                                            len(index["values"]), len(index["labels"]))
+                st = _footer(vals[k][_within(sec, lo, hi)])
+                decoded += 1
+            if st["n"]:
+                acc["sum"] += st["sum"]
+                acc["min"], acc["max"] = min(acc["min"], st["min"]), max(acc["max"], st["max"])
+                acc["count"] += st["n"]
+        if acc["count"]:
+            rows.append(acc)
+    return pd.DataFrame(rows, columns=["Building", "sum", "min", "max", "count"]), from_footer, decoded
+
+
+def write(df, path):
+    """Write a frame as a WMSZ file (atomically replaced, see water_data.atomic_write)."""
+    with atomic_write(path, "wb") as f:
+        f.write(encode(df))
+
+
+def read(path, start=None, end=None, meters=None):
+    with open(path, "rb") as f:
+        return decode(f.read(), start, end, meters)
+
+
+# --- BENCHMARK ---
+
+def bench(df, label):
+    df = df[[c for c in COLUMNS if c in df.columns]].drop_duplicates(subset=["Building", "Date/Time"], keep="last")
+    df = df.sort_values(["Date/Time", "Building"], kind="stable").reset_index(drop=True)
+    csv = df.to_csv(index=False).encode()
+    t0 = time.perf_counter()
+    csv_gz = gzip.compress(csv, 6)
+    t_gz = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    blob = encode(df)
+    t_enc = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    back = decode(blob)
+    t_dec = time.perf_counter() - t0
+    index = read_index(blob)
+    t0 = time.perf_counter()
+    for blocks in index["series"].values():
+        for blk in blocks:
+            decode_block(blob[blk["offset"]:blk["offset"] + blk["bytes"]], blk["rows"],
+                         len(index["values"]), len(index["labels"]))
+    t_blocks = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pd.read_csv(io.BytesIO(gzip.decompress(csv_gz)), parse_dates=["Date/Time"])
+    t_csv = time.perf_counter() - t0
+    exact = back.equals(df)
+
+    # one month in the middle: footers vs decoding everything
+    mid = df["Date/Time"].min() + (df["Date/Time"].max() - df["Date/Time"].min()) / 2
+    start, end = mid - pd.Timedelta(days=15), mid + pd.Timedelta(days=15)
+    t0 = time.perf_counter()
+    agg, skipped, decoded = aggregate(blob, "Consumption (Liters)", start, end)
+    t_agg = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    full = decode(blob)
+    full = full[(full["Date/Time"] >= start) & (full["Date/Time"] <= end)].groupby("Building")["Consumption (Liters)"].sum()
+    t_full = time.perf_counter() - t0
+    assert np.allclose(agg.set_index("Building")["sum"].reindex(full.index).to_numpy(), full.to_numpy())
+
+    n = len(df)
+    print(f"📦 {label}: {n:,} readings, {df['Building'].nunique()} meters, lossless: {'yes' if exact else 'NO'}")
+    for name, size in (("CSV", len(csv)), ("CSV gzip", len(csv_gz)), ("WMSZ", len(blob))):
+        print(f"   {name:<9} {size / 1e6:8.2f} MB  {size / n:6.2f} B/reading  ratio {len(csv) / size:5.1f}×")
+    print(f"   encode {t_enc:.2f}s (gzip {t_gz:.2f}s) | decode {t_dec:.2f}s = {n / t_dec / 1e6:.1f} M readings/s "
+          f"(gzip CSV + read_csv {t_csv:.2f}s), "
+          f"blocks to arrays only {n / t_blocks / 1e6:.1f} M readings/s")
+    print(f"   30-day consumption per meter: footers {t_agg * 1000:.1f} ms ({skipped} blocks from footers, "
+          f"{decoded} decoded) vs full decode {t_full * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression ratio and decode speed of the WMSZ series codec.")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--data", help="combined CSV (default: the project's)")
+    parser.add_argument("--meters", type=int, default=24, help="synthetic campus for the year-long run (0 to skip)")
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+    if not args.bench:
+        parser.print_help()
+        return
+    from water_data import COMBINED_PATH
+
+    path = args.data or COMBINED_PATH
+    bench(pd.read_csv(path, parse_dates=["Date/Time"]), os.path.basename(path))
+    if args.meters:
+        import synthetic_data
+
+        readings, _ = synthetic_data.simulate(synthetic_data.make_meters(args.meters), args.days, seed=42)
+        readings["Source File"] = "Packet-" + readings["Date/Time"].dt.strftime("%Y-%m-%d") + ".csv"
+        bench(readings, f"synthetic {args.meters} meters × {args.days} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# synthetic_data.py
+import os, json, argparse
+import numpy as np
+import pandas as pd
+import yaml
+
+# ——— CONFIGURATION ——————————————————————————————————————
+# (the script file is in scripts/, config.yaml is in the project root)
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.yaml")
+
+# Per-block meter layout, same as the real A/B blocks in config.yaml:
+# ground (G), first (1) and mid (2M) floors with gents (M) / ladies (F) taps,
+# domestic (D) / flush (F) lines, and the terrace tank (TT) meters.
+BLOCK_SUFFIXES = ["1FD", "1FF", "1MD", "1MF", "2MFD", "2MFF",
+                  "GFD", "GFF", "GMD", "GMF", "TTD", "TTF"]
+CADENCE_MINUTES = 30          # the real exports report roughly every 30 min
+START = "2025-05-01 00:00"
+# ————————————————————————————————————————————————————————
+
+# Relative demand per hour of day: morning and evening peaks, near-zero at night.
+DIURNAL_PROFILE = np.array([
+    0.02, 0.01, 0.01, 0.01, 0.02, 0.08,   # 00-05
+    0.45, 1.00, 0.95, 0.60, 0.45, 0.40,   # 06-11
+    0.55, 0.50, 0.35, 0.30, 0.35, 0.50,   # 12-17
+    0.75, 0.85, 0.70, 0.45, 0.20, 0.06,   # 18-23
+])
+WEEKEND_FACTOR = 0.6
+
+
+def block_label(i):
+    """Spreadsheet-style block label: A, B, ..., Z, AA, AB, ..."""
+    label = ""
+    i += 1
+    while i:
+        i, rem = divmod(i - 1, 26)
+        label = chr(ord("A") + rem) + label
+    return label
+
+
+def make_meters(n_meters):
+    """
+    Meter table for n_meters: the first 24 are the real campus meters,
+    further blocks repeat the same 12-meter layout (C, D, ..., AA, ...).
+    """
+    rows = []
+    b = 0
+    while len(rows) < n_meters:
+        block = block_label(b)
+        for suffix in BLOCK_SUFFIXES:
+            if len(rows) == n_meters:
+                break
+            rows.append({
+                "meter_id": f"{block}{suffix}",
+                "block": block,
+                "floor": "TT" if suffix.startswith("TT") else ("2M" if suffix.startswith("2M") else suffix[0]),
+                "line": "domestic" if suffix.endswith("D") else "flush",
+                "is_tank": suffix.startswith("TT"),
+                "dcu": "DCU-TERRACE" if suffix.startswith("TT") else f"DCU-{block}",
+            })
+        b += 1
+    return pd.DataFrame(rows)
+
+
+def simulate(meters, days, start=START, cadence=CADENCE_MINUTES, seed=42,
+             leak_rate=0.05, spike_rate=0.02):
+    """
+    Vectorized totalizer simulation.
+
+    Returns (readings, events): readings is a long frame with
+    Date/Time, Building, Totalizer (Liters), Consumption (Liters);
+    events lists the injected ground-truth anomalies.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=int(days * 24 * 60 / cadence), freq=f"{cadence}min")
+    n, t = len(meters), len(times)
+    step_h = cadence / 60.0
+
+    hours = times.hour.values
+    weekend = times.dayofweek.values >= 5
+    profile = DIURNAL_PROFILE[hours] * np.where(weekend, WEEKEND_FACTOR, 1.0)
+
+    # Per-meter peak flow (L/h); flush lines draw more per use than domestic taps
+    peak = rng.lognormal(mean=3.0, sigma=0.5, size=n)
+    peak *= np.where(meters["line"].values == "flush", 1.6, 1.0)
+    usage = rng.gamma(shape=2.0, scale=0.5, size=(n, t))
+    flow = peak[:, None] * profile[None, :] * usage * step_h
+
+    # Random idle slots: real meters often report 0.00 between uses
+    flow[rng.random((n, t)) < 0.35] = 0.0
+
+    events = []
+    floor_idx = np.flatnonzero(~meters["is_tank"].values)
+    night = hours <= 5
+
+    # --- Night leaks: constant drip during 00-05 for a few consecutive nights ---
+    n_leaks = int(round(leak_rate * len(floor_idx)))
+    for m in rng.choice(floor_idx, size=min(n_leaks, len(floor_idx)), replace=False):
+        first_day = int(rng.integers(0, max(1, days - 1)))
+        nights = int(rng.integers(1, 4))
+        rate = float(rng.uniform(5, 20))  # L/h
+        day_no = (times - times[0]).days
+        mask = night & (day_no >= first_day) & (day_no < first_day + nights)
+        if not mask.any():
+            continue
+        flow[m, mask] += rate * step_h
+        events.append({"Building": meters.at[m, "meter_id"], "kind": "night_leak",
+                       "start": times[mask][0], "end": times[mask][-1], "rate_lph": round(rate, 2)})
+
+    # --- Spikes: single readings far above the usual draw ---
+    n_spikes = int(round(spike_rate * len(floor_idx) * days))
+    for _ in range(n_spikes):
+        m = int(rng.choice(floor_idx))
+        k = int(rng.integers(0, t))
+        volume = float(rng.uniform(200, 600))
+        flow[m, k] += volume
+        events.append({"Building": meters.at[m, "meter_id"], "kind": "spike",
+                       "start": times[k], "end": times[k], "rate_lph": round(volume / step_h, 2)})
+
+    # --- Tank meters carry everything downstream in their block, per line ---
+    for (block, line), grp in meters.groupby(["block", "line"]):
+        tank = grp.index[grp["is_tank"].values]
+        children = grp.index[~grp["is_tank"].values]
+        if len(tank) and len(children):
+            flow[tank[0]] = flow[children].sum(axis=0) * rng.normal(1.0, 0.005, size=t)
+
+    totalizer = rng.uniform(0, 50000, size=n)[:, None] + np.cumsum(flow, axis=1)
+    consumption = np.diff(totalizer, axis=1, prepend=totalizer[:, :1])
+
+    readings = pd.DataFrame({
+        "Date/Time": np.tile(times.values, n),
+        "Totalizer (Liters)": totalizer.ravel().round(2),
+        "Consumption (Liters)": consumption.ravel().round(2),
+        "Building": np.repeat(meters["meter_id"].values, t),
+    })
+    events = pd.DataFrame(events, columns=["Building", "kind", "start", "end", "rate_lph"])
+    return readings, events
+
+
+def write_combined(readings, path, source_file="synthetic.csv"):
+    """Write readings in the combined_water_data.csv layout."""
+    out = readings.sort_values("Date/Time", kind="stable").copy()
+    out["Source File"] = source_file
+    cols = ["Date/Time", "Totalizer (Liters)", "Consumption (Liters)", "Building", "Source File"]
+    out.to_csv(path, columns=cols, index=False)
+
+
+def write_water_history(readings, out_dir, exported_at):
+    """One Water_History_<meter>_<export time>.csv per meter, newest reading first."""
+    stamp = pd.Timestamp(exported_at).strftime("%Y-%m-%d_%H-%M")
+    paths = []
+    for building, grp in readings.groupby("Building", sort=False):
+        out = grp.sort_values("Date/Time", ascending=False)
+        path = os.path.join(out_dir, f"Water_History_{building}_{stamp}.csv")
+        out.to_csv(path, columns=["Date/Time", "Totalizer (Liters)", "Consumption (Liters)"],
+                   index=False, date_format="%Y-%m-%d %H:%M", float_format="%.2f")
+        paths.append(path)
+    return paths
+
+
+def write_packets(readings, meters, out_dir, hours_per_file=24):
+    """
+    DCU packet files in the Packet-YYYY-MM-DD-HH-MM.csv format read by
+    packet_to_combined_water_data.py: one row per DCU per reading time,
+    with the meter totalizers as a JSON payload {"t": [{"il": .., "r": ..}]}.
+    """
+    dcu = readings["Building"].map(meters.set_index("meter_id")["dcu"])
+    frame = readings.assign(dcu=dcu.values)
+    frame["chunk"] = frame["Date/Time"].dt.floor(f"{hours_per_file}h")
+    paths = []
+    for chunk, part in frame.groupby("chunk"):
+        rows = []
+        for (ts, device), grp in part.groupby(["Date/Time", "dcu"], sort=True):
+            payload = {"t": [{"il": il, "r": f"{r:.2f}"}
+                             for il, r in zip(grp["Building"].values, grp["Totalizer (Liters)"].values)]}
+            rows.append({"device_id": device,
+                         "packet_sent_at": ts.strftime("%Y-%m-%d %H:%M:%S"),
+                         "sensor_data": json.dumps(payload, separators=(",", ":"))})
+        last = part["Date/Time"].max()
+        path = os.path.join(out_dir, f"Packet-{last.strftime('%Y-%m-%d-%H-%M')}.csv")
+        pd.DataFrame(rows).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def write_project(root, n_meters=24, days=14, packet_days=1, seed=42,
+                  history_exports=True, cadence=CADENCE_MINUTES):
+    """
+    Lay out a full synthetic project tree under root:
+      config.yaml, data/combined_water_data.csv (all but the last packet_days),
+      data/Packet-*.csv (the last packet_days, for ingest),
+      data/Water_History_*.csv exports and data/synthetic_events.csv.
+    """
+    data_dir = os.path.join(root, "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    meters = make_meters(n_meters)
+    readings, events = simulate(meters, days, seed=seed, cadence=cadence)
+
+    cutoff = readings["Date/Time"].max() - pd.Timedelta(days=packet_days)
+    history = readings[readings["Date/Time"] <= cutoff]
+    fresh = readings[readings["Date/Time"] > cutoff]
+
+    write_combined(history, os.path.join(data_dir, "combined_water_data.csv"))
+    write_packets(fresh, meters, data_dir)
+    if history_exports:
+        write_water_history(history, data_dir, cutoff)
+    events.to_csv(os.path.join(data_dir, "synthetic_events.csv"), index=False)
+
+    try:
+        with open(CONFIG_PATH, "r") as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    config["buildings"] = meters["meter_id"].tolist()
+    with open(os.path.join(root, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    return {"meters": n_meters, "days": days, "readings": len(readings),
+            "history_rows": len(history), "packet_rows": len(fresh), "events": len(events)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic campus water data set.")
+    parser.add_argument("--meters", type=int, default=24, help="number of meters (default: 24)")
+    parser.add_argument("--days", type=int, default=14, help="days of history (default: 14)")
+    parser.add_argument("--packet-days", type=int, default=1,
+                        help="trailing days written as Packet-*.csv instead of combined history")
+    parser.add_argument("--cadence", type=int, default=CADENCE_MINUTES, help="minutes between readings")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-history-exports", action="store_true",
+                        help="skip the per-meter Water_History_*.csv exports")
+    parser.add_argument("--out", required=True, help="project root to create")
+    args = parser.parse_args()
+
+    summary = write_project(args.out, args.meters, args.days, args.packet_days, args.seed,
+                            history_exports=not args.no_history_exports, cadence=args.cadence)
+    print(f"✅ Synthetic project written to: {os.path.abspath(args.out)}")
+    print(f"   → {summary['meters']} meters × {summary['days']} days = {summary['readings']} readings "
+          f"({summary['packet_rows']} in packets), {summary['events']} injected events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# totalizer_integrity.py
+"""
+Consumption deltas from raw totalizer readings, with the integrity problems
+handled instead of clipped away:
+
+- duplicate timestamps (the same reading from overlapping exports/packets)
+  are dropped;
+- rollover: the register wraps past `rollover_liters` back to near zero, the
+  delta is taken across the wrap;
+- reset: the meter restarts near zero, the delta is the volume since zero;
+- backstep: a reading below the previous level (jitter, out-of-order export)
+  counts as zero and the next delta is taken from the last trusted level, so
+  the glitch does not turn into a spike;
+- gaps longer than `max_gap_minutes` are spread evenly over filler rows at the
+  nominal cadence; gaps beyond `max_spread_hours` are left on the reading and
+  flagged so detectors can skip them.
+
+Every output row carries a `Quality` column (';'-joined flags, empty when the
+reading is clean). integrate() works on a batch of new readings plus the
+per-meter state of the previous batch (last timestamp and trusted level), so
+ingest only processes new packets; `--rebuild` recomputes the whole combined
+file once.
+"""
+import os, json, argparse
+import numpy as np
+import pandas as pd
+
+import readings_db
+from instrumentation import start_stage
+from water_data import atomic_write, write_csv
+from water_data import PROJECT_ROOT, COMBINED_PATH, CONFIG_PATH, load_config
+
+# ——— CONFIGURATION ——————————————————————————————————————
+STATE_PATH = os.path.join(PROJECT_ROOT, "data", ".totalizer_state.json")
+
+# Defaults for the `totalizer` section of config.yaml
+DEFAULT_INTEGRITY = {
+    "cadence_minutes": 30,          # nominal reporting interval
+    "max_gap_minutes": 120,         # longer intervals are spread over filler rows
+    "max_spread_hours": 24,         # ...up to this long; longer gaps are only flagged
+    "rollover_liters": 100000000,   # register size (99,999.999 m³)
+    "reset_fraction": 0.1,          # a drop below this share of the previous level is a reset
+}
+ROLLOVER_BAND = 0.1                 # a wrap goes from the top 10% of the register to the bottom 10%
+FLAGS = ["first", "rollover", "reset", "backstep", "gap_spread", "gap_fill", "long_gap"]
+COLUMNS = ["Date/Time", "Totalizer (Liters)", "Consumption (Liters)", "Building", "Source File", "Quality"]
+# ————————————————————————————————————————————————————————
+
+
+def load_params(config=None):
+    if config is None:
+        config = load_config(CONFIG_PATH) if os.path.exists(CONFIG_PATH) else {}
+    return {**DEFAULT_INTEGRITY, **(config.get("totalizer") or {})}
+
+
+def load_state(path=STATE_PATH):
+    """{meter: [last timestamp, trusted level]} from the previous run, or {}."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state, path=STATE_PATH):
+    with atomic_write(path) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def state_matches(state, combined):
+    """
+    True when the state was saved with this combined file: every meter's last
+    reading in combined is the state's last timestamp. A run that died between
+    writing combined and writing the state leaves them out of step.
+    """
+    if combined is None or combined.empty:
+        return True
+    last = combined.groupby("Building")["Date/Time"].max()
+    return all(b in state and pd.Timestamp(state[b][0]) == ts for b, ts in last.items())
+
+
+def state_from_combined(combined):
+    """Fallback state when no state file exists: the last reading of each meter."""
+    if combined is None or combined.empty:
+        return {}
+    last = combined.sort_values("Date/Time", kind="stable").groupby("Building").tail(1)
+    return {b: [str(ts), float(tot)] for b, ts, tot in
+            zip(last["Building"], last["Date/Time"], last["Totalizer (Liters)"]) if pd.notna(tot)}
+
+
+def _quality(masks, n):
+    """';'-joined flag names per row from {flag: bool array}."""
+    out = np.full(n, "", dtype=object)
+    for name in FLAGS:
+        mask = masks.get(name)
+        if mask is not None and mask.any():
+            out[mask] = np.where(out[mask] == "", name, out[mask] + ";" + name)
+    return out
+
+
+def integrate(new, state=None, params=None):
+    """
+    Clean one batch of readings (Date/Time, Totalizer (Liters), Building,
+    any other columns are carried along). Returns (readings, state, counts):
+    the cleaned rows with Consumption (Liters) and Quality, the updated
+    per-meter state and the number of rows per flag (plus dropped duplicates).
+    """
+    p = {**DEFAULT_INTEGRITY, **(params or {})}
+    state = dict(state or {})
+    new = new.copy()
+    new["Date/Time"] = pd.to_datetime(new["Date/Time"], errors="coerce")
+    new = new.dropna(subset=["Date/Time", "Totalizer (Liters)"])
+    new["_prior"] = False
+
+    # the previous batch's last trusted level goes in front of each meter's new readings
+    prior = pd.DataFrame([{"Building": b, "Date/Time": pd.Timestamp(ts), "Totalizer (Liters)": level, "_prior": True}
+                          for b, (ts, level) in state.items() if b in set(new["Building"])])
+    df = pd.concat([prior, new], ignore_index=True) if not prior.empty else new
+    df = df.sort_values(["Building", "Date/Time", "_prior"], ascending=[True, True, False], kind="mergesort")
+    dup = df.duplicated(subset=["Building", "Date/Time"], keep="first").to_numpy()
+    # readings at or before a meter's state timestamp were already ingested
+    seen_until = pd.to_datetime(df["Building"].map({b: ts for b, (ts, _) in state.items()}))
+    stale = (~df["_prior"] & (df["Date/Time"] <= seen_until)).to_numpy()
+    counts = {"duplicate": int((dup & ~df["_prior"].to_numpy()).sum()), "stale": int((stale & ~dup).sum())}
+    df = df[~dup & ~stale].reset_index(drop=True)
+
+    building = df["Building"].to_numpy()
+    ts = df["Date/Time"].to_numpy(dtype="datetime64[ns]")
+    raw = df["Totalizer (Liters)"].to_numpy(dtype=float)
+    n = len(df)
+    first = np.ones(n, dtype=bool)
+    first[1:] = building[1:] != building[:-1]
+
+    prev = np.r_[np.nan, raw[:-1]]
+    prev[first] = np.nan
+    with np.errstate(invalid="ignore"):
+        step = raw - prev
+        M = p["rollover_liters"]
+        rollover = (step < 0) & (prev >= (1 - ROLLOVER_BAND) * M) & (raw <= ROLLOVER_BAND * M)
+        reset = (step < 0) & ~rollover & (raw < p["reset_fraction"] * prev)
+
+    # segments start at each meter's first row and at every reset; rollovers add
+    # one register to everything after them within the segment
+    seg_start = first | reset
+    seg = np.cumsum(seg_start) - 1
+    wraps = np.cumsum(rollover)
+    offset = (wraps - wraps[np.flatnonzero(seg_start)][seg]) * M
+    level = pd.Series(raw + offset).groupby(seg).cummax().to_numpy()
+    backstep = ~seg_start & (raw + offset < np.r_[np.nan, level[:-1]])
+
+    delta = level - np.r_[np.nan, level[:-1]]
+    delta[seg_start] = 0.0
+    delta[reset] = raw[reset]
+
+    # gaps: spread the delta over filler rows at the nominal cadence
+    gap_min = np.r_[np.nan, np.diff(ts).astype("timedelta64[s]").astype(float) / 60]
+    gap_min[first] = np.nan
+    with np.errstate(invalid="ignore"):
+        long_gap = gap_min > p["max_spread_hours"] * 60
+        spread = (gap_min > p["max_gap_minutes"]) & ~long_gap
+    slots = np.where(spread, np.maximum(2, np.round(np.nan_to_num(gap_min) / p["cadence_minutes"])), 1).astype(int)
+    delta = delta / slots
+
+    masks = {"first": first, "rollover": rollover, "reset": reset, "backstep": backstep,
+             "gap_spread": spread, "long_gap": long_gap}
+    df["Consumption (Liters)"] = delta
+    df["Quality"] = _quality(masks, n)
+
+    idx = np.flatnonzero(spread)
+    fill_counts = slots[idx] - 1
+    rows = np.repeat(idx, fill_counts)
+    j = np.arange(len(rows)) - np.repeat(np.cumsum(fill_counts) - fill_counts, fill_counts) + 1
+    fillers = df.iloc[rows].copy()
+    span = (ts[rows] - ts[rows - 1]).astype("timedelta64[ns]")
+    fillers["Date/Time"] = ts[rows - 1] + (span * j / slots[rows]).astype("timedelta64[ns]")
+    fillers["Totalizer (Liters)"] = (raw[rows - 1] + (level[rows] - level[rows - 1]) * j / slots[rows]).round(3)
+    fillers["Quality"] = "gap_fill"
+
+    # new state: last timestamp and trusted level (in register units) per meter
+    last = np.r_[building[1:] != building[:-1], True] if n else np.zeros(0, dtype=bool)
+    state.update({b: [str(pd.Timestamp(t)), float(lv % M)] for b, t, lv in zip(building[last], ts[last], level[last])})
+
+    out = pd.concat([df[~df["_prior"].to_numpy()], fillers], ignore_index=True)
+    out = out.sort_values(["Building", "Date/Time"], kind="mergesort").drop(columns="_prior")
+    out["Consumption (Liters)"] = out["Consumption (Liters)"].round(3)
+    keep = ~df["_prior"].to_numpy()
+    counts.update({name: int(mask[keep].sum()) for name, mask in masks.items()})
+    counts["gap_fill"] = len(fillers)
+    return out.reset_index(drop=True), state, counts
+
+
+def describe(counts):
+    return ", ".join(f"{name} {counts[name]}" for name in ["duplicate", "stale"] + FLAGS if counts.get(name))
+
+
+def rebuild(metrics, params=None):
+    """Recompute Consumption and Quality for the whole combined file from its totalizers."""
+    with metrics.step("read_combined"):
+        combined = pd.read_csv(COMBINED_PATH, parse_dates=["Date/Time"])
+    metrics.read(COMBINED_PATH, rows=len(combined))
+    with metrics.step("integrate"):
+        cleaned, state, counts = integrate(combined.drop(columns=["Consumption (Liters)", "Quality"], errors="ignore"),
+                                           None, params or load_params())
+    cleaned = cleaned.sort_values("Date/Time", kind="stable")
+    with metrics.step("write_combined"):
+        write_csv(cleaned, COMBINED_PATH, columns=COLUMNS, index=False)
+    save_state(state)
+    metrics.wrote(COMBINED_PATH, rows=len(cleaned))
+    readings_db.write_through(combined=cleaned, metrics=metrics)
+    print(f"✅ Rebuilt {len(combined):,} → {len(cleaned):,} readings ({describe(counts) or 'no issues'})")
+    return cleaned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Totalizer integrity: rollover, reset, gap and duplicate handling.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute Consumption and Quality for all of combined_water_data.csv")
+    args = parser.parse_args()
+
+    metrics = start_stage("totalizer_integrity")
+    if args.rebuild:
+        rebuild(metrics)
+    else:
+        combined = pd.read_csv(COMBINED_PATH, parse_dates=["Date/Time"])
+        quality = combined["Quality"].fillna("") if "Quality" in combined else pd.Series("", index=combined.index)
+        print(f"📋 {len(combined):,} readings, {(quality != '').sum():,} flagged")
+        for name in FLAGS:
+            print(f"   {name:<11} {quality.str.contains(name).sum():>8,}")
+        if "Quality" not in combined:
+            print("   (no Quality column yet: run with --rebuild)")
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
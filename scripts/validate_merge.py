@@ -1,122 +1,212 @@
 # validate_merge.py
-import re
-import pandas as pd
+"""
+Reconcile every Packet-*.csv file against the combined store.
+
+Each packet row carries a DCU's readings as JSON ({"t": [{"il": meter, "r":
+totalizer}, ...]}); every (meter, minute) reading is looked up in a hash index
+of the combined data and counted as present, missing or mismatched (totalizer
+differs). Files are streamed one at a time and only files not yet verified
+(new, changed since their last check, or with missing/mismatched readings
+last time) are checked, so validation can run every cycle; results per file
+are kept in data/.validated_packets.json. Readings older than the raw window
+are looked up in the retention archive, over just the span of those files.
+"""
+import os
+import json
+import glob
+import argparse
+from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+import retention
+from instrumentation import stage
+from water_data import atomic_write
+
 # --- CONFIG ---
-DATA_DIR = Path(__file__).parent.parent / "data"
+DATA_DIR = Path(os.environ.get("WMS_PROJECT_ROOT", Path(__file__).parent.parent)) / "data"
 COMBINED_CSV = DATA_DIR / "combined_water_data.csv"
-PACKET_CSV  = DATA_DIR / "Packet-2025-06-09-23-33.csv"  # adjust to your latest file
+PACKET_GLOB = str(DATA_DIR / "Packet-*.csv")
+STATE_PATH = DATA_DIR / ".validated_packets.json"
+TOLERANCE = 0.005          # litres; packets carry two decimals
+SHOW = 5                   # example rows printed per problem file
 
 # --- HELPERS ---
-_float_cleaner = re.compile(r"[^\d\.]+")
-
-def clean_float(x):
-    """Strip any non-numeric chars and convert to float."""
-    if pd.isna(x):
-        return 0.0
-    s = str(x)
-    cleaned = _float_cleaner.sub("", s)
+_not_numeric = r"[^\d\.]+"
+
+
+def to_float(values):
+    """Vectorized float parse; values with stray characters are stripped first."""
+    s = pd.Series(values, dtype=object)
+    out = pd.to_numeric(s, errors="coerce")
+    bad = out.isna() & s.notna()
+    if bad.any():
+        out[bad] = pd.to_numeric(s[bad].astype(str).str.replace(_not_numeric, "", regex=True), errors="coerce")
+    return out.to_numpy(dtype=float)
+
+
+def minute_keys(times):
+    return pd.to_datetime(times, errors="coerce").to_numpy(dtype="datetime64[m]").astype(np.int64)
+
+
+class Store:
+    """Hash index of the combined data: (meter, minute) → totalizer."""
+
+    def __init__(self, cb):
+        if "Quality" in cb:
+            cb = cb[~cb["Quality"].fillna("").astype(str).str.contains("gap_fill")]   # filler rows are not readings
+        self.meters = {m: i for i, m in enumerate(pd.unique(cb["Building"]))}
+        keys = self._keys(cb["Building"].to_numpy(), minute_keys(cb["Date/Time"]))
+        totals = to_float(cb["Totalizer (Liters)"].to_numpy())
+        # the last reading wins when a minute appears twice, as in ingest
+        last = ~pd.Series(keys).duplicated(keep="last").to_numpy()
+        self.index = pd.Index(keys[last])
+        self.totals = totals[last]
+        self.rows = len(cb)
+
+    def _keys(self, meters, minutes):
+        codes = pd.Series(meters).map(self.meters).fillna(-1).to_numpy(dtype=np.int64)
+        return np.where(codes >= 0, (codes << 32) | (minutes & 0xFFFFFFFF), -1)
+
+    def lookup(self, meters, minutes):
+        """Position of each (meter, minute) in the store, -1 when absent."""
+        pos = self.index.get_indexer(self._keys(meters, minutes))
+        return np.where(self._keys(meters, minutes) >= 0, pos, -1)
+
+
+def read_packets(path):
+    """One row per (meter, minute) reading in a packet file, last value per minute."""
+    pk = pd.read_csv(path, usecols=["packet_sent_at", "sensor_data"])
+    meters, minutes, values = [], [], []
+    for sent, payload in zip(minute_keys(pk["packet_sent_at"]), pk["sensor_data"]):
+        try:
+            readings = json.loads(payload).get("t", [])
+        except (TypeError, ValueError, AttributeError):
+            continue
+        for r in readings:
+            if r.get("il") is not None and r.get("r") is not None:
+                meters.append(r["il"])
+                minutes.append(sent)
+                values.append(r["r"])
+    out = pd.DataFrame({"meter_id": meters, "minute": np.array(minutes, dtype=np.int64),
+                        "totalizer": to_float(values)})
+    out = out[out["minute"] != np.iinfo(np.int64).min]      # unparseable packet_sent_at
+    return out.drop_duplicates(subset=["meter_id", "minute"], keep="last").reset_index(drop=True)
+
+
+def packet_span(files):
+    """First and last packet_sent_at minute over the given packet files (None, None when unparseable)."""
+    minutes = np.concatenate([minute_keys(pd.read_csv(p, usecols=["packet_sent_at"])["packet_sent_at"])
+                              for p in files])
+    minutes = minutes[minutes != np.iinfo(np.int64).min]
+    if not len(minutes):
+        return None, None
+    first, last = (pd.Timestamp(m.astype("datetime64[m]")) for m in (minutes.min(), minutes.max()))
+    return first, last + pd.Timedelta(minutes=1)
+
+
+def check_file(store, path):
+    """Counts and example rows of missing / mismatched readings for one packet file."""
+    pk = read_packets(path)
+    pos = store.lookup(pk["meter_id"].to_numpy(), pk["minute"].to_numpy())
+    found = pos >= 0
+    stored = np.where(found, store.totals[np.maximum(pos, 0)], np.nan)
+    missing = ~found
+    mismatched = found & ~(np.abs(stored - pk["totalizer"].to_numpy()) <= TOLERANCE)
+    pk["Date/Time"] = pk["minute"].to_numpy().astype("datetime64[m]")
+    pk["combined"] = stored
+    return {"readings": len(pk), "missing": int(missing.sum()), "mismatched": int(mismatched.sum()),
+            "missing_rows": pk[missing], "mismatched_rows": pk[mismatched]}
+
+
+def load_state():
     try:
-        return float(cleaned) if cleaned else 0.0
-    except ValueError:
-        return 0.0
-
-def load_combined():
-    print(f"🔍 Loading combined CSV from: {COMBINED_CSV}")
-    df = pd.read_csv(COMBINED_CSV, parse_dates=["Date/Time"])
-    print(f"   → {len(df)} rows")
-    return df
-
-def load_packets():
-    print(f"🔍 Loading & grouping packets from: {PACKET_CSV}")
-    pk = pd.read_csv(PACKET_CSV)
-    
-    # rename & parse
-    pk = pk.rename(
-        columns={
-            "device_id":       "meter_id",
-            "packet_sent_at":  "packet_time",
-            "sensor_data":     "totalizer"
-        }
-    )
-    # clean floats
-    pk["totalizer"] = pk["totalizer"].apply(clean_float)
-    # round packet_time to minute
-    pk["Date/Time"] = pd.to_datetime(pk["packet_time"]).dt.floor("min")
-    
-    # group by meter & minute, take last totalizer reading
-    grp = pk.groupby(["meter_id","Date/Time"], as_index=False)
-    pk_min = grp.agg({"totalizer":"last"})
-    
-    print(f"   → {len(pk_min)} grouped rows")
-    return pk_min
-
-def validate():
-    cb = load_combined()
-    pk = load_packets()
-
-    # --- Step 1: find meter ID column ---
-    meter_id_col = None
-    for col in cb.columns:
-        if col.lower() in ("meter_id", "device_id", "building"):
-            meter_id_col = col
-            break
-
-    if not meter_id_col:
-        raise ValueError("❌ Could not find meter_id or device_id column in combined CSV")
-
-    if meter_id_col != "meter_id":
-        cb = cb.rename(columns={meter_id_col: "meter_id"})
-
-    # --- Step 2: check timestamp column ---
-    if "Date/Time" not in cb.columns:
-        raise ValueError("❌ 'Date/Time' column not found in combined CSV")
-
-    # --- 3) missing packet‑minute rows ---
-    merged = pk.merge(
-        cb,
-        on=["meter_id", "Date/Time"],
-        how="left",
-        indicator=True,
-        suffixes=("_pk", "_cb")
-    )
-    missing = merged[merged["_merge"] == "left_only"]
-    if not missing.empty:
-        print(f"\n❌ {len(missing)} packet‑minute rows missing from combined:")
-        pkt_col = "totalizer" if "totalizer" in missing.columns else "totalizer_pk"
-        cols = [c for c in ("meter_id", "Date/Time", pkt_col) if c in missing.columns]
-        print(missing[cols].head().to_string(index=False))
-    else:
-        print("\n✅ No missing packet‑minute rows.")
-
-    # --- 4) mismatched totalizer ---
-    merged2 = pk.merge(
-        cb,
-        on=["meter_id", "Date/Time"],
-        how="inner",
-        suffixes=("_pk", "_cb")
-    )
-
-    cb_col = "Totalizer (Liters)"
-    pk_col = "totalizer"
-    pk_col2 = pk_col + "_pk"
-    cb_col2 = cb_col + "_cb"
-
-    if pk_col in merged2.columns and cb_col in merged2.columns:
-        merged2 = merged2.rename(columns={pk_col: pk_col2, cb_col: cb_col2})
-    elif pk_col2 not in merged2.columns or cb_col2 not in merged2.columns:
-        raise RuntimeError(f"Expected '{pk_col2}' and '{cb_col2}' in merged data")
-
-    mismatches = merged2[merged2[pk_col2] != merged2[cb_col2]]
-    if not mismatches.empty:
-        print(f"\n❌ {len(mismatches)} mismatched totalizer values:")
-        print(
-            mismatches[["meter_id", "Date/Time", pk_col2, cb_col2]].head().to_string(index=False)
-        )
+        with open(STATE_PATH, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state):
+    with atomic_write(STATE_PATH) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def pending_files(state, recheck=False):
+    """Packet files that are new, changed since their last check, or not clean last time."""
+    out = []
+    for path in sorted(glob.glob(PACKET_GLOB)):
+        st = os.stat(path)
+        prev = state.get(os.path.basename(path))
+        if (recheck or prev is None or prev["size"] != st.st_size or prev["mtime"] != st.st_mtime
+                or prev["missing"] or prev["mismatched"]):
+            out.append(path)
+    return out
+
+
+def validate(cb=None, recheck=False):
+    """
+    Reconcile unverified packet files against the combined CSV (or an
+    already-loaded frame) plus the archive where the files reach back past it.
+    Returns totals over the files checked this run.
+    """
+    state = load_state()
+    files = pending_files(state, recheck)
+    summary = {"combined_rows": 0, "files": len(files), "packet_rows": 0, "missing": 0, "mismatched": 0}
+    if not files:
+        print(f"✅ All {len(state)} packet file(s) already verified." if state else "ℹ️ No packet files to validate.")
+        return summary
+
+    start, end = packet_span(files)
+    if cb is not None and start is not None and pd.to_datetime(cb["Date/Time"], errors="coerce").min() > start:
+        cb = None   # the hot frame alone does not reach back to the oldest packet
+    if cb is None:
+        print(f"🔍 Loading readings {start} – {end} from {COMBINED_CSV} and the archive")
+        cb = retention.query(start, end)
+    store = Store(cb)
+    summary["combined_rows"] = store.rows
+    print(f"   → {store.rows} rows indexed, {len(files)} packet file(s) to check")
+
+    for path in files:
+        name = os.path.basename(path)
+        result = check_file(store, path)
+        st = os.stat(path)
+        state[name] = {"size": st.st_size, "mtime": st.st_mtime, "readings": result["readings"],
+                       "missing": result["missing"], "mismatched": result["mismatched"],
+                       "checked_at": datetime.now().isoformat(timespec="seconds")}
+        for key in ("readings", "missing", "mismatched"):
+            summary["packet_rows" if key == "readings" else key] += result[key]
+
+        if not result["missing"] and not result["mismatched"]:
+            print(f"   ✅ {name}: {result['readings']} readings, all present and matching")
+            continue
+        print(f"   ❌ {name}: {result['readings']} readings, {result['missing']} missing, "
+              f"{result['mismatched']} mismatched")
+        if result["missing"]:
+            print(result["missing_rows"][["meter_id", "Date/Time", "totalizer"]].head(SHOW).to_string(index=False))
+        if result["mismatched"]:
+            print(result["mismatched_rows"][["meter_id", "Date/Time", "totalizer", "combined"]]
+                  .head(SHOW).to_string(index=False))
+    save_state(state)
+
+    if summary["missing"] or summary["mismatched"]:
+        print(f"\n❌ {summary['missing']} missing and {summary['mismatched']} mismatched packet reading(s); "
+              f"those files are checked again next run.")
     else:
-        print("\n✅ All totalizer values match.")
+        print(f"\n✅ {summary['packet_rows']} packet readings in {len(files)} file(s) all match the combined data.")
+    return summary
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile packet files against combined_water_data.csv.")
+    parser.add_argument("--recheck", action="store_true", help="check every packet file, not only unverified ones")
+    args = parser.parse_args()
 
-if __name__=="__main__":
-    validate()
+    with stage("validate_merge") as metrics:
+        summary = validate(recheck=args.recheck)
+        if summary["combined_rows"]:
+            metrics.read(COMBINED_CSV, rows=summary["combined_rows"])
+        metrics.read(PACKET_GLOB, rows=summary["packet_rows"])
+        metrics.rows_out = summary["missing"] + summary["mismatched"]
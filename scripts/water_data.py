@@ -0,0 +1,164 @@
+# water_data.py
+import os, tempfile
+from contextlib import contextmanager
+import pandas as pd
+import yaml
+
+# ——— CONFIGURATION ——————————————————————————————————————
+PROJECT_ROOT = os.path.abspath(os.environ.get("WMS_PROJECT_ROOT", os.path.join(os.path.dirname(__file__), "..")))
+COMBINED_PATH = os.path.join(PROJECT_ROOT, "data", "combined_water_data.csv")
+CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.yaml")
+# ————————————————————————————————————————————————————————
+
+
+def clean_combined(df):
+    """
+    The cleaning every stage used to repeat on its own: parse Date/Time,
+    drop unparseable rows, keep one reading per meter and time (the last, as
+    duplicate source exports carry some twice), order by meter then time,
+    clip negative consumption.
+    """
+    df = df.copy()
+    df["Date/Time"] = pd.to_datetime(df["Date/Time"], errors="coerce")
+    df = df.dropna(subset=["Date/Time"]).drop_duplicates(subset=["Building", "Date/Time"], keep="last")
+    df = df.sort_values(by=["Building", "Date/Time"], kind="mergesort").reset_index(drop=True)
+    df["Consumption (Liters)"] = df["Consumption (Liters)"].clip(lower=0).fillna(0)
+    return df
+
+
+def load_combined(path=COMBINED_PATH, metrics=None, start=None, end=None, buildings=None):
+    """
+    Read and clean combined_water_data.csv once; stages share the result.
+    start / end / buildings filter the readings; with the database enabled
+    (readings_db.py) and in sync, a load filtered by buildings is answered by
+    SQL. A date range alone still selects a large share of the readings, which
+    pandas parses from the CSV faster than sqlite3 fetches them.
+    """
+    if buildings is not None:
+        import readings_db
+
+        conn = readings_db.open_fresh("readings", path) if os.path.abspath(path) == COMBINED_PATH else None
+        if conn is not None:
+            try:
+                if metrics is None:
+                    return readings_db.query_readings(conn, start, end, buildings)
+                with metrics.step("read_sql"):
+                    df = readings_db.query_readings(conn, start, end, buildings)
+                metrics.read(readings_db.load_params()["path"], rows=len(df))
+                return df
+            finally:
+                conn.close()
+    if metrics is not None:
+        with metrics.step("read_csv"):
+            df = pd.read_csv(path, parse_dates=["Date/Time"])
+        metrics.read(path, rows=len(df))
+    else:
+        df = pd.read_csv(path, parse_dates=["Date/Time"])
+    df = clean_combined(df)
+    if start is not None:
+        df = df[df["Date/Time"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["Date/Time"] <= pd.Timestamp(end)]
+    if buildings is not None:
+        df = df[df["Building"].isin(list(buildings))]
+    return df.reset_index(drop=True)
+
+
+@contextmanager
+def atomic_write(path, mode="w", **kwargs):
+    """
+    Open a hidden temporary file next to `path`; once the block finishes it is
+    flushed to disk and renamed over `path`. Readers see the old file or the
+    new one, never a partial one, and a crash (or an exception) leaves the
+    old file untouched.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    # the rename itself is only durable once the directory entry is on disk
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def write_csv(df, path, **kwargs):
+    """DataFrame.to_csv through atomic_write (gzip when compression="gzip")."""
+    binary = kwargs.get("compression") not in (None, "infer")
+    with atomic_write(path, "wb" if binary else "w", **({} if binary else {"newline": ""})) as f:
+        df.to_csv(f, **kwargs)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on a hidden `.<name>.lock` file next to `path`, so writers of `path` take turns."""
+    import fcntl
+
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f".{os.path.basename(path)}.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_csv(df, path, columns):
+    """
+    Append rows to a CSV in place (same inode, so tailing readers only read
+    the new bytes). Returns False, writing nothing, when the file is missing,
+    has other columns or ends in a partial line; the caller then rewrites it.
+    A failed append is truncated back off. Hold file_lock(path) around it.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.readline().decode("utf-8").rstrip("\r\n")
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - 1, 0))
+            complete = f.read(1) == b"\n"
+    except (FileNotFoundError, UnicodeDecodeError):
+        return False
+    if header != ",".join(columns) or not complete:
+        return False
+    with open(path, "a", newline="") as f:
+        try:
+            df.to_csv(f, columns=columns, header=False, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(size)
+            raise
+    return True
+
+
+def version(path):
+    """
+    Identifier of the file's current version (None when missing). Every
+    atomic_write is a new inode and every append a new size and mtime, so
+    readers can cache on this instead of a TTL.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def load_config(path=CONFIG_PATH):
+    with open(path, "r") as f:
+        return yaml.safe_load(f) or {}